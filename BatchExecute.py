@@ -2,51 +2,250 @@ from query_evaluator import QueryEvaluator
 from graph_structure import GraphStructure
 from parser import *
 from linker import Linker
+from statement_cache import StatementCache
 
-class BatchExecute:   
+# Number of consecutive CREATE or CREATEEDGE commands executed together at
+# most, the checkpointer is polled between them.
+WRITE_BATCH_SIZE = 10000
+
+class BatchExecute:
+    """
+    This class is responsible for executing a batch of commands that are
+    in a txt file.
+
+    By default the batch is compiled: every command in the file is parsed
+    before any of them runs, so a file with an error in it changes nothing.
+    The commands are then run by a single L{Linker}, and consecutive
+    CREATE and CREATEEDGE commands are run together with the bulk methods
+    of the L{QueryEvaluator}. The nodes an edge connects are found through
+    the node index of the graph instead of a scan of all nodes.
+    Like in the interactive loop, the checkpointer is polled after every
+    command, or after every group of commands run together.
     """
-    This class is responsible for executing a batch of commands that are 
-    in a txt file. 
-    """   
 
-    def __init__(self, gs, filename):   
+    def __init__(self, gs, filename, checkpointer=None, compiled=True):
         """
-        Constructor takes a L{GraphStructure} object, a parser object, and  
-        a file name as arguments. It will execute all of the commands that are 
-        in the file. 
+        Constructor takes a L{GraphStructure} object, a parser object, and
+        a file name as arguments. It will execute all of the commands that are
+        in the file. If a L{Checkpointer} is given, it gets a chance to start
+        a background snapshot after every command.
         """
         self.gs = gs
+        self.checkpointer = checkpointer
+        # Node attributes indexed for the batch only, see find_nodes
+        self.batch_indexes = set()
+
+        if compiled:
+            commands = self.compile(filename)
+            if commands is not None:
+                self.execute(commands)
+        else:
+            self.run_lines(filename)
+
+    def read_commands(self, filename):
+        """
+        Reads the commands in the file, one command per line. Blank lines
+        and commented lines are skipped. Reading stops at the first line
+        that does not end with a semicolon, and format_error is set.
 
+        @type filename: String
+        @param filename: File containing the commands
+        @rtype: Generator
+        @return: Tuples of the line number and the command on the line,
+        formatted for the parser
+        """
+        self.format_error = False
         f = open(filename, 'r')
 
-        # Every line in the file is a command 
+        # Every line in the file is a command
+        line_number = 0
         for line in f:
+            line_number += 1
+            arr = line.split()
             # Skips blank lines and commented lines in text file
-            if (len(line.split()) == 0) or (line[0] == '#'):
+            if (len(arr) == 0) or (line[0] == '#'):
                 continue
 
-            # Assert that line ends with semicolon 
-            if line.split()[-1][-1] != ';':
+            # Assert that line ends with semicolon
+            if arr[-1][-1] != ';':
                 print "Invalid file format! Every line must end with a semicolon."
+                self.format_error = True
                 break
 
-            # Add a space before semicolon for parser. This ensures that 
-            # commands can end with a semicolon right after the last word 
-            # in the command.  
-            arr = line.split()
+            # Add a space before semicolon for parser. This ensures that
+            # commands can end with a semicolon right after the last word
+            # in the command.
             arr[-1] = arr[-1][:-1] + ' ;'
-            command = " ".join(arr) 
+            yield line_number, " ".join(arr)
+
+        f.close()
+
+    def run_lines(self, filename):
+        """
+        Parses and executes the commands in the file one line at a time.
 
-            # Run the parser. 
-            parser = Parser(command)
-            parser.run()
+        @type filename: String
+        @param filename: File containing the commands
+        """
+        statement_cache = StatementCache()
+        for line_number, command in self.read_commands(filename):
+            # Run the parser, unless the line repeats a statement.
+            objects = statement_cache.compile(command, False)
+            if objects is None:
+                continue
 
-            # Extract the created objects from the parser and execute the linker. 
-            linker = Linker(parser.get_object_list(), self.gs)
+            # Execute the objects created by the parser with the linker.
+            linker = Linker(objects, self.gs)
             linker.execute()
+            self.maybe_checkpoint()
 
-        f.close()
+    def maybe_checkpoint(self):
+        """
+        Gives the checkpointer, if there is one, a chance to start a
+        snapshot.
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.maybe_checkpoint()
+
+    def compile(self, filename):
+        """
+        Parses every command in the file. The commands are not checked
+        with L{Error_Checking}, like when they are executed one at a time.
 
+        @type filename: String
+        @param filename: File containing the commands
+        @rtype: List of L{Command_Struct} objects or None
+        @return: Commands in the file, or None if the file has errors
+        """
+        commands = []
+        # Lines that repeat a statement are only parsed once
+        statement_cache = StatementCache()
+        for line_number, command in self.read_commands(filename):
+            objects = statement_cache.compile(command, False)
+            if objects is None:
+                print "Error on line " + str(line_number) + \
+                    ", no commands were executed."
+                return None
+            commands.extend(objects)
+        if self.format_error:
+            print "No commands were executed."
+            return None
+        return commands
+
+    def execute(self, commands):
+        """
+        Executes compiled commands in order. Runs of consecutive CREATE or
+        CREATEEDGE commands are executed together, up to WRITE_BATCH_SIZE
+        commands at a time. The node attributes indexed for the batch are
+        dropped when it ends.
+
+        @type commands: List of L{Command_Struct} objects
+        @param commands: Commands to execute
+        """
+        linker = Linker([], self.gs)
+        self.linker = linker
+        self.query_evaluator = linker.query_evaluator
+        try:
+            self.execute_runs(commands)
+        finally:
+            for attr in self.batch_indexes:
+                self.gs.node_index.drop(attr)
+            self.batch_indexes = set()
+
+    def execute_runs(self, commands):
+        """
+        Executes compiled commands in order, see L{execute}.
+
+        @type commands: List of L{Command_Struct} objects
+        @param commands: Commands to execute
+        """
+        linker = self.linker
+        i = 0
+        while i < len(commands):
+            command_name = commands[i].get_command()
+            j = i + 1
+            if command_name in ("CREATE", "CREATEEDGE"):
+                end = min(len(commands), i + WRITE_BATCH_SIZE)
+                while j < end and commands[j].get_command() == command_name:
+                    j += 1
+            if command_name == "CREATE":
+                self.create_nodes(commands[i:j])
+            elif command_name == "CREATEEDGE":
+                self.create_edges(commands[i:j])
+            else:
+                if command_name in ("CREATEINDEX", "DROPINDEX"):
+                    # The command sees the indexes the batch started with
+                    for item in commands[i].get_attr_list():
+                        if item[0] == "n:" and item[1] in self.batch_indexes:
+                            self.gs.node_index.drop(item[1])
+                            self.batch_indexes.remove(item[1])
+                linker.execute_command(commands[i])
+            self.maybe_checkpoint()
+            i = j
+
+    def create_nodes(self, commands):
+        """
+        Executes CREATE commands by adding all of their nodes at once.
+
+        @type commands: List of L{Command_Struct} objects
+        @param commands: CREATE commands to execute
+        """
+        names = []
+        node_attrs_list = []
+        for obj in commands:
+            attribute_list = self.linker.TypedAttributes(obj)
+            if attribute_list is None:
+                continue
+            for node in attribute_list:
+                names.append(node[1])
+                node_attrs_list.append(dict(node[2]))
+        node_ids = self.query_evaluator.add_nodes(node_attrs_list)
+        for name, node_id, node_attrs in zip(names, node_ids,
+            node_attrs_list):
+            self.gs.set_identifier(name, (node_id, node_attrs))
+
+    def create_edges(self, commands):
+        """
+        Executes CREATEEDGE commands by adding all of their edges at once.
+        Like L{Linker.CreateEdge}, every node matching the first node
+        attributes is connected to every node matching the second ones.
 
+        @type commands: List of L{Command_Struct} objects
+        @param commands: CREATEEDGE commands to execute
+        """
+        edges = []
+        for obj in commands:
+            attribute_list = self.linker.TypedAttributes(obj)
+            if attribute_list is None:
+                continue
+            for k in range(0, len(attribute_list) - 2, 3):
+                nodes1 = self.find_nodes(attribute_list[k][2])
+                edge_attrs = attribute_list[k + 1][2]
+                nodes2 = self.find_nodes(attribute_list[k + 2][2])
+                for node1_id in nodes1:
+                    for node2_id in nodes2:
+                        edges.append((node1_id, node2_id, edge_attrs))
+        self.query_evaluator.add_relationships(edges)
 
+    def find_nodes(self, node_attrs):
+        """
+        Finds the ids of the nodes that have the attributes, like
+        L{QueryEvaluator.match_node}. The nodes are found through the node
+        index of the graph, and if none of the attributes is indexed they
+        are all indexed until the end of the batch, so the other edges
+        matching them do not scan every node again.
 
+        @type node_attrs: Dictionary
+        @param node_attrs: Node attributes to match
+        @rtype: List
+        @return: Ids of the matching nodes
+        """
+        node_index = self.gs.node_index
+        if node_attrs and node_index.lookup(node_attrs) is None:
+            for attr in node_attrs:
+                if node_index.create(attr):
+                    self.batch_indexes.add(attr)
+        node_ids = self.query_evaluator.candidate_nodes(node_attrs)
+        if node_ids is None:
+            return self.gs.get_graph().nodes()
+        return sorted(node_ids)
@@ -14,6 +14,7 @@ class Command_Struct:
         self.name = []
         self.attr = [] 
         self.bool = -1
+        self.limit = None
 
 ##
 ##  Methods for self.name
@@ -59,7 +60,7 @@ class Command_Struct:
         prevIden = ""
         for elem in self.name:
             # First check if and is supplied
-            if elem == "AND" or elem == "OR":
+            if elem in ("AND", "OR", "AND NOT", "OR NOT"):
                 # Append it to the previous list
                 newLst[i].append(elem)
             elif prevIden != elem[3]:
@@ -193,6 +194,33 @@ class Command_Struct:
 
         return self.bool
 
+##
+##  Methods for self.limit
+##
+
+    def set_limit(self, limit):
+        """
+        This method sets the maximum number of results of the command,
+        given by a LIMIT clause.
+
+        @type limit: Integer
+        @param limit: Maximum number of results
+        """
+
+        self.limit = limit
+
+
+    def get_limit(self):
+        """
+        This method returns the maximum number of results of the
+        command.
+
+        @rtype: Integer
+        @return: Maximum number of results (None if there is no limit)
+        """
+
+        return self.limit
+
 ##
 ##  Methods for self.command
 ##
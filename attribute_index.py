@@ -0,0 +1,249 @@
+import os
+from ordered_values import OrderedValues
+
+# Stands for an attribute that a node does not have
+MISSING = object()
+
+
+class AttributeIndex:
+    """
+    Secondary index from attribute values to the keys of the nodes or edges
+    that have them, for the attributes chosen with CREATEINDEX. While at
+    least one attribute is indexed, the index is registered as a listener
+    of the L{GraphStructure} and updated with every change made to the
+    graph, so matching by an indexed value only has to look at the items
+    having the value instead of scanning the whole graph.
+
+    The values of every indexed attribute are also kept in numeric order,
+    so the items whose value is in a range can be found by bisection, see
+    L{range}.
+
+    The names of the indexed attributes are kept in a small text file, one
+    per line, so the indexes are rebuilt when the database is started.
+
+    Subclasses pass in which items are indexed and listen to the changes
+    of these items, see L{NodeIndex} and L{EdgeIndex}.
+    """
+
+    def __init__(self, gs, graph_items):
+        """
+        Creates an index without any indexed attributes.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph whose items are indexed
+        @type graph_items: Function
+        @param graph_items: Function returning the indexed items of a
+        graph, as tuples of the format (key, attributes)
+        """
+        self.gs = gs
+        self.graph_items = graph_items
+        # Sets of item keys by attribute name and value
+        self.indexes = {}
+        # Values of the attributes in numeric order by attribute name
+        self.ordered = {}
+        self.index_file = None
+
+    def load(self, index_file):
+        """
+        Indexes the attributes listed in the file, and keeps the file up to
+        date with later changes to the indexed attributes.
+
+        @type index_file: String
+        @param index_file: File listing the indexed attributes
+        """
+        self.index_file = index_file
+        if os.path.isfile(index_file):
+            f = open(index_file, 'r')
+            for line in f:
+                if line.strip():
+                    self.create(line.rstrip('\n'))
+            f.close()
+
+    def save(self):
+        """
+        Writes the names of the indexed attributes to the index file.
+        """
+        if self.index_file is None:
+            return
+        f = open(self.index_file + '.tmp', 'w')
+        for attr in sorted(self.indexes):
+            f.write(attr + '\n')
+        f.close()
+        os.rename(self.index_file + '.tmp', self.index_file)
+
+    def items(self):
+        """
+        Returns the indexed items of the graph.
+
+        @rtype: Iterable of tuples
+        @return: Tuples of the format (key, attributes)
+        """
+        return self.graph_items(self.gs.get_graph())
+
+    def create(self, attr):
+        """
+        Indexes an attribute of the items already in the graph and of the
+        items added later.
+
+        @type attr: String
+        @param attr: Name of the attribute to index
+        @rtype: Boolean
+        @return: True if the attribute was not indexed before
+        """
+        if attr in self.indexes:
+            return False
+        if not self.indexes:
+            self.gs.add_listener(self)
+        self.indexes[attr] = {}
+        self.ordered[attr] = OrderedValues()
+        for key, attrs in self.items():
+            if attr in attrs:
+                self.add(attr, attrs[attr], key)
+        self.ordered[attr].sort()
+        self.save()
+        return True
+
+    def drop(self, attr):
+        """
+        Stops indexing an attribute.
+
+        @type attr: String
+        @param attr: Name of the indexed attribute
+        @rtype: Boolean
+        @return: True if the attribute was indexed
+        """
+        if attr not in self.indexes:
+            return False
+        del self.indexes[attr]
+        del self.ordered[attr]
+        if not self.indexes:
+            self.gs.remove_listener(self)
+        self.save()
+        return True
+
+    def lookup(self, attrs):
+        """
+        Finds the items that may have the attributes. The items having the
+        rarest of the indexed attribute values are returned, so the caller
+        still has to check the other attributes.
+
+        @type attrs: Dictionary
+        @param attrs: Attributes to match
+        @rtype: Set or None
+        @return: Keys of the candidate items, or None if none of the
+        attributes are indexed
+        """
+        candidates = None
+        for attr, value in attrs.iteritems():
+            if attr in self.indexes:
+                try:
+                    keys = self.indexes[attr].get(value, ())
+                except TypeError:
+                    continue
+                if candidates is None or len(keys) < len(candidates):
+                    candidates = keys
+        return candidates
+
+    def range(self, attr, op, number):
+        """
+        Finds the items whose value of an attribute compares to a number
+        like the operation says, comparing the values as numbers like
+        L{Predicates.filter}.
+
+        @type attr: String
+        @param attr: Name of the indexed attribute
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type number: Float
+        @param number: Number to compare the values against
+        @rtype: Set
+        @return: Keys of the items satisfying the comparison
+        """
+        values = self.indexes[attr]
+        keys = set()
+        for value in self.ordered[attr].find(op, number):
+            keys.update(values[value])
+        return keys
+
+    def non_numeric(self, attr):
+        """
+        Finds the items whose value of an attribute is not a number.
+
+        @type attr: String
+        @param attr: Name of the indexed attribute
+        @rtype: Set
+        @return: Keys of the items
+        """
+        values = self.indexes[attr]
+        keys = set()
+        for value in self.ordered[attr].others:
+            keys.update(values[value])
+        return keys
+
+    def add(self, attr, value, key):
+        """
+        Adds an item to the index of an attribute under the given value.
+        Values that cannot be hashed are not indexed.
+        """
+        values = self.indexes[attr]
+        try:
+            keys = values.get(value)
+        except TypeError:
+            return
+        if keys is None:
+            values[value] = set([key])
+            self.ordered[attr].add(value)
+        else:
+            keys.add(key)
+
+    def remove(self, attr, value, key):
+        """
+        Removes an item from the index of an attribute.
+        """
+        values = self.indexes[attr]
+        try:
+            keys = values.get(value)
+        except TypeError:
+            return
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del values[value]
+                self.ordered[attr].remove(value)
+
+    def item_added(self, key, attrs):
+        """
+        Indexes the attributes of a new item.
+        """
+        for attr in self.indexes:
+            if attr in attrs:
+                self.add(attr, attrs[attr], key)
+
+    def item_changed(self, key, old_attrs, attrs):
+        """
+        Moves an item to the new values of its changed attributes.
+        """
+        for attr in self.indexes:
+            old_value = old_attrs.get(attr, MISSING)
+            value = attrs.get(attr, MISSING)
+            if old_value is value or old_value == value:
+                continue
+            if old_value is not MISSING:
+                self.remove(attr, old_value, key)
+            if value is not MISSING:
+                self.add(attr, value, key)
+
+    def item_removed(self, key, attrs):
+        """
+        Removes an item from the index of every attribute.
+        """
+        for attr in self.indexes:
+            if attr in attrs:
+                self.remove(attr, attrs[attr], key)
+
+    # Listener methods called by the GraphStructure
+
+    def graph_cleared(self):
+        for attr in self.indexes:
+            self.indexes[attr] = {}
+            self.ordered[attr] = OrderedValues()
@@ -0,0 +1,151 @@
+from binascii import hexlify, unhexlify
+
+# Number of bits of a chunk of a bitmap, as a power of two
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+# Chunks with fewer ids than this are built bit by bit instead of through
+# a byte array
+SPARSE_CHUNK = 64
+# Offsets of the set bits of every byte value
+BYTE_BITS = [[bit for bit in range(8) if value >> bit & 1]
+    for value in range(256)]
+
+
+def to_chunk(offsets):
+    """
+    Sets bits of a chunk.
+
+    @type offsets: List of Integers
+    @param offsets: Offsets of the bits in the chunk
+    @rtype: Long
+    @return: The chunk
+    """
+    if len(offsets) < SPARSE_CHUNK:
+        chunk = 0
+        for offset in offsets:
+            chunk |= 1 << offset
+        return chunk
+    data = bytearray(CHUNK_SIZE >> 3)
+    for offset in offsets:
+        data[offset >> 3] |= 1 << (offset & 7)
+    data.reverse()
+    return long(hexlify(data), 16)
+
+
+def from_chunk(chunk):
+    """
+    Finds the set bits of a chunk.
+
+    @type chunk: Long
+    @param chunk: The chunk
+    @rtype: List of Integers
+    @return: Offsets of the set bits in increasing order
+    """
+    digits = '%x' % chunk
+    if len(digits) & 1:
+        digits = '0' + digits
+    data = bytearray(unhexlify(digits))
+    data.reverse()
+    offsets = []
+    for position, value in enumerate(data):
+        if value:
+            base = position << 3
+            for bit in BYTE_BITS[value]:
+                offsets.append(base + bit)
+    return offsets
+
+
+def id_range(start, stop):
+    """
+    Creates the bitmap of a range of ids.
+
+    @type start: Integer
+    @param start: First id of the range
+    @type stop: Integer
+    @param stop: Id after the last id of the range
+    @rtype: L{Bitmap}
+    @return: Bitmap of the ids
+    """
+    bitmap = Bitmap()
+    for key in range(start >> CHUNK_BITS, (stop + CHUNK_MASK) >> CHUNK_BITS):
+        low = max(start - (key << CHUNK_BITS), 0)
+        high = min(stop - (key << CHUNK_BITS), CHUNK_SIZE)
+        if low < high:
+            bitmap.chunks[key] = ((1 << high) - 1) ^ ((1 << low) - 1)
+    return bitmap
+
+
+class Bitmap:
+    """
+    Set of ids, such as node ids, stored as a bitmap. The bitmap is split
+    in chunks of CHUNK_SIZE consecutive ids, each stored as a long whose
+    set bits are the ids in the chunk, and chunks without any ids are left
+    out, so sparse sets of dense ids stay small.
+
+    Intersections, unions and differences of bitmaps combine whole chunks
+    at once, a machine word of ids at a time, instead of looking up every
+    id. The ids of a bitmap are iterated in increasing order.
+    """
+
+    def __init__(self, ids=()):
+        """
+        Creates the bitmap of a set of ids.
+
+        @type ids: Iterable of Integers
+        @param ids: Non-negative ids
+        """
+        offsets = {}
+        for node_id in ids:
+            key = node_id >> CHUNK_BITS
+            if key in offsets:
+                offsets[key].append(node_id & CHUNK_MASK)
+            else:
+                offsets[key] = [node_id & CHUNK_MASK]
+        # Chunks by the ids they start at divided by CHUNK_SIZE
+        self.chunks = dict((key, to_chunk(chunk_offsets))
+            for key, chunk_offsets in offsets.iteritems())
+
+    def __and__(self, other):
+        bitmap = Bitmap()
+        chunks = other.chunks
+        for key, chunk in self.chunks.iteritems():
+            if key in chunks:
+                chunk &= chunks[key]
+                if chunk:
+                    bitmap.chunks[key] = chunk
+        return bitmap
+
+    def __or__(self, other):
+        bitmap = Bitmap()
+        bitmap.chunks = dict(self.chunks)
+        chunks = bitmap.chunks
+        for key, chunk in other.chunks.iteritems():
+            chunks[key] = chunks.get(key, 0) | chunk
+        return bitmap
+
+    def __sub__(self, other):
+        bitmap = Bitmap()
+        chunks = other.chunks
+        for key, chunk in self.chunks.iteritems():
+            if key in chunks:
+                chunk &= ~chunks[key]
+            if chunk:
+                bitmap.chunks[key] = chunk
+        return bitmap
+
+    def __contains__(self, node_id):
+        chunk = self.chunks.get(node_id >> CHUNK_BITS)
+        return chunk is not None and bool(chunk >> (node_id & CHUNK_MASK) & 1)
+
+    def __len__(self):
+        return sum(bin(chunk).count('1') for chunk in self.chunks.itervalues())
+
+    def __nonzero__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            base = key << CHUNK_BITS
+            for offset in from_chunk(self.chunks[key]):
+                yield base + offset
@@ -0,0 +1,113 @@
+import os
+import time
+
+# Default number of seconds between background snapshots.
+CHECKPOINT_INTERVAL = 300
+
+# Default size of the write-ahead log, in bytes, that triggers a snapshot
+# before the interval is over.
+CHECKPOINT_WAL_SIZE = 16 * 1024 * 1024
+
+
+class Checkpointer:
+    """
+    Periodically folds the L{WriteAheadLog} into a new snapshot without
+    blocking the database. A snapshot is started when the configured
+    interval has passed or when the log has grown past the configured
+    size. The snapshot is written by a forked child process, which works on
+    a copy-on-write image of the graph as it was at the moment of the fork,
+    so commands keep being served at full speed while it is written.
+    L{maybe_checkpoint} should be called between commands.
+    """
+
+    def __init__(self, gstorage, wal, graph_file, id_file,
+        interval=CHECKPOINT_INTERVAL, wal_size=CHECKPOINT_WAL_SIZE):
+        """
+        Takes the storage and log of the database and the files the
+        snapshot is written to.
+
+        @type gstorage: L{GraphStorage}
+        @param gstorage: Storage used to write the snapshot
+        @type wal: L{WriteAheadLog}
+        @param wal: Log folded into the snapshot
+        @type graph_file: String
+        @param graph_file: File to store the in-memory graph structure
+        @type id_file: String
+        @param id_file: File to store unique id number
+        @type interval: Number
+        @param interval: Seconds between snapshots, or None to only take
+        snapshots when the log grows too large
+        @type wal_size: Integer
+        @param wal_size: Size of the log in bytes that triggers a snapshot,
+        or None to only take snapshots after the interval
+        """
+        self.gstorage = gstorage
+        self.wal = wal
+        self.graph_file = graph_file
+        self.id_file = id_file
+        self.interval = interval
+        self.wal_size = wal_size
+        self.last_checkpoint = time.time()
+        # Process id of the child writing a snapshot, if any
+        self.pid = None
+
+    def maybe_checkpoint(self):
+        """
+        Collects a finished snapshot and starts a new one if the interval
+        has passed or the log is too large.
+        """
+        self.poll()
+        if self.pid is not None:
+            return
+        size = self.wal.size()
+        if size == 0:
+            return
+        due = (self.interval is not None and
+            time.time() - self.last_checkpoint >= self.interval)
+        full = self.wal_size is not None and size >= self.wal_size
+        if due or full:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Starts writing a snapshot in the background. If the platform cannot
+        fork, the snapshot is written before returning.
+        """
+        self.last_checkpoint = time.time()
+        if not hasattr(os, 'fork'):
+            self.gstorage.write_graph(self.graph_file, self.id_file)
+            self.wal.truncate()
+            return
+        # Records logged from now on are not part of the snapshot
+        self.wal.rotate()
+        self.pid = self.gstorage.fork_write(self.graph_file, self.id_file)
+
+    def poll(self, block=False):
+        """
+        Checks whether the child writing a snapshot has exited and, if so,
+        discards the log records that are now part of the snapshot.
+
+        @type block: Boolean
+        @param block: If true, waits for the child to exit
+        @rtype: Boolean
+        @return: True if no snapshot is being written anymore
+        """
+        if self.pid is None:
+            return True
+        pid, status = os.waitpid(self.pid, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return False
+        success = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        self.gstorage.finish_write(self.graph_file, success)
+        if success:
+            self.wal.discard_old()
+        else:
+            print "Background snapshot failed, changes remain in the log."
+        self.pid = None
+        return True
+
+    def wait(self):
+        """
+        Waits for a snapshot being written in the background to finish.
+        """
+        self.poll(True)
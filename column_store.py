@@ -0,0 +1,252 @@
+from binascii import hexlify
+from ordered_values import to_number
+from bitmap import Bitmap, CHUNK_BITS, CHUNK_SIZE
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# States of the value of an attribute of a node
+MISSING = 0
+NUMBER = 1
+OTHER = 2
+
+# Columns are only made for predicates that scan at least 1/BUILD_FRACTION
+# of the nodes, since making one looks at every node once
+BUILD_FRACTION = 4
+# Number of nodes a column compares in the time an index finds one node
+SCAN_SPEEDUP = 64
+INITIAL_CAPACITY = 1024
+
+
+def mask_bitmap(mask):
+    """
+    Creates the bitmap of the set entries of a mask.
+
+    @type mask: NumPy array of booleans
+    @param mask: Entries set for the ids in the bitmap
+    @rtype: L{Bitmap}
+    @return: Bitmap of the ids
+    """
+    bitmap = Bitmap()
+    keys = numpy.flatnonzero(numpy.bitwise_or.reduceat(mask,
+        numpy.arange(0, len(mask), CHUNK_SIZE)))
+    # The keys are made Python integers, so the ids of the bitmap are too
+    for key in keys.tolist():
+        chunk = mask[key << CHUNK_BITS:(key + 1) << CHUNK_BITS]
+        # The last id comes first, so it ends up in the highest bit
+        data = numpy.packbits(chunk[::-1]).tostring()
+        shift = (-len(chunk)) % 8
+        bitmap.chunks[key] = long(hexlify(data), 16) >> shift
+    return bitmap
+
+
+class ColumnStore:
+    """
+    Numeric node attributes kept in NumPy arrays indexed by node id, so a
+    predicate can compare the values of all the nodes at once instead of
+    converting the value of every node to a number, see L{Predicates}.
+
+    Every column has an array of the values as floats and an array of the
+    state of every node: whether it has a number, some other value, or no
+    value for the attribute. A column is made the first time a predicate
+    scans many nodes for its attribute. Once there is a column, the store
+    is registered as a listener of the L{GraphStructure} and updated with
+    every change made to the nodes.
+
+    Without NumPy there are no columns and predicates scan the nodes.
+    """
+
+    def __init__(self, gs):
+        """
+        Creates a store without any columns.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph whose node attributes are stored
+        """
+        self.gs = gs
+        # Values and states of the nodes by attribute name
+        self.values = {}
+        self.states = {}
+        self.capacity = INITIAL_CAPACITY
+
+    def has(self, attr):
+        """
+        @type attr: String
+        @param attr: Name of a node attribute
+        @rtype: Boolean
+        @return: True if the attribute has a column
+        """
+        return attr in self.states
+
+    def get(self, attr, rows):
+        """
+        Makes sure an attribute has a column if NumPy is available and a
+        predicate scanning the attribute looks at many nodes.
+
+        @type attr: String
+        @param attr: Name of a node attribute
+        @type rows: Integer
+        @param rows: Number of nodes the predicate looks at
+        @rtype: Boolean
+        @return: True if the attribute has a column
+        """
+        if numpy is None:
+            return False
+        if attr not in self.states and \
+            rows * BUILD_FRACTION >= self.gs.statistics.nodes:
+            self.create(attr)
+        return attr in self.states
+
+    def create(self, attr):
+        """
+        Makes the column of an attribute from the values of every node.
+
+        @type attr: String
+        @param attr: Name of a node attribute
+        """
+        node_ids = []
+        numbers = []
+        others = []
+        for node_id, attrs in self.gs.get_graph().node.iteritems():
+            if attr in attrs:
+                number = to_number(attrs[attr])
+                if number is None:
+                    others.append(node_id)
+                else:
+                    node_ids.append(node_id)
+                    numbers.append(number)
+        top = max(node_ids + others + [self.gs.get_id()])
+        if self not in self.gs.listeners:
+            self.gs.add_listener(self)
+        self.grow(top)
+        values = numpy.zeros(self.capacity)
+        states = numpy.zeros(self.capacity, numpy.int8)
+        values[node_ids] = numbers
+        states[node_ids] = NUMBER
+        states[others] = OTHER
+        self.values[attr] = values
+        self.states[attr] = states
+
+    def grow(self, node_id):
+        """
+        Makes the columns long enough to hold a node id.
+
+        @type node_id: Integer
+        @param node_id: Node id
+        """
+        if node_id < self.capacity:
+            return
+        while self.capacity <= node_id:
+            self.capacity *= 2
+        for columns in (self.values, self.states):
+            for attr, column in columns.items():
+                grown = numpy.zeros(self.capacity, column.dtype)
+                grown[:len(column)] = column
+                columns[attr] = grown
+
+    def set(self, node_id, attr, value):
+        """
+        Stores the value of an attribute of a node in its column.
+
+        @type node_id: Integer
+        @param node_id: Node id
+        @type attr: String
+        @param attr: Name of the attribute, which has a column
+        @type value: Anything
+        @param value: Value of the attribute, or MISSING if the node does
+        not have the attribute
+        """
+        if value is MISSING:
+            self.states[attr][node_id] = MISSING
+            return
+        number = to_number(value)
+        if number is None:
+            self.states[attr][node_id] = OTHER
+        else:
+            self.values[attr][node_id] = number
+            self.states[attr][node_id] = NUMBER
+
+    def compare(self, values, states, op, number):
+        """
+        Compares values of a column with a number like L{Predicates.filter}.
+
+        @type values: NumPy array of floats
+        @param values: Values of the nodes
+        @type states: NumPy array of integers
+        @param states: States of the values of the nodes
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type number: Float
+        @param number: Number to compare the values against
+        @rtype: NumPy array of booleans
+        @return: Entries set for the nodes satisfying the comparison
+        """
+        if op == "<":
+            mask = values < number
+        elif op == ">":
+            mask = values > number
+        else:
+            mask = values == number
+        return mask & (states == NUMBER)
+
+    def filter(self, attr, op, number, node_ids):
+        """
+        Compares the values of an attribute of some nodes with a number.
+
+        @type attr: String
+        @param attr: Name of the attribute, which has a column
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type number: Float
+        @param number: Number to compare the values against
+        @type node_ids: List of Integers
+        @param node_ids: Ids of the nodes to compare
+        @rtype: Tuple
+        @return: Positions in node_ids of the nodes satisfying the
+        comparison, and the number of the nodes whose value is not a number
+        """
+        node_ids = numpy.array(node_ids, numpy.int64)
+        states = self.states[attr][node_ids]
+        mask = self.compare(self.values[attr][node_ids], states, op, number)
+        return numpy.flatnonzero(mask).tolist(), \
+            int(numpy.count_nonzero(states == OTHER))
+
+    def find(self, attr, op, number):
+        """
+        Compares the values of an attribute of every node with a number.
+
+        @type attr: String
+        @param attr: Name of the attribute, which has a column
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type number: Float
+        @param number: Number to compare the values against
+        @rtype: Tuple
+        @return: L{Bitmap}s of the ids of the nodes satisfying the
+        comparison and of the nodes whose value is not a number
+        """
+        states = self.states[attr]
+        mask = self.compare(self.values[attr], states, op, number)
+        return mask_bitmap(mask), mask_bitmap(states == OTHER)
+
+    # Listener methods called by the GraphStructure
+
+    def node_added(self, node_id, attrs):
+        self.grow(node_id)
+        for attr in self.states:
+            self.set(node_id, attr, attrs.get(attr, MISSING))
+
+    def node_changed(self, node_id, old_attrs, attrs):
+        for attr in self.states:
+            value = attrs.get(attr, MISSING)
+            if value != old_attrs.get(attr, MISSING):
+                self.set(node_id, attr, value)
+
+    def node_removed(self, node_id, attrs, edges):
+        for attr in self.states:
+            self.set(node_id, attr, MISSING)
+
+    def graph_cleared(self):
+        for states in self.states.itervalues():
+            states[:] = MISSING
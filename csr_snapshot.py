@@ -0,0 +1,332 @@
+import mmap
+import bisect
+from struct import pack, unpack_from
+from cStringIO import StringIO
+import networkx as nx
+from fileIO import *
+
+# First bytes of every snapshot file, used to tell snapshots apart from the
+# older pickled graph files.
+MAGIC = 'MDBCSR1\n'
+
+# Magic string followed by the node count, out edge count, in edge count
+# and next unique id.
+HEADER_FORMAT = '8sqqqq'
+HEADER_SIZE = 40
+
+# Encoded form of an empty attribute dictionary, which most edges have.
+EMPTY_ATTRS = pack('I', 0)
+
+
+class CSRSnapshot:
+    """
+    Read-only view of a graph snapshot stored in compressed sparse row
+    (CSR) format. The file holds a sorted array of node ids, offset and
+    target arrays for the out-adjacency and the in-adjacency of every node,
+    and a separate section with the encoded node and edge attributes.
+    The file is memory-mapped, so opening a snapshot is cheap and the
+    adjacency of single nodes can be read without decoding the rest of
+    the graph.
+
+    File layout (all values in native byte order)::
+        header            magic, node count N, out edge count E,
+                          in edge count I, next id
+        node ids          N ints, sorted
+        out offsets       N + 1 ints into the out targets
+        out targets       E ints, ids of the edge targets
+        in offsets        N + 1 ints into the in sources
+        in sources        I ints, ids of the edge sources
+        node attr offsets N + 1 unsigned ints into the attribute section
+        edge attr offsets E + 1 unsigned ints, edges in out target order
+        attributes        encoded attribute dictionaries
+
+    When only some nodes of a graph are written, E and I differ, since
+    the other end of an edge does not have to be part of the snapshot.
+    """
+
+    def __init__(self, filename):
+        """
+        Memory-maps the snapshot stored in the file and reads its arrays.
+
+        @type filename: String
+        @param filename: File containing the snapshot
+        """
+        self.f = open(filename, 'rb')
+        self.buf = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, e, in_e, self.next_id = unpack_from(HEADER_FORMAT, 
+            self.buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(filename + ' is not a snapshot file')
+        self.num_nodes = n
+        self.num_edges = e
+
+        offset = HEADER_SIZE
+        self.node_ids, offset = read_array(self.buf, 'i', offset, n)
+        self.out_offsets, offset = read_array(self.buf, 'i', offset, n + 1)
+        self.out_targets, offset = read_array(self.buf, 'i', offset, e)
+        self.in_offsets, offset = read_array(self.buf, 'i', offset, n + 1)
+        self.in_sources, offset = read_array(self.buf, 'i', offset, in_e)
+        self.node_attr_offsets, offset = read_array(self.buf, 'I', offset,
+            n + 1)
+        self.edge_attr_offsets, offset = read_array(self.buf, 'I', offset,
+            e + 1)
+        self.attr_start = offset
+
+    @staticmethod
+    def is_snapshot(filename):
+        """
+        Returns true if the file starts with the snapshot magic string.
+
+        @type filename: String
+        @param filename: File to check
+        @rtype: Boolean
+        @return: True if the file is a snapshot, false otherwise
+        """
+        f = open(filename, 'rb')
+        magic = f.read(len(MAGIC))
+        f.close()
+        return magic == MAGIC
+
+    @staticmethod
+    def write(filename, graph, next_id, node_ids=None):
+        """
+        Writes the graph, or the given nodes of the graph, to the file in
+        snapshot format. Every written node is stored with all of its out
+        and in edges.
+
+        @type filename: String
+        @param filename: File to write the snapshot to
+        @type graph: Graph
+        @param graph: Graph whose nodes and edges are written
+        @type next_id: Integer
+        @param next_id: Unique id counter stored with the snapshot
+        @type node_ids: List
+        @param node_ids: Ids of the nodes to write, defaults to every node
+        """
+        if node_ids is None:
+            node_ids = graph.nodes()
+        node_ids = sorted(node_ids)
+        out_offsets = [0]
+        out_targets = []
+        in_offsets = [0]
+        in_sources = []
+        node_attr_offsets = []
+        edge_attr_offsets = []
+        attrs = StringIO()
+
+        for node_id in node_ids:
+            node_attr_offsets.append(attrs.tell())
+            write_attrs(attrs, graph.node[node_id])
+        node_attr_offsets.append(attrs.tell())
+
+        # Most edges have no attributes, so the position in the attribute
+        # section is tracked here instead of asking the buffer every time
+        position = attrs.tell()
+        empty_size = len(EMPTY_ATTRS)
+        for node_id in node_ids:
+            out = graph.succ[node_id]
+            targets = sorted(out)
+            out_targets.extend(targets)
+            for target in targets:
+                edge_attrs = out[target]
+                edge_attr_offsets.append(position)
+                if edge_attrs:
+                    write_attrs(attrs, edge_attrs)
+                    position = attrs.tell()
+                else:
+                    attrs.write(EMPTY_ATTRS)
+                    position += empty_size
+            out_offsets.append(len(out_targets))
+            in_sources.extend(sorted(graph.pred[node_id]))
+            in_offsets.append(len(in_sources))
+        edge_attr_offsets.append(position)
+
+        f = open(filename, 'wb')
+        f.write(pack(HEADER_FORMAT, MAGIC, len(node_ids), len(out_targets),
+            len(in_sources), next_id))
+        write_array(f, 'i', node_ids)
+        write_array(f, 'i', out_offsets)
+        write_array(f, 'i', out_targets)
+        write_array(f, 'i', in_offsets)
+        write_array(f, 'i', in_sources)
+        write_array(f, 'I', node_attr_offsets)
+        write_array(f, 'I', edge_attr_offsets)
+        f.write(attrs.getvalue())
+        f.close()
+
+    def close(self):
+        """
+        Unmaps and closes the snapshot file.
+        """
+        self.buf.close()
+        self.f.close()
+
+    def get_next_id(self):
+        """
+        Returns the unique id counter stored with the snapshot.
+
+        @rtype: Integer
+        @return: Next unique id when the snapshot was written
+        """
+        return self.next_id
+
+    def index(self, node_id):
+        """
+        Returns the position of the node in the node id array, or -1 if the
+        node is not part of the snapshot.
+
+        @type node_id: Integer
+        @param node_id: Id of the node to look up
+        @rtype: Integer
+        @return: Position of the node, or -1 if it does not exist
+        """
+        i = bisect.bisect_left(self.node_ids, node_id)
+        if i < self.num_nodes and self.node_ids[i] == node_id:
+            return i
+        return -1
+
+    def node_attrs(self, i):
+        """
+        Decodes the attributes of the node at position i.
+
+        @type i: Integer
+        @param i: Position of the node in the node id array
+        @rtype: Dictionary
+        @return: Attributes of the node
+        """
+        return read_attrs(self.buf,
+            self.attr_start + self.node_attr_offsets[i])[0]
+
+    def edge_attrs(self, k):
+        """
+        Decodes the attributes of the k-th edge in out target order.
+
+        @type k: Integer
+        @param k: Position of the edge in the out target array
+        @rtype: Dictionary
+        @return: Attributes of the edge
+        """
+        start = self.attr_start + self.edge_attr_offsets[k]
+        if self.buf[start:start + 4] == EMPTY_ATTRS:
+            return {}
+        return read_attrs(self.buf, start)[0]
+
+    def successors(self, node_id):
+        """
+        Returns the ids of the targets of the out edges of a node.
+
+        @type node_id: Integer
+        @param node_id: Id of the node
+        @rtype: List
+        @return: Ids of the successors of the node
+        """
+        i = self.index(node_id)
+        if i < 0:
+            return []
+        return self.out_targets[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def predecessors(self, node_id):
+        """
+        Returns the ids of the sources of the in edges of a node.
+
+        @type node_id: Integer
+        @param node_id: Id of the node
+        @rtype: List
+        @return: Ids of the predecessors of the node
+        """
+        i = self.index(node_id)
+        if i < 0:
+            return []
+        return self.in_sources[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def to_graph(self):
+        """
+        Builds a networkx graph holding every node and edge of the
+        snapshot.
+
+        @rtype: Graph
+        @return: Directed graph with the nodes and edges of the snapshot
+        """
+        g = nx.DiGraph()
+        self.load_into(g)
+        return g
+
+    def load_into(self, g):
+        """
+        Adds the nodes of the snapshot and their out edges to the graph.
+        Edge targets do not have to be part of this snapshot, so a graph
+        can be assembled from several snapshots that each hold a range of
+        the nodes.
+
+        @type g: Graph
+        @param g: Directed graph to add the nodes and edges to
+        """
+        CSRSnapshot.add_to_graph(g, self.decode())
+
+    def decode(self):
+        """
+        Decodes the nodes of the snapshot and their out edges into plain
+        lists and arrays that can be passed between processes and added to
+        a graph with L{add_to_graph}.
+
+        @rtype: Tuple
+        @return: Node ids, node attributes, out offsets, out targets and
+        edge attributes in out target order
+        """
+        node_attrs = [self.node_attrs(i) for i in xrange(self.num_nodes)]
+
+        # An edge without attributes takes exactly as many bytes as
+        # EMPTY_ATTRS, so those edges are found without touching the
+        # attribute section.
+        attr_offsets = self.edge_attr_offsets
+        empty_size = len(EMPTY_ATTRS)
+        buf = self.buf
+        attr_start = self.attr_start
+        edge_attrs = [None] * self.num_edges
+        for k in xrange(self.num_edges):
+            if attr_offsets[k + 1] - attr_offsets[k] != empty_size:
+                edge_attrs[k] = read_attrs(buf, attr_start + attr_offsets[k])[0]
+        return (self.node_ids, node_attrs, self.out_offsets, self.out_targets,
+            edge_attrs)
+
+    @staticmethod
+    def add_to_graph(g, decoded):
+        """
+        Adds nodes and edges decoded by L{decode} to the graph. The
+        adjacency dictionaries are filled in directly, which is much faster
+        than adding the edges one by one.
+
+        @type g: Graph
+        @param g: Directed graph to add the nodes and edges to
+        @type decoded: Tuple
+        @param decoded: Nodes and edges returned by L{decode}
+        """
+        node_ids, node_attrs, out_offsets, out_targets, edge_attrs = decoded
+        node = g.node
+        succ = g.succ
+        pred = g.pred
+        for i in xrange(len(node_ids)):
+            node_id = node_ids[i]
+            node[node_id] = node_attrs[i]
+            if node_id not in succ:
+                succ[node_id] = {}
+                pred[node_id] = {}
+
+        # Edges without attributes are decoded as None
+        k = 0
+        for i in xrange(len(node_ids)):
+            node_id = node_ids[i]
+            out = succ[node_id]
+            end = out_offsets[i + 1]
+            while k < end:
+                target = out_targets[k]
+                attrs = edge_attrs[k]
+                if attrs is None:
+                    attrs = {}
+                out[target] = attrs
+                if target not in pred:
+                    succ[target] = {}
+                    pred[target] = {}
+                pred[target][node_id] = attrs
+                k += 1
@@ -0,0 +1,45 @@
+from attribute_index import AttributeIndex
+
+
+def graph_edges(g):
+    """
+    @type g: Graph
+    @param g: Directed graph
+    @rtype: Generator
+    @return: Tuples of the (node1_id, node2_id) key of an edge and its
+    attributes
+    """
+    for node1_id, node2_id, attrs in g.edges_iter(data=True):
+        yield (node1_id, node2_id), attrs
+
+
+class EdgeIndex(AttributeIndex):
+    """
+    Index from edge attribute values to the edges that have them, used by
+    L{QueryEvaluator.match_rel}. Edges are identified by a tuple of the
+    format (node1_id, node2_id).
+    """
+
+    def __init__(self, gs):
+        """
+        Creates an index without any indexed edge attributes.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph whose edges are indexed
+        """
+        AttributeIndex.__init__(self, gs, graph_edges)
+
+    # Listener methods called by the GraphStructure
+
+    def node_removed(self, node_id, attrs, edges):
+        for node1_id, node2_id, edge_attrs in edges:
+            self.item_removed((node1_id, node2_id), edge_attrs)
+
+    def edge_added(self, node1_id, node2_id, attrs):
+        self.item_added((node1_id, node2_id), attrs)
+
+    def edge_changed(self, node1_id, node2_id, old_attrs, attrs):
+        self.item_changed((node1_id, node2_id), old_attrs, attrs)
+
+    def edge_removed(self, node1_id, node2_id, attrs):
+        self.item_removed((node1_id, node2_id), attrs)
@@ -1,3 +1,6 @@
+from schema import TYPE_NAMES
+
+
 class Error_Checking:
     """
     Class that checks whether the commands entered by the 
@@ -106,6 +109,24 @@ class Error_Checking:
         elif cmd == "VISUALIZE":
             err = self.not_empty(attrList)
 
+        elif cmd == "CREATEINDEX" or cmd == "DROPINDEX":
+            err = self.changed_bool(cmdBool) or self.not_empty_names(nameList) \
+                    or (not self.not_empty(attrList)) or self.has_bool_attr(attrList) \
+                    or self.has_attr_values(attrList)
+
+        elif cmd == "STATS":
+            err = self.changed_bool(cmdBool) or self.not_empty_names(nameList) \
+                    or self.has_bool_attr(attrList) or self.has_attr_values(attrList)
+
+        elif cmd == "SCHEMA":
+            err = self.changed_bool(cmdBool) or self.not_empty_names(nameList) \
+                    or self.has_bool_attr(attrList) or self.has_bad_types(attrList)
+
+        # Only MATCH commands can limit their number of results
+        limit = command.get_limit()
+        if limit is not None and (cmd != "MATCH" or limit < 1):
+            err = True
+
         return err
 
 
@@ -141,6 +162,29 @@ class Error_Checking:
         return (not attrList == [])
 
 
+    def has_attr_values(self, attrList):
+        """
+        Check if any attribute values are given in the list of attributes.
+        If yes, return True. Otherwise, return False.
+        """
+        for lst in attrList:
+            if lst[2] != {}:
+                return True
+        return False
+
+
+    def has_bad_types(self, attrList):
+        """
+        Check if any attribute value is not the name of a type.
+        If yes, return True. Otherwise, return False.
+        """
+        for lst in attrList:
+            for value in lst[2].itervalues():
+                if value not in TYPE_NAMES:
+                    return True
+        return False
+
+
     def has_edge_attr(self, attrList):
         """
         Check if an edge attribute exists in the list of attributes.
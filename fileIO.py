@@ -3,7 +3,12 @@
 ''' This file contains file I/O operations for writing and reading bytes from files.
     This is useful for the storage layer. '''
 
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
+from array import array
+try:
+    import cPickle as pickle
+except:
+    import pickle
 
 ''' Write value to file after converting it to ascii character (1 byte). '''
 def write_byte(file, val):
@@ -45,6 +50,132 @@ def read_int(short):
 def read_unsigned_int(short):
     return unpack('I', short)[0] 
 
+''' Write value to file by packing it into long long (8 bytes). '''
+def write_long(file, val):
+    file.write(pack('q', val))
+
+''' Write value to file by packing it into double (8 bytes). '''
+def write_double(file, val):
+    file.write(pack('d', val))
+
+''' Write string to file as its length (unsigned int) followed by its bytes. '''
+def write_string(file, val):
+    if isinstance(val, unicode):
+        val = val.encode('utf-8')
+    write_unsigned_int(file, len(val))
+    file.write(val)
+
+''' Read value of long long (8 bytes). '''
+def read_long(long_s):
+    return unpack('q', long_s)[0]
+
+''' Read value of double (8 bytes). '''
+def read_double(double_s):
+    return unpack('d', double_s)[0]
+
+
+# Type tags used when writing attribute values. Every value is stored as a
+# one byte tag followed by its packed representation.
+TAG_STRING = ord('s')
+TAG_UNICODE = ord('u')
+TAG_INT = ord('i')
+TAG_FLOAT = ord('f')
+TAG_BOOL = ord('b')
+TAG_PICKLE = ord('p')
+
+''' Write a single attribute value to file, prefixed by its type tag. The
+    tag is packed together with the value, since attribute values are
+    written millions of times when a large graph is stored. '''
+def write_value(file, val):
+    t = type(val)
+    if t is str:
+        file.write(pack('=BI', TAG_STRING, len(val)))
+        file.write(val)
+    elif t is int:
+        file.write(pack('=Bq', TAG_INT, val))
+    elif t is float:
+        file.write(pack('=Bd', TAG_FLOAT, val))
+    elif isinstance(val, bool):
+        write_byte(file, TAG_BOOL)
+        write_byte(file, int(val))
+    elif isinstance(val, (int, long)) and -2**63 <= val < 2**63:
+        write_byte(file, TAG_INT)
+        write_long(file, val)
+    elif isinstance(val, float):
+        write_byte(file, TAG_FLOAT)
+        write_double(file, val)
+    elif isinstance(val, str):
+        write_byte(file, TAG_STRING)
+        write_string(file, val)
+    elif isinstance(val, unicode):
+        write_byte(file, TAG_UNICODE)
+        write_string(file, val)
+    else:
+        write_byte(file, TAG_PICKLE)
+        write_string(file, pickle.dumps(val, pickle.HIGHEST_PROTOCOL))
+
+''' Write an attribute dictionary to file as a count followed by
+    (key, value) pairs. '''
+def write_attrs(file, attrs):
+    file.write(pack('I', len(attrs)))
+    for key, val in attrs.iteritems():
+        write_value(file, key)
+        write_value(file, val)
+
+''' Read a string out of a buffer starting at offset. Returns the string
+    and the offset just past it. '''
+def read_string(buf, offset):
+    length = unpack_from('I', buf, offset)[0]
+    offset += 4
+    return buf[offset:offset + length], offset + length
+
+''' Read a tagged attribute value out of a buffer starting at offset. Returns
+    the value and the offset just past it. '''
+def read_value(buf, offset):
+    tag = ord(buf[offset])
+    offset += 1
+    if tag == TAG_STRING:
+        return read_string(buf, offset)
+    elif tag == TAG_INT:
+        return unpack_from('q', buf, offset)[0], offset + 8
+    elif tag == TAG_FLOAT:
+        return unpack_from('d', buf, offset)[0], offset + 8
+    elif tag == TAG_UNICODE:
+        val, offset = read_string(buf, offset)
+        return val.decode('utf-8'), offset
+    elif tag == TAG_BOOL:
+        return ord(buf[offset]) != 0, offset + 1
+    elif tag == TAG_PICKLE:
+        val, offset = read_string(buf, offset)
+        return pickle.loads(val), offset
+    raise ValueError('Unknown value tag ' + str(tag))
+
+''' Write a sequence of values to file as a packed array of the given
+    array type code ('i' for int, 'I' for unsigned int, etc.). '''
+def write_array(file, typecode, values):
+    if not isinstance(values, array):
+        values = array(typecode, values)
+    values.tofile(file)
+
+''' Read count values of the given array type code out of a buffer starting
+    at offset. Returns the array and the offset just past it. '''
+def read_array(buf, typecode, offset, count):
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.fromstring(buf[offset:end])
+    return values, end
+
+''' Read an attribute dictionary out of a buffer starting at offset. Returns
+    the dictionary and the offset just past it. '''
+def read_attrs(buf, offset):
+    count = unpack_from('I', buf, offset)[0]
+    offset += 4
+    attrs = {}
+    for i in xrange(count):
+        key, offset = read_value(buf, offset)
+        attrs[key], offset = read_value(buf, offset)
+    return attrs, offset
+
 
 if __name__ == "__main__":
     file = open('test.bin', 'wb')
@@ -0,0 +1,362 @@
+import os
+from ordered_values import to_number
+try:
+    # use C version of pickle if possible, since this is much faster
+   import cPickle as pickle
+except:
+   import pickle
+
+# Number of buckets of the histogram of a numeric attribute
+HISTOGRAM_BUCKETS = 10
+
+
+class GraphStatistics:
+    """
+    Statistics of the graph that are kept up to date with every change, so
+    they can be used without scanning the graph: the number of nodes and
+    edges, how many nodes and edges have each value of each attribute, and
+    how many nodes have each in-degree and out-degree.
+
+    The L{GraphStructure} notifies the statistics about every mutation
+    before its listeners, and the bulk loading methods of the
+    L{QueryEvaluator} update them directly. The statistics are saved with
+    every snapshot of the graph, see L{GraphStorage}.
+
+    The epoch counts the changes made to the graph, so results computed
+    from the graph are known to be current while it stays the same, see
+    L{ResultCache}.
+    """
+
+    def __init__(self, gs):
+        """
+        Creates the statistics of an empty graph.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph the statistics describe
+        """
+        self.gs = gs
+        self.epoch = 0
+        # False if statistics were saved with a graph whose attribute
+        # values were all strings, see L{load}
+        self.typed = True
+        self.clear()
+
+    def clear(self):
+        """
+        Resets the statistics to those of an empty graph.
+        """
+        self.epoch += 1
+        self.nodes = 0
+        self.edges = 0
+        # Numbers of items with each value, by attribute name and value
+        self.node_values = {}
+        self.edge_values = {}
+        # Numbers of nodes by their degree
+        self.out_degrees = {}
+        self.in_degrees = {}
+
+    def rebuild(self):
+        """
+        Computes the statistics from scratch by scanning the whole graph.
+        Used when the graph was loaded without its saved statistics.
+        """
+        self.clear()
+        g = self.gs.get_graph()
+        pred = g.pred
+        for node_id, attrs in g.node.iteritems():
+            self.count_values(self.node_values, attrs, 1)
+            self.move(self.in_degrees, None, len(pred[node_id]))
+        self.nodes = len(g.node)
+        for node_id, out in g.succ.iteritems():
+            self.move(self.out_degrees, None, len(out))
+            for attrs in out.itervalues():
+                self.count_values(self.edge_values, attrs, 1)
+            self.edges += len(out)
+
+    def load(self, stats_file):
+        """
+        Loads the statistics saved with a snapshot. The statistics are only
+        used if they describe the loaded graph, and if they were saved
+        after attribute values were typed; typed is set to False for
+        graphs saved before, or without statistics.
+
+        @type stats_file: String
+        @param stats_file: File the statistics were saved to
+        @rtype: Boolean
+        @return: True if the statistics were loaded
+        """
+        self.typed = False
+        if not os.path.isfile(stats_file):
+            return False
+        f = open(stats_file, 'rb')
+        try:
+            state = pickle.load(f)
+        except Exception:
+            return False
+        finally:
+            f.close()
+        self.typed = state.get('typed', False)
+        g = self.gs.get_graph()
+        if not self.typed or state.get('id') != self.gs.get_id() or \
+            state.get('nodes') != len(g.node) or \
+            state.get('edges') != sum(len(out) for out in g.succ.itervalues()):
+            return False
+        self.nodes = state['nodes']
+        self.edges = state['edges']
+        self.node_values = state['node_values']
+        self.edge_values = state['edge_values']
+        self.out_degrees = state['out_degrees']
+        self.in_degrees = state['in_degrees']
+        self.epoch += 1
+        return True
+
+    def save(self, stats_file):
+        """
+        Saves the statistics next to a snapshot of the graph.
+
+        @type stats_file: String
+        @param stats_file: File to save the statistics to
+        """
+        state = {'id' : self.gs.get_id(), 'nodes' : self.nodes,
+            'edges' : self.edges, 'node_values' : self.node_values,
+            'edge_values' : self.edge_values,
+            'out_degrees' : self.out_degrees, 'in_degrees' : self.in_degrees,
+            'typed' : True}
+        f = open(stats_file + '.tmp', 'wb')
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(stats_file + '.tmp', stats_file)
+
+    def count_values(self, values, attrs, delta):
+        """
+        Adds to the numbers of items having the values of the attributes.
+
+        @type values: Dictionary
+        @param values: Numbers of items by attribute name and value
+        @type attrs: Dictionary
+        @param attrs: Attributes of an item
+        @type delta: Integer
+        @param delta: 1 for an added item, -1 for a removed one
+        """
+        for attr, value in attrs.iteritems():
+            counts = values.get(attr)
+            if counts is None:
+                counts = values[attr] = {}
+            try:
+                count = counts.get(value, 0) + delta
+            except TypeError:
+                # Values that cannot be hashed are not counted
+                if not counts:
+                    del values[attr]
+                continue
+            if count:
+                counts[value] = count
+            else:
+                del counts[value]
+                if not counts:
+                    del values[attr]
+
+    def move(self, degrees, old, new):
+        """
+        Moves a node from one degree to another.
+
+        @type degrees: Dictionary
+        @param degrees: Numbers of nodes by degree
+        @type old: Integer or None
+        @param old: Degree the node had, or None for an added node
+        @type new: Integer or None
+        @param new: Degree the node has, or None for a removed node
+        """
+        if old is not None:
+            count = degrees.get(old, 0) - 1
+            if count > 0:
+                degrees[old] = count
+            else:
+                degrees.pop(old, None)
+        if new is not None:
+            degrees[new] = degrees.get(new, 0) + 1
+
+    def nodes_added(self, node_ids, attrs_list):
+        """
+        Counts nodes added without any edges.
+
+        @type node_ids: List of Integers
+        @param node_ids: Ids of the nodes
+        @type attrs_list: List of dictionaries
+        @param attrs_list: Attributes of the nodes
+        """
+        self.epoch += 1
+        for attrs in attrs_list:
+            self.count_values(self.node_values, attrs, 1)
+        self.nodes += len(node_ids)
+        for degrees in (self.out_degrees, self.in_degrees):
+            degrees[0] = degrees.get(0, 0) + len(node_ids)
+            if not degrees[0]:
+                del degrees[0]
+
+    def edges_added(self, edges):
+        """
+        Counts edges added to the graph, which must already contain them.
+
+        @type edges: List of tuples
+        @param edges: Edges in the format (starting node id, ending node id,
+        edge attributes)
+        """
+        self.epoch += 1
+        added_out = {}
+        added_in = {}
+        for node1_id, node2_id, attrs in edges:
+            added_out[node1_id] = added_out.get(node1_id, 0) + 1
+            added_in[node2_id] = added_in.get(node2_id, 0) + 1
+            if attrs:
+                self.count_values(self.edge_values, attrs, 1)
+        self.edges += len(edges)
+        g = self.gs.get_graph()
+        for degrees, added, adjacency in ((self.out_degrees, added_out,
+            g.succ), (self.in_degrees, added_in, g.pred)):
+            for node_id, count in added.iteritems():
+                degree = len(adjacency[node_id])
+                self.move(degrees, degree - count, degree)
+
+    def report(self, item=None):
+        """
+        Describes the statistics of the graph, or of one attribute.
+
+        @type item: List
+        @param item: Parsed object of the form "Type: Identifier
+        dictionary_attributes" naming a node or edge attribute, or None
+        @rtype: List of strings
+        @return: Lines describing the statistics
+        """
+        if item is not None:
+            values = self.edge_values if item[0] == "e:" else \
+                self.node_values
+            return self.attribute_report(item[1], values.get(item[1], {}))
+
+        lines = ["Nodes: " + str(self.nodes) + ", edges: " + str(self.edges)]
+        for name, degrees in (("Out-degree", self.out_degrees),
+            ("In-degree", self.in_degrees)):
+            lines.append(name + ": " + self.degree_report(degrees))
+        for name, values in (("Node", self.node_values),
+            ("Edge", self.edge_values)):
+            for attr in sorted(values):
+                counts = values[attr]
+                lines.append(name + " attribute " + attr + ": " +
+                    str(sum(counts.itervalues())) + " items, " +
+                    str(len(counts)) + " distinct values")
+        return lines
+
+    def degree_report(self, degrees):
+        """
+        Describes a degree distribution, grouping the degrees in powers of
+        two.
+
+        @type degrees: Dictionary
+        @param degrees: Numbers of nodes by degree
+        @rtype: String
+        @return: Description of the distribution
+        """
+        if not degrees:
+            return "no nodes"
+        groups = {}
+        for degree, count in degrees.iteritems():
+            group = degree and 1 << (degree.bit_length() - 1)
+            groups[group] = groups.get(group, 0) + count
+        total = sum(degree * count for degree, count in degrees.iteritems())
+        parts = ["max " + str(max(degrees)), "mean " +
+            ("%.2f" % (total / float(sum(degrees.itervalues()))))]
+        for group in sorted(groups):
+            label = str(group) if group < 2 else \
+                str(group) + "-" + str(2 * group - 1)
+            parts.append(label + ": " + str(groups[group]))
+        return ", ".join(parts)
+
+    def attribute_report(self, attr, counts):
+        """
+        Describes the values of an attribute. Numeric values are grouped in
+        equally wide ranges, otherwise the most common values are listed.
+
+        @type attr: String
+        @param attr: Name of the attribute
+        @type counts: Dictionary
+        @param counts: Numbers of items by value of the attribute
+        @rtype: List of strings
+        @return: Lines describing the values
+        """
+        lines = [attr + ": " + str(sum(counts.itervalues())) + " items, " +
+            str(len(counts)) + " distinct values"]
+        numbers = [(to_number(value), count)
+            for value, count in counts.iteritems()]
+        numbers = [(number, count) for number, count in numbers
+            if number is not None and number == number]
+        if numbers and len(numbers) == len(counts):
+            low = min(numbers)[0]
+            high = max(numbers)[0]
+            width = (high - low) / HISTOGRAM_BUCKETS or 1.0
+            buckets = [0] * HISTOGRAM_BUCKETS
+            for number, count in numbers:
+                bucket = min(int((number - low) / width),
+                    HISTOGRAM_BUCKETS - 1)
+                buckets[bucket] += count
+            for bucket, count in enumerate(buckets):
+                if count:
+                    lines.append("  %g to %g: %d" % (low + bucket * width,
+                        low + (bucket + 1) * width, count))
+        else:
+            common = sorted(counts.iteritems(), key=lambda item: -item[1])
+            for value, count in common[:HISTOGRAM_BUCKETS]:
+                lines.append("  " + repr(value) + ": " + str(count))
+        return lines
+
+    # Listener methods called by the GraphStructure
+
+    def node_added(self, node_id, attrs):
+        self.nodes_added([node_id], [attrs])
+
+    def node_changed(self, node_id, old_attrs, attrs):
+        self.epoch += 1
+        self.count_values(self.node_values, old_attrs, -1)
+        self.count_values(self.node_values, attrs, 1)
+
+    def node_removed(self, node_id, attrs, edges):
+        self.epoch += 1
+        self.count_values(self.node_values, attrs, -1)
+        self.nodes -= 1
+        g = self.gs.get_graph()
+        out_degree = in_degree = 0
+        for node1_id, node2_id, edge_attrs in edges:
+            self.count_values(self.edge_values, edge_attrs, -1)
+            self.edges -= 1
+            if node1_id == node_id:
+                out_degree += 1
+                if node2_id != node_id:
+                    degree = len(g.pred[node2_id])
+                    self.move(self.in_degrees, degree + 1, degree)
+            if node2_id == node_id:
+                in_degree += 1
+                if node1_id != node_id:
+                    degree = len(g.succ[node1_id])
+                    self.move(self.out_degrees, degree + 1, degree)
+        self.move(self.out_degrees, out_degree, None)
+        self.move(self.in_degrees, in_degree, None)
+
+    def edge_added(self, node1_id, node2_id, attrs):
+        self.edges_added([(node1_id, node2_id, attrs)])
+
+    def edge_changed(self, node1_id, node2_id, old_attrs, attrs):
+        self.epoch += 1
+        self.count_values(self.edge_values, old_attrs, -1)
+        self.count_values(self.edge_values, attrs, 1)
+
+    def edge_removed(self, node1_id, node2_id, attrs):
+        self.epoch += 1
+        self.count_values(self.edge_values, attrs, -1)
+        self.edges -= 1
+        g = self.gs.get_graph()
+        degree = len(g.succ[node1_id])
+        self.move(self.out_degrees, degree + 1, degree)
+        degree = len(g.pred[node2_id])
+        self.move(self.in_degrees, degree + 1, degree)
+
+    def graph_cleared(self):
+        self.clear()
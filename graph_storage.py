@@ -1,73 +1,579 @@
-import networkx as nx 
+import gc
+import os
+import re
+import traceback
+import multiprocessing
+from array import array
+from struct import pack, unpack_from
+import networkx as nx
 from utilities import Utilities
+from csr_snapshot import CSRSnapshot
+from fileIO import write_array, read_array
+from schema import infer_attrs
 try:
-    # use C version of pickle if possible, since this is much faster 
-   import cPickle as pickle 
+    # use C version of pickle if possible, since this is much faster
+   import cPickle as pickle
 except:
    import pickle
 
+# First bytes of the graph file when the graph is stored in segments.
+SEGMENT_MAGIC = 'MDBSEG2\n'
+
+# Magic string followed by the segment size, the next unique id, the
+# generation of the write and the number of segments listed after the
+# header, first their numbers and then their versions.
+MANIFEST_FORMAT = '8sqqqq'
+MANIFEST_SIZE = 40
+
+# Graph files written before segments were versioned list the segment
+# numbers only, and every segment file has version 0.
+OLD_SEGMENT_MAGIC = 'MDBSEG1\n'
+OLD_MANIFEST_FORMAT = '8sqqq'
+OLD_MANIFEST_SIZE = 32
+
+# Suffixes of the segment and statistics files of a graph file.
+GRAPH_FILE_SUFFIX_RE = re.compile(r"^([0-9]+(\.[0-9]+)?|stats(\.[0-9]+)?)$")
+
+# Number of consecutive node ids stored in one segment file.
+SEGMENT_SIZE = 4096
+
+# Number of processes decoding segments when the database starts.
+try:
+    LOAD_PROCESSES = multiprocessing.cpu_count()
+except NotImplementedError:
+    LOAD_PROCESSES = 1
+
+
+# Fewest segments decoded by a pool of processes. Fewer segments are
+# decoded in less time than starting the pool takes.
+PARALLEL_SEGMENTS = 16
+
+
+def decode_segment(filename):
+    """
+    Decodes the segment stored in the file.
+
+    @type filename: String
+    @param filename: File storing the segment
+    @rtype: Tuple
+    @return: Nodes and edges decoded by L{CSRSnapshot.decode}
+    """
+    snapshot = CSRSnapshot(filename)
+    decoded = snapshot.decode()
+    snapshot.close()
+    return decoded
+
+
+def pack_segment(filename):
+    """
+    Decodes the segment stored in the file into a form that is cheap to
+    pass between processes, see L{unpack_segment}. Used by the worker
+    processes that load segments in parallel. Arrays are pickled as lists,
+    so they are passed as strings, and only the edges that have attributes
+    are passed.
+
+    @type filename: String
+    @param filename: File storing the segment
+    @rtype: Tuple
+    @return: Node ids, node attributes, out offsets and out targets as
+    strings, and the edge attributes keyed by edge position
+    """
+    node_ids, node_attrs, out_offsets, out_targets, edge_attrs = \
+        decode_segment(filename)
+    edge_attrs = dict((k, attrs) for k, attrs in enumerate(edge_attrs) 
+        if attrs is not None)
+    return (node_ids.tostring(), node_attrs, out_offsets.tostring(),
+        out_targets.tostring(), edge_attrs)
+
+
+def unpack_segment(packed):
+    """
+    Restores a segment packed by L{pack_segment}.
+
+    @type packed: Tuple
+    @param packed: Result of L{pack_segment}
+    @rtype: Tuple
+    @return: Nodes and edges like L{CSRSnapshot.decode} returns them
+    """
+    node_ids, node_attrs, out_offsets, out_targets, edge_attrs = packed
+    arrays = []
+    for data in (node_ids, out_offsets, out_targets):
+        values = array('i')
+        values.fromstring(data)
+        arrays.append(values)
+    attrs_list = [None] * len(arrays[2])
+    for k, attrs in edge_attrs.iteritems():
+        attrs_list[k] = attrs
+    return arrays[0], node_attrs, arrays[1], arrays[2], attrs_list
+
+
 class GraphStorage:
     """
-    This class handles writing and reading the L{GraphStructure} object 
+    This class handles writing and reading the L{GraphStructure} object
     to disk.
+
+    The graph is split into segments that each hold a fixed range of node
+    ids. Every segment is stored in its own L{CSRSnapshot} file next to the
+    graph file, and the graph file itself lists the segments. The storage
+    listens to the mutations of the L{GraphStructure} and remembers which
+    segments they touched, so writing the graph only rewrites those
+    segments.
+
+    Every write of the graph is a new generation. The segments and the
+    statistics it writes get files named after the generation, so the
+    files of the previous generation are left alone, and the graph file
+    lists the version of every segment. Renaming the new graph file into
+    place commits the write; the files it no longer lists are removed
+    after that.
     """
-    def __init__(self, gs):
-        """ 
+    def __init__(self, gs, segment_size=SEGMENT_SIZE):
+        """
         Takes a L{GraphStructure} object to store on disk.
 
         @type gs: L{GraphStructure}
         @param gs: L{GraphStructure} object to store on disk.
+        @type segment_size: Integer
+        @param segment_size: Number of node ids stored in a segment
         """
         self.gs = gs
-        
-    def load_graph(self, graph_file, id_file):
+        self.segment_size = segment_size
+        # Graph file the segments on disk belong to
+        self.graph_file = None
+        # Versions of the segments present on disk by segment number, and
+        # segments changed since last write
+        self.segments = {}
+        self.dirty = set()
+        # Generation of the last write of the graph file
+        self.generation = 0
+        # Set when every segment has to be rewritten
+        self.full_write = True
+        # Changes handed to a background write, see fork_write
+        self.pending = None
+        self.gs.add_listener(self)
+
+    def load_graph(self, graph_file, id_file, processes=1):
         """
         Loads the L{GraphStructure} object from two files. The first file
         persists the in-memory graph data while the second file persists
         the unique ids. The two files must exist or else nothing will happen.
+        The graph file either lists the segments of the graph or holds a
+        single L{CSRSnapshot}; graph files written by older versions are
+        unpickled.
 
         @type graph_file: String
         @param graph_file: File to store the in-memory graph structure
         @type id_file: String
         @param id_file: File to store unique id number
+        @type processes: Integer
+        @param processes: Number of processes decoding segments in parallel
         """
 
         if not Utilities.files_exist(graph_file, id_file):
-            print 'One or more files does not exist' 
+            print 'One or more files does not exist'
             return
 
         # Stores graph data from file and loads it to internal graph
         # self.gs.set_graph(nx.read_graphml(graph_file))
         # self.gs.set_graph(nx.read_gpickle(graph_file))
-        f1 = open(graph_file, 'r')
-        self.gs.set_graph(pickle.load(f1))
-        f1.close()
+        self.full_write = True
+        self.generation = 0
+        next_id = 0
+        if self.is_manifest(graph_file):
+            self.segments, next_id, self.generation = \
+                self.read_manifest(graph_file)
+            self.gs.set_graph(self.load_segments(graph_file, processes))
+            self.graph_file = graph_file
+            self.full_write = False
+        elif CSRSnapshot.is_snapshot(graph_file):
+            snapshot = CSRSnapshot(graph_file)
+            self.gs.set_graph(snapshot.to_graph())
+            snapshot.close()
+        else:
+            f1 = open(graph_file, 'r')
+            self.gs.set_graph(pickle.load(f1))
+            f1.close()
+        self.dirty = set()
 
-        # Read current id from file to GraphStructure
+        # Read current id from file to GraphStructure. The graph file is
+        # written first, so its id is used if the id file is older
         f2 = open(id_file, 'r')
         val = f2.readline().strip()
         if val == "":
             val = 0
-        self.gs.set_id(int(val))
+        self.gs.set_id(max(int(val), next_id))
         f2.close()
 
+        # The statistics are only computed again if they were not saved
+        # with the same graph
+        if not self.gs.statistics.load(self.stats_file(graph_file,
+            self.generation)):
+            # Graphs saved before attribute values were typed have their
+            # values typed once, and are then written again in full
+            if not self.gs.statistics.typed and self.type_values():
+                self.full_write = True
+            self.gs.statistics.rebuild()
+
+    def type_values(self):
+        """
+        Types the string values of the attributes of every node and edge
+        of the loaded graph, see L{infer_attrs}.
+
+        @rtype: Boolean
+        @return: True if a value was typed
+        """
+        g = self.gs.get_graph()
+        typed = False
+        for attrs in g.node.itervalues():
+            typed = infer_attrs(attrs) or typed
+        for out in g.succ.itervalues():
+            for attrs in out.itervalues():
+                typed = infer_attrs(attrs) or typed
+        return typed
+
+    def load_segments(self, graph_file, processes=1):
+        """
+        Builds a graph from the segment files listed in the graph file,
+        which L{read_manifest} has read into segments. With more than one
+        process and at least PARALLEL_SEGMENTS
+        segments, the segments are decoded concurrently by a pool of
+        worker processes and merged into the graph as they arrive. The
+        merge builds millions of dictionaries but no reference cycles, so
+        the cycle collector is turned off while it runs.
+
+        @type graph_file: String
+        @param graph_file: File listing the segments of the graph
+        @type processes: Integer
+        @param processes: Number of processes decoding segments
+        @rtype: Graph
+        @return: Directed graph with the nodes and edges of every segment
+        """
+        filenames = [self.segment_file(graph_file, segment, version)
+            for segment, version in sorted(self.segments.iteritems())]
+
+        g = nx.DiGraph()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if processes > 1 and len(filenames) >= PARALLEL_SEGMENTS:
+                pool = multiprocessing.Pool(min(processes, len(filenames)))
+                for packed in pool.imap_unordered(pack_segment, filenames):
+                    CSRSnapshot.add_to_graph(g, unpack_segment(packed))
+                pool.close()
+                pool.join()
+            else:
+                for filename in filenames:
+                    CSRSnapshot.add_to_graph(g, decode_segment(filename))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return g
 
     def write_graph(self, file1, file2):
         """
         Writes the L{GraphStructure} object to two files. The first file
         will contain the in-memory graph data while the second file will
-        contain the unique id number. 
+        contain the unique id number. Only the segments changed since the
+        last write are rewritten, to new files of the next generation.
+        The graph file listing them is written last and renamed into
+        place, so a crash while writing leaves the graph file listing the
+        segments and statistics of the previous write, whose files are
+        only removed once the new graph file is in place. The id is also
+        kept in the graph file, in case the crash comes before the id
+        file is written.
         """
         # nx.write_graphml(self.gs.get_graph(), file1)
         # nx.write_gpickle(self.gs.get_graph(), file1)
-        f1 = open(file1, 'w')
-        pickle.dump(self.gs.get_graph(), f1)
-        f1.close()
+        g = self.gs.get_graph()
+        if file1 != self.graph_file:
+            self.segments = {}
+            self.generation = 0
+            if self.is_manifest(file1):
+                self.segments, next_id, self.generation = \
+                    self.read_manifest(file1)
+        if self.full_write or file1 != self.graph_file:
+            self.dirty = set(self.group_segments(g.nodes())) | \
+                set(self.segments)
+        generation = self.generation + 1
+        segments = dict(self.segments)
+        for segment in self.dirty:
+            if self.write_segment(file1, segment, generation):
+                segments[segment] = generation
+            else:
+                segments.pop(segment, None)
+        self.gs.statistics.save(self.stats_file(file1, generation))
+        self.write_manifest(file1, segments, generation)
 
         # Write current Id to another file
-        f2 = open(file2, 'w')
+        f2 = open(file2 + '.tmp', 'w')
         f2.write(str(self.gs.get_id()))
         f2.close()
+        os.rename(file2 + '.tmp', file2)
+
+        self.remove_unlisted(file1, segments, generation)
+        self.segments = segments
+        self.generation = generation
+        self.graph_file = file1
+        self.dirty = set()
+        self.full_write = False
+
+    def fork_write(self, file1, file2):
+        """
+        Writes the L{GraphStructure} object like L{write_graph}, but in a
+        forked child process. The child sees the graph exactly as it was
+        when this method was called, while the parent returns immediately
+        and can keep changing the graph. Changes made from now on are
+        tracked for the next write. L{finish_write} must be called once the
+        child has exited.
+
+        @rtype: Integer
+        @return: Process id of the child writing the graph
+        """
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.write_graph(file1, file2)
+                os._exit(0)
+            except:
+                traceback.print_exc()
+                os._exit(1)
+        self.pending = (self.dirty, self.full_write or
+            file1 != self.graph_file)
+        self.dirty = set()
+        self.full_write = False
+        return pid
+
+    def finish_write(self, file1, success):
+        """
+        Updates the segment bookkeeping after the child started by
+        L{fork_write} has exited. If the child failed, the segments it
+        should have written are marked as changed again.
+
+        @type file1: String
+        @param file1: Graph file that was written by the child
+        @type success: Boolean
+        @param success: True if the child wrote the graph successfully
+        """
+        dirty, full_write = self.pending
+        if success:
+            self.segments, next_id, self.generation = \
+                self.read_manifest(file1)
+            self.graph_file = file1
+        else:
+            self.dirty |= dirty
+            self.full_write = self.full_write or full_write
+        self.pending = None
+
+    def write_segment(self, graph_file, segment, version):
+        """
+        Writes a single segment from the in-memory graph to the file of a
+        new version, unless the segment no longer holds any nodes.
+
+        @type graph_file: String
+        @param graph_file: Graph file the segment belongs to
+        @type segment: Integer
+        @param segment: Number of the segment to write
+        @type version: Integer
+        @param version: Version of the segment file
+        @rtype: Boolean
+        @return: True if the segment was written, False if it is empty
+        """
+        g = self.gs.get_graph()
+        start = segment * self.segment_size
+        node_ids = [node_id for node_id in
+            xrange(start, start + self.segment_size) if node_id in g.node]
+        if not node_ids:
+            return False
+        CSRSnapshot.write(self.segment_file(graph_file, segment, version), g,
+            self.gs.get_id(), node_ids)
+        return True
+
+    def group_segments(self, node_ids):
+        """
+        Groups node ids by the segment they belong to.
+
+        @type node_ids: List
+        @param node_ids: Node ids to group
+        @rtype: Dictionary
+        @return: Lists of node ids keyed by segment number
+        """
+        groups = {}
+        for node_id in node_ids:
+            groups.setdefault(node_id // self.segment_size, []).append(node_id)
+        return groups
+
+    def segment_file(self, graph_file, segment, version):
+        """
+        Returns the name of the file storing a version of a segment.
+
+        @type graph_file: String
+        @param graph_file: Graph file the segment belongs to
+        @type segment: Integer
+        @param segment: Number of the segment
+        @type version: Integer
+        @param version: Generation the segment was written by, 0 for
+        segments written before segments were versioned
+        @rtype: String
+        @return: Name of the segment file
+        """
+        if version == 0:
+            return graph_file + '.' + str(segment)
+        return graph_file + '.' + str(segment) + '.' + str(version)
+
+    def stats_file(self, graph_file, generation):
+        """
+        Returns the name of the file storing the L{GraphStatistics} saved
+        with a graph.
+
+        @type graph_file: String
+        @param graph_file: Graph file the statistics belong to
+        @type generation: Integer
+        @param generation: Generation of the write that saved them, 0 for
+        graphs that are not stored in versioned segments
+        @rtype: String
+        @return: Name of the statistics file
+        """
+        if generation == 0:
+            return graph_file + '.stats'
+        return graph_file + '.stats.' + str(generation)
+
+    def remove_unlisted(self, graph_file, segments, generation):
+        """
+        Removes the segment and statistics files of a graph file that it
+        does not list: the versions replaced by the last write, segments
+        that no longer hold any nodes, and files left behind by a write
+        that did not finish.
+
+        @type graph_file: String
+        @param graph_file: Graph file the files belong to
+        @type segments: Dictionary
+        @param segments: Versions of the listed segments by segment number
+        @type generation: Integer
+        @param generation: Generation of the write that saved the graph file
+        """
+        directory, name = os.path.split(graph_file)
+        listed = set(self.segment_file(name, segment, version)
+            for segment, version in segments.iteritems())
+        listed.add(self.stats_file(name, generation))
+        for filename in os.listdir(directory or os.curdir):
+            if filename.startswith(name + '.') and filename not in listed \
+                and GRAPH_FILE_SUFFIX_RE.match(filename[len(name) + 1:]):
+                os.remove(os.path.join(directory, filename))
+
+    def is_manifest(self, graph_file):
+        """
+        Returns true if the graph file lists the segments of a graph.
+
+        @type graph_file: String
+        @param graph_file: File to check
+        @rtype: Boolean
+        @return: True if the file lists segments, false otherwise
+        """
+        if not os.path.isfile(graph_file):
+            return False
+        f = open(graph_file, 'rb')
+        magic = f.read(len(SEGMENT_MAGIC))
+        f.close()
+        return magic in (SEGMENT_MAGIC, OLD_SEGMENT_MAGIC)
+
+    def read_manifest(self, graph_file):
+        """
+        Reads the segments listed in the graph file and sets the segment
+        size to the one the segments were written with.
+
+        @type graph_file: String
+        @param graph_file: File listing the segments
+        @rtype: Tuple
+        @return: Versions of the segments stored on disk by segment number,
+        the next unique id and the generation of the write
+        """
+        f = open(graph_file, 'rb')
+        buf = f.read()
+        f.close()
+        if buf.startswith(OLD_SEGMENT_MAGIC):
+            magic, self.segment_size, next_id, count = unpack_from(
+                OLD_MANIFEST_FORMAT, buf, 0)
+            segments = read_array(buf, 'i', OLD_MANIFEST_SIZE, count)[0]
+            return dict.fromkeys(segments, 0), next_id, 0
+        magic, self.segment_size, next_id, generation, count = unpack_from(
+            MANIFEST_FORMAT, buf, 0)
+        segments, offset = read_array(buf, 'i', MANIFEST_SIZE, count)
+        versions = read_array(buf, 'i', offset, count)[0]
+        return dict(zip(segments, versions)), next_id, generation
+
+    def write_manifest(self, graph_file, segments, generation):
+        """
+        Writes the list of segments stored on disk to the graph file. The
+        write is committed when the file is renamed into place.
+
+        @type graph_file: String
+        @param graph_file: File to list the segments in
+        @type segments: Dictionary
+        @param segments: Versions of the segments by segment number
+        @type generation: Integer
+        @param generation: Generation of the write
+        """
+        numbers = sorted(segments)
+        f = open(graph_file + '.tmp', 'wb')
+        f.write(pack(MANIFEST_FORMAT, SEGMENT_MAGIC, self.segment_size,
+            self.gs.get_id(), generation, len(numbers)))
+        write_array(f, 'i', numbers)
+        write_array(f, 'i', [segments[segment] for segment in numbers])
+        f.close()
+        os.rename(graph_file + '.tmp', graph_file)
+
+    def mark_all(self):
+        """
+        Marks every segment as changed, so the next write rewrites the
+        whole graph. Used after the graph was changed without notifying
+        the storage, for example by a bulk load.
+        """
+        self.full_write = True
+
+    def mark_nodes(self, node_ids):
+        """
+        Marks the segments holding the nodes as changed. Used by bulk loads,
+        which change the graph without notifying the storage.
+
+        @type node_ids: List
+        @param node_ids: Ids of the changed nodes
+        """
+        size = self.segment_size
+        self.dirty.update(set([node_id // size for node_id in node_ids]))
+
+    def mark(self, node_id):
+        """
+        Marks the segment holding the node as changed.
+
+        @type node_id: Integer
+        @param node_id: Id of the changed node
+        """
+        self.dirty.add(node_id // self.segment_size)
+
+    # Listener methods called by the GraphStructure on every mutation.
+
+    def node_added(self, node_id, attrs):
+        self.mark(node_id)
+
+    def node_changed(self, node_id, old_attrs, attrs):
+        self.mark(node_id)
+
+    def node_removed(self, node_id, attrs, edges):
+        self.mark(node_id)
+        for edge in edges:
+            self.mark(edge[0])
+            self.mark(edge[1])
+
+    def edge_added(self, node1_id, node2_id, attrs):
+        self.mark(node1_id)
+        self.mark(node2_id)
 
+    def edge_changed(self, node1_id, node2_id, old_attrs, attrs):
+        # Edge attributes are only stored with the source node
+        self.mark(node1_id)
 
+    def edge_removed(self, node1_id, node2_id, attrs):
+        self.mark(node1_id)
+        self.mark(node2_id)
 
+    def graph_cleared(self):
+        self.mark_all()
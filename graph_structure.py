@@ -1,5 +1,11 @@
 import networkx as nx
 from pprint import pprint
+from node_index import NodeIndex
+from edge_index import EdgeIndex
+from graph_statistics import GraphStatistics
+from column_store import ColumnStore
+from schema import Schema
+from result_cache import ResultCache
 
 class GraphStructure:
     """
@@ -20,6 +26,19 @@ class GraphStructure:
         self.id = start_id
         # Internal dictionary to store variables and values
         self.identifier = {}
+        # Objects notified about every mutation made to the graph
+        self.listeners = []
+        # Indexes of node and edge attribute values, see L{AttributeIndex}
+        self.node_index = NodeIndex(self)
+        self.edge_index = EdgeIndex(self)
+        # Statistics of the graph, notified before the listeners
+        self.statistics = GraphStatistics(self)
+        # Numeric node attributes in arrays, see L{ColumnStore}
+        self.columns = ColumnStore(self)
+        # Declared types of the attributes, see L{Schema}
+        self.schema = Schema(self)
+        # Results of the commands that read the graph, see L{ResultCache}
+        self.results = ResultCache(self)
 
     def get_graph(self):
         """
@@ -130,6 +149,45 @@ class GraphStructure:
             if self.identifier[key_val] == node:   
                 self.identifier.pop(key_val)    
 
+    def add_listener(self, listener):
+        """
+        Registers an object to be notified about mutations of the graph.
+        The listener may define any of the methods node_added, node_changed,
+        node_removed, edge_added, edge_changed, edge_removed and
+        graph_cleared. Methods that are not defined are skipped.
+
+        @type listener: Object
+        @param listener: Object to notify about graph mutations
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stops notifying the listener about mutations of the graph. If
+        the listener was never registered, nothing happens.
+
+        @type listener: Object
+        @param listener: Object previously passed to L{add_listener}
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, event, *args):
+        """
+        Calls the method named event with the given arguments on the
+        L{GraphStatistics} and on every registered listener that defines it.
+
+        @type event: String
+        @param event: Name of the listener method to call
+        @type args: Anything
+        @param args: Arguments describing the mutation
+        """
+        getattr(self.statistics, event)(*args)
+        for listener in self.listeners:
+            callback = getattr(listener, event, None)
+            if callback is not None:
+                callback(*args)
+
     def clear_all(self):   
         self.id = 0
         # Internal dictionary to store variables and values
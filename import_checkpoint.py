@@ -0,0 +1,79 @@
+import os
+
+
+class ImportCheckpoint:
+    """
+    Durable record of how far a bulk import by L{LoadData} got. The
+    checkpoint is saved right after the graph has been written to disk, so
+    a restarted import can skip the part of its input that is already part
+    of the snapshot. The checkpoint is a small text file with one
+    'name value' pair per line.
+    """
+
+    def __init__(self, checkpoint_file):
+        """
+        Takes the name of the file used to store the checkpoint.
+
+        @type checkpoint_file: String
+        @param checkpoint_file: File to store the checkpoint in
+        """
+        self.checkpoint_file = checkpoint_file
+
+    def load(self):
+        """
+        Reads the saved checkpoint.
+
+        @rtype: Dictionary or None
+        @return: Values passed to L{save}, or None if no checkpoint exists
+        """
+        if not os.path.isfile(self.checkpoint_file):
+            return None
+        checkpoint = {}
+        f = open(self.checkpoint_file, 'r')
+        for line in f:
+            name, value = line.rstrip('\n').split(' ', 1)
+            checkpoint[name] = value
+        f.close()
+        for name in ['source', 'offset', 'next_id', 'start_id', 'rows',
+            'edges']:
+            checkpoint[name] = int(checkpoint[name])
+        return checkpoint
+
+    def save(self, files, source, offset, next_id, start_id, rows, edges):
+        """
+        Saves a checkpoint and forces it to disk. The checkpoint is written
+        under a temporary name and then renamed, so a crash leaves either
+        the old or the new checkpoint.
+
+        @type files: String
+        @param files: Identifies the input files of the import
+        @type source: Integer
+        @param source: Position of the file being read in the input files
+        @type offset: Integer
+        @param offset: Byte offset in that file up to which it was imported
+        @type next_id: Integer
+        @param next_id: Unique id counter of the saved graph
+        @type start_id: Integer
+        @param start_id: Unique id counter before the import started
+        @type rows: Integer
+        @param rows: Number of rows imported
+        @type edges: Integer
+        @param edges: Number of edges imported
+        """
+        f = open(self.checkpoint_file + '.tmp', 'w')
+        f.write('files ' + files + '\n')
+        for name, value in [('source', source), ('offset', offset),
+            ('next_id', next_id), ('start_id', start_id), ('rows', rows),
+            ('edges', edges)]:
+            f.write(name + ' ' + str(value) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(self.checkpoint_file + '.tmp', self.checkpoint_file)
+
+    def remove(self):
+        """
+        Removes the checkpoint once the import has finished.
+        """
+        if os.path.isfile(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
@@ -0,0 +1,89 @@
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Default number of seconds between progress reports.
+PROGRESS_INTERVAL = 10
+
+
+class ImportProgress:
+    """
+    Reports the throughput of a bulk import by L{LoadData}. A line with
+    the rows and edges imported per second since the last report and the
+    memory used by the process is printed at most once per interval.
+    """
+
+    def __init__(self, interval=PROGRESS_INTERVAL, rows=0, edges=0):
+        """
+        Starts measuring the import.
+
+        @type interval: Number
+        @param interval: Seconds between reports
+        @type rows: Integer
+        @param rows: Number of rows imported before, when resuming
+        @type edges: Integer
+        @param edges: Number of edges imported before, when resuming
+        """
+        self.interval = interval
+        self.rows = rows
+        self.edges = edges
+        self.start = time.time()
+        self.start_rows = rows
+        self.start_edges = edges
+        # Counts and time of the last report
+        self.last = self.start
+        self.last_rows = rows
+        self.last_edges = edges
+
+    def update(self, rows, edges):
+        """
+        Adds imported rows and edges and reports the throughput if the
+        interval has passed.
+
+        @type rows: Integer
+        @param rows: Number of rows imported since the last update
+        @type edges: Integer
+        @param edges: Number of edges imported since the last update
+        """
+        self.rows += rows
+        self.edges += edges
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.report(self.last, self.last_rows, self.last_edges, now)
+            self.last = now
+            self.last_rows = self.rows
+            self.last_edges = self.edges
+
+    def finish(self):
+        """
+        Reports the average throughput of the whole import.
+        """
+        self.report(self.start, self.start_rows, self.start_edges,
+            time.time())
+
+    def report(self, since, rows, edges, now):
+        """
+        Prints the throughput since the given time and counts.
+        """
+        elapsed = max(now - since, 1e-6)
+        print ('Imported %d rows (%d rows/s), %d edges (%d edges/s), '
+            '%s' % (self.rows, (self.rows - rows) / elapsed, self.edges,
+            (self.edges - edges) / elapsed, self.memory()))
+
+    def memory(self):
+        """
+        Returns a description of the memory used by the process.
+
+        @rtype: String
+        @return: Peak resident set size, if known
+        """
+        if resource is None:
+            return 'RSS unknown'
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, OS X bytes
+        if sys.platform == 'darwin':
+            rss /= 1024
+        return 'peak RSS %d MB' % (rss / 1024)
@@ -1,6 +1,15 @@
 from query_evaluator import QueryEvaluator
 from bcolors import bcolors
 from predicates import Predicates
+from planner import Planner
+from bitmap import Bitmap, id_range
+from functools import partial
+from itertools import islice
+from result_cache import CACHED_COMMANDS
+
+# Nodes kept by ANDed predicates are checked one by one instead of through
+# the indexes once they are fewer than 1/SMALL_FRACTION of the candidates
+SMALL_FRACTION = 16
 
 class Linker:
     """ A basic linker class. """
@@ -68,24 +77,29 @@ class Linker:
         self.list_objects = object_list;
         self.gs = gs
         self.query_evaluator = QueryEvaluator(gs)   
-        self.pred = Predicates(gs)   
+        self.pred = Predicates(gs)
+        self.planner = Planner(gs)   
 
     def PrintNodes(self, nodes):   
         """
-        Prints a list of nodes.       
+        Prints a list of nodes. Each node is printed as soon as it is
+        generated.       
 
-        @type nodes: List 
+        @type nodes: Iterable 
         @param nodes: Node tuples to be printed.     
+        @rtype: List
+        @return: The printed node tuples
         """   
-        if nodes == []:   
+        printed = []
+        for node in nodes:  
+            if not printed:
+                print bcolors.OKGREEN + "NODE MATCHES:" + bcolors.ENDC   
+            printed.append(node)
+            print bcolors.OKBLUE + "Node " + str(len(printed)) + \
+            " = " + str(node) + bcolors.ENDC   
+        if not printed:   
             print bcolors.FAIL + "No matches found" + bcolors.ENDC
-        else:
-            print bcolors.OKGREEN + "NODE MATCHES:" + bcolors.ENDC   
-            node_num = 1
-            for node in nodes:  
-                print bcolors.OKBLUE + "Node " + str(node_num) + \
-                " = " + str(node) + bcolors.ENDC   
-                node_num += 1   
+        return printed
 
     def PrintNode_ids(self, node_ids):   
         """
@@ -102,23 +116,27 @@ class Linker:
 
     def PrintEdges(self, edges):   
         """
-        Prints a list of edges.       
+        Prints a list of edges. Each edge is printed as soon as it is
+        generated.       
 
-        @type edges: List 
+        @type edges: Iterable 
         @param edges: Edge tuples to be printed.     
+        @rtype: List
+        @return: The printed edge tuples
         """   
-        if edges == []:   
+        printed = []
+        for edge in edges:   
+            if not printed:
+                print bcolors.OKGREEN + "EDGE MATCHES:" + bcolors.ENDC
+            printed.append(edge)
+            edge_tup = (self.query_evaluator.get_node_attrs(
+                edge[0]), edge[2], 
+                self.query_evaluator.get_node_attrs(edge[1]))   
+            print bcolors.OKBLUE + "Edge " + str(len(printed)) + " = " + \
+            str(edge_tup) + bcolors.ENDC   
+        if not printed:   
             print bcolors.FAIL + "No matches found" + bcolors.ENDC
-        else:   
-            print bcolors.OKGREEN + "EDGE MATCHES:" + bcolors.ENDC
-            edge_num = 1   
-            for edge in edges:   
-                edge_tup = (self.query_evaluator.get_node_attrs(
-                    edge[0]), edge[2], 
-                    self.query_evaluator.get_node_attrs(edge[1]))   
-                print bcolors.OKBLUE + "Edge " + str(edge_num) + " = " + \
-                str(edge_tup) + bcolors.ENDC   
-                edge_num += 1         
+        return printed
 
     def CreateNode(self, attribute_list):   
         """
@@ -133,8 +151,10 @@ class Linker:
         for node in attribute_list:
             curr_id = node[1]   
             curr_attrs = node[2]
+            # The attributes are copied since the graph keeps the
+            # dictionary, and parsed commands can be executed again
             self.gs.set_identifier(curr_id, 
-                self.query_evaluator.add_node(curr_attrs))   
+                self.query_evaluator.add_node(dict(curr_attrs)))   
 
     def CreateEdge(self, attribute_list):   
         """
@@ -183,6 +203,22 @@ class Linker:
                 filtered_nodes.append(node)
         return filtered_nodes
 
+    def FilterPredNodes(self, predicates, nodes):   
+        """
+        Filters nodes by the predicates of one node of a query   
+
+        @type predicates: List 
+        @param predicates: List of predicate parsed objects     
+        @type nodes: List 
+        @param nodes: List of nodes   
+        @rtype: List
+        @return: Nodes that have the predicate attributes and satisfy the
+        predicates
+        """  
+        PredAttrs = self.getPredAttrs(predicates)
+        prednodes = self.PredNodeFilters(nodes, PredAttrs)   
+        return self.Filter_Preds(prednodes, predicates)
+
     def getPredAttrs (self, predicates):   
         """
         Get the list of predicate attributes from the predicates list    
@@ -198,7 +234,7 @@ class Linker:
             counter += 1   
         return PredAttrList
 
-    def MatchSingleItem(self, attribute_list, predicates):   
+    def MatchSingleItem(self, attribute_list, predicates, limit=None):   
         """
         Matches a single item, either a node or a relationship, by   
         calling the appropriate query_evaluator method.   
@@ -207,24 +243,26 @@ class Linker:
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".   
+        @type limit: Integer 
+        @param limit: Maximum number of results, or None
+        @rtype: Tuple or None
+        @return: Result of the match, see L{ResultCache.put}
         """   
         item = attribute_list[0] 
         curr_id = item[1]  
         if item[0] == "n:":   
-            nodes = self.query_evaluator.match_node(item[2])    
             if (predicates != []):   
-                PredAttrs = self.getPredAttrs(predicates[0])
-                prednodes = self.PredNodeFilters(nodes, PredAttrs)
-                filtered_nodes = self.Filter_Preds(prednodes, predicates[0])
-                self.gs.set_identifier(curr_id, filtered_nodes)
-                self.PrintNodes(filtered_nodes)   
-            else:   
-                self.gs.set_identifier(curr_id, nodes)
-                self.PrintNodes(nodes)
+                nodes = self.PredNodes(item[2], predicates[0])
+            else:
+                nodes = self.query_evaluator.iter_nodes(item[2])    
+            nodes = self.PrintNodes(islice(nodes, limit))
+            self.gs.set_identifier(curr_id, nodes)
+            return ("PrintNodes", nodes)
         elif item[0] == "e:":      
-            edges = self.query_evaluator.match(None, None, item[2])
+            edges = self.query_evaluator.iter_rels(item[2])
+            edges = self.PrintEdges(islice(edges, limit))
             self.gs.set_identifier(curr_id, edges)   
-            self.PrintEdges(edges)   
+            return ("PrintEdges", edges)
 
     def Filter_Preds(self, nodeids, predicates):   
         """
@@ -239,18 +277,21 @@ class Linker:
             return self.pred.filter(nodeids, predicates[0][0], 
                 predicates[0][2], predicates[0][1])   
         else:
-            lenpred = len(predicates)
-            counter = 0   
-            pred_list = []   
-            bool_list = []   
-            for item in predicates: 
-                if (counter) % 2 == 0:   
-                    pred_list.append(item)   
-                elif (counter) % 2 == 1:   
-                    bool_list.append(item)   
-                counter += 1     
+            pred_list, bool_list = self.splitPreds(predicates)
             return self.getFilteredNodes(nodeids, pred_list, bool_list)
 
+    def splitPreds(self, predicates):   
+        """
+        Splits the predicates of a node from the strings combining them     
+
+        @type predicates: List
+        @param predicates: Parsed predicate objects, alternating with the
+        AND, OR, AND NOT or OR NOT strings that combine them
+        @rtype: Tuple
+        @return: The list of predicates and the list of strings
+        """   
+        return predicates[0::2], predicates[1::2]
+
     def getFilteredNodes(self, nodeids, pred_list, bool_list):   
         """
         Given a list of the predicate objects and a list of boolean arguments,   
@@ -261,49 +302,113 @@ class Linker:
         @type pred_list: List
         @param pred_list: Predicates to filer on
         @type bool_list: List
-        @param bool_list: AND or OR strings to combine predicates  
+        @param bool_list: AND, OR, AND NOT or OR NOT strings to combine
+        predicates  
         """   
-        filtered_nodes = []  
-        for x in range(len(pred_list) - 1):   
+        ids = self.CombinePreds(None, nodeids, pred_list, bool_list)
+        nodes = self.gs.get_graph().node
+        return [(node_id, nodes[node_id]) for node_id in ids]
+
+    def CombinePreds(self, universe, nodeids, pred_list, bool_list):   
+        """
+        Combines predicates from left to right as bitmaps of the ids of the
+        nodes satisfying them, so every AND, OR and NOT works on whole
+        chunks of node ids at once.
+
+        @type universe: L{Bitmap} or None
+        @param universe: Ids of the nodes to filter, or None if they are
+        the nodes of nodeids   
+        @type nodeids: List or None
+        @param nodeids: Nodes to filter, or None if every predicate
+        attribute is indexed   
+        @type pred_list: List
+        @param pred_list: Predicates to filer on
+        @type bool_list: List
+        @param bool_list: AND, OR, AND NOT or OR NOT strings to combine
+        predicates  
+        @rtype: L{Bitmap}
+        @return: Ids of the nodes satisfying the predicates
+        """   
+        if set(bool_list) <= set(['AND']):
+            # Predicates that are all ANDed are applied from the most
+            # selective one, so the others only check the nodes kept
+            pred_list = sorted(pred_list, key=lambda pred: 
+                self.planner.comparison_fraction(pred[0], pred[1], pred[2]))
+        nodes = self.gs.get_graph().node
+        filtered = None
+        for x, pred in enumerate(pred_list):   
+            candidates = nodeids
+            if x > 0 and bool_list[x - 1] in ('AND', 'AND NOT') and \
+                (nodeids is not None or 
+                len(filtered) * SMALL_FRACTION < len(universe)):
+                # Only the nodes kept so far can be changed by the predicate
+                candidates = [(node_id, nodes[node_id]) for node_id in filtered
+                    if pred[0] in nodes[node_id]]
+            ids = self.pred.matching_ids(candidates, pred[0], pred[2], pred[1],
+                universe)
             if x == 0:   
-                pred0 = pred_list[x]   
-                pred1 = pred_list[x + 1]
-                filter1 = self.pred.filter(nodeids, 
-                    pred0[0], pred0[2], pred0[1]) 
-                filter2 = self.pred.filter(nodeids, 
-                    pred1[0], pred1[2], pred1[1])
-                if bool_list[x] == 'AND':      
-                    filtered_nodes = [val for val in filter1 if val in filter2]   
-                elif bool_list[x] == 'OR':   
-                    for fltr in filter2:   
-                        if fltr not in filter1:
-                            filter1.append(fltr)
-                    filtered_nodes = filter1    
-            else:   
-                pred = pred_list[x + 1]   
-                fltr = self.pred.filter(filtered_nodes, pred[0], 
-                    pred[2], pred[1])   
-                if bool_list[x] == 'AND':      
-                    filtered_nodes = [val for val in filtered_nodes 
-                    if val in fltr]   
-                elif bool_list[x] == 'OR':   
-                    filtered_nodes = list(set(filtered_nodes + fltr))
-        return filtered_nodes   
+                filtered = ids
+            elif bool_list[x - 1] == 'AND':      
+                filtered = filtered & ids
+            elif bool_list[x - 1] == 'OR':   
+                filtered = filtered | ids
+            elif bool_list[x - 1] == 'AND NOT':      
+                filtered = filtered - ids
+            elif bool_list[x - 1] == 'OR NOT':   
+                if universe is None:
+                    universe = Bitmap(node[0] for node in nodeids)
+                filtered = filtered | (universe - ids)
+        return filtered   
+
+    def PredNodes(self, node_attrs, predicates):   
+        """
+        Finds the nodes that have the node attributes and satisfy the
+        predicates of one node. If every predicate attribute is indexed or
+        has a column (see L{ColumnStore}), the predicates are answered from
+        the indexes and columns and combined with L{CombinePreds} without
+        looking at the other nodes.
+
+        @type node_attrs: Dictionary 
+        @param node_attrs: Node attributes to match
+        @type predicates: List 
+        @param predicates: List of predicate parsed objects     
+        @rtype: Iterable of tuples
+        @return: Node tuples of the format (node_id, node_attributes)
+        """   
+        PredAttrs = self.getPredAttrs(predicates)
+        index = self.gs.node_index
+        node_ids = index.lookup(node_attrs)
+        rows = self.gs.statistics.nodes if node_ids is None else len(node_ids)
+        if not all(attr in index.indexes or self.gs.columns.get(attr, rows) 
+            for attr in PredAttrs):
+            return self.query_evaluator.iter_filter(
+                self.query_evaluator.iter_nodes(node_attrs), 
+                partial(self.FilterPredNodes, predicates))
+        # The node attributes are checked again on the nodes found, so the
+        # candidates only have to be collected when there are few of them
+        if node_ids is None or \
+            len(node_ids) * SMALL_FRACTION >= self.gs.statistics.nodes:
+            universe = id_range(1, self.gs.get_id() + 1)
+        else:
+            universe = Bitmap(node_ids)
+        pred_list, bool_list = self.splitPreds(predicates)
+        ids = self.CombinePreds(universe, None, pred_list, bool_list)
+        return self.query_evaluator.iter_node_ids(ids, node_attrs, PredAttrs)
 
     def TwoItemsFilter(self, item, preds):   
-        nodes = self.query_evaluator.match_node(item[2])
-        PredAttrs = self.getPredAttrs(preds)
-        prednodes = self.PredNodeFilters(nodes, PredAttrs)
-        filtered_nodes = self.Filter_Preds(prednodes, preds)   
-        return filtered_nodes
+        return list(self.PredNodes(item[2], preds))
 
-    def MatchTwoItems(self, attribute_list, predicates):   
+    def MatchTwoItems(self, attribute_list, predicates, limit=None):   
         """
         Matches a pair of nodes and edges.     
 
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".  
+        @type limit: Integer 
+        @param limit: Maximum number of results, or None
+        @rtype: Tuple
+        @return: Result of the match, see L{ResultCache.put}
         """   
         item1 = attribute_list[0]   
         item2 = attribute_list[1]   
@@ -312,27 +417,29 @@ class Linker:
             filtered_nodes = None
             if (predicates != []):   
                 filtered_nodes = self.TwoItemsFilter(item1, predicates[0])   
-            edges = self.query_evaluator.match_node_rel(item1[2], item2[2], 
-                filtered_nodes)  
-            self.gs.set_identifier(curr_id, edges)   
-            self.PrintEdges(edges)   
+            edges = self.query_evaluator.iter_node_node_rel(item1[2], {}, 
+                item2[2], filtered_nodes)  
         else:   
             filtered_nodes = None   
             if (predicates != []):   
                 filtered_nodes = self.TwoItemsFilter(item2, predicates[0])      
-            edges = self.query_evaluator.match_node_rel(item2[2], item1[2], 
-                filtered_nodes)
-            self.gs.set_identifier(curr_id, edges)   
-            self.PrintEdges(edges)   
+            edges = self.query_evaluator.iter_node_node_rel(item2[2], {}, 
+                item1[2], filtered_nodes)
+        edges = self.PrintEdges(islice(edges, limit))
+        self.gs.set_identifier(curr_id, edges)   
+        return ("PrintEdges", edges)
 
-
-    def MatchThreeItems(self, attribute_list, predicates):   
+    def MatchThreeItems(self, attribute_list, predicates, limit=None):   
         """
         Matches a node, edge, node sequence in that order     
 
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".  
+        @type limit: Integer 
+        @param limit: Maximum number of results, or None
+        @rtype: Tuple
+        @return: Result of the match, see L{ResultCache.put}
         """   
         item1 = attribute_list[0]   
         item2 = attribute_list[1]   
@@ -347,10 +454,11 @@ class Linker:
                 filtered_nodes1 = self.TwoItemsFilter(item1, predicates[0])   
             else:   
                 filtered_nodes2 = self.TwoItemsFilter(item3, predicates[0]) 
-        edges = self.query_evaluator.match_node_node_rel(item1[2], item3[2], 
+        edges = self.query_evaluator.iter_node_node_rel(item1[2], item3[2], 
             item2[2], filtered_nodes1, filtered_nodes2)   
+        edges = self.PrintEdges(islice(edges, limit))
         self.gs.set_identifier(item1[1], edges)
-        self.PrintEdges(edges)   
+        return ("PrintEdges", edges)
 
     def getIdList(self, attribute_list):   
         """
@@ -389,13 +497,17 @@ class Linker:
         return PredOrder
 
 
-    def MatchChain(self, attribute_list, predicates):   
+    def MatchChain(self, attribute_list, predicates, limit=None):   
         """
         Matches a chain of node, edge, node, edge, node...     
 
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".  
+        @type limit: Integer 
+        @param limit: Maximum number of results, or None
+        @rtype: Tuple
+        @return: Result of the match, see L{ResultCache.put}
         """   
         counter = 0   
         node_attr_list = []   
@@ -408,18 +520,60 @@ class Linker:
             counter += 1   
         predOrder = []     
         filtered_nodes = [None] * len(node_attr_list)
+        node_filters = [None] * len(node_attr_list)
+        node_preds = {}
         if predicates != []:   
             predOrder = self.getPredOrder(attribute_list, predicates)  
-            for x in predOrder:   
-                nodes1 = self.query_evaluator.match_node(node_attr_list[x])   
-                PredAttrs1 = self.getPredAttrs(predicates[0])
-                prednodes1 = self.PredNodeFilters(nodes1, PredAttrs1)   
-                filtered_nodes1 = self.Filter_Preds(prednodes1, predicates[0])
-                filtered_nodes[x] = filtered_nodes1   
-                predicates.pop(0)
+            for pred_num, x in enumerate(predOrder):   
+                node_preds[x] = predicates[pred_num]
+        if limit is not None:
+            # The chains are followed one first node at a time until there
+            # are enough results, checking the predicates on the way
+            for x, node_pred in node_preds.iteritems():
+                node_filters[x] = partial(self.FilterPredNodes, node_pred)
+            nodes = list(islice(self.query_evaluator.iter_chain(
+                node_attr_list, edge_attr_list, filtered_nodes, node_filters), 
+                limit)) or None
+            self.PrintChain(attribute_list, nodes)
+            return ("PrintChainNodes", nodes)
+        # The planner chooses the node to expand the chain from, and which
+        # predicates filter the matching nodes before the expansion instead
+        # of the nodes the expansion reaches
+        start, prefiltered = self.planner.plan(node_attr_list, 
+            edge_attr_list, node_preds)
+        for x, node_pred in node_preds.iteritems():   
+            if x in prefiltered:
+                filtered_nodes[x] = list(self.PredNodes(node_attr_list[x], 
+                    node_pred))
+            else:
+                node_filters[x] = partial(self.FilterPredNodes, node_pred)
         nodes = self.query_evaluator.multi_match(node_attr_list, 
-            edge_attr_list, filtered_nodes)
+            edge_attr_list, filtered_nodes, start, node_filters)
+        self.PrintChain(attribute_list, nodes)
+        return ("PrintChainNodes", nodes)
+
+    def PrintChain(self, attribute_list, nodes):   
+        """
+        Stores and prints the first nodes of the chains matched by a chain.     
+
+        @type attribute_list: List 
+        @param attribute_list: List of parsed objects, where each
+        element is of the form "Type: Identifier dictionary_attributes".  
+        @type nodes: List 
+        @param nodes: (first node id, last node id) pairs of the matched
+        chains, or None if there are none
+        """   
         self.gs.set_identifier(attribute_list[0][1], nodes)      
+        self.PrintChainNodes(nodes)
+
+    def PrintChainNodes(self, nodes):   
+        """
+        Prints the first nodes of the chains matched by a chain.     
+
+        @type nodes: List 
+        @param nodes: (first node id, last node id) pairs of the matched
+        chains, or None if there are none
+        """   
         if nodes == None:   
              print bcolors.FAIL + "No matches found" + bcolors.ENDC  
         else:
@@ -432,7 +586,7 @@ class Linker:
                 " = " + str(node_tup) + bcolors.ENDC   
                 node_num += 1      
 
-    def GeneralMatch(self, attribute_list, predicates):   
+    def GeneralMatch(self, attribute_list, predicates, limit=None):   
         """
         Calls the corresponding match function to match a set of ndoes     
 
@@ -441,15 +595,19 @@ class Linker:
         element is of the form "Type: Identifier dictionary_attributes".   
         @type predicates: List 
         @param predicates: List of parsed predicate objects  
+        @type limit: Integer 
+        @param limit: Maximum number of results, or None
+        @rtype: Tuple or None
+        @return: Result of the match, see L{ResultCache.put}
         """   
         if (len(attribute_list) == 1):   
-            self.MatchSingleItem(attribute_list, predicates)      
+            return self.MatchSingleItem(attribute_list, predicates, limit)      
         elif(len(attribute_list) == 2):      
-            self.MatchTwoItems(attribute_list, predicates)
+            return self.MatchTwoItems(attribute_list, predicates, limit)
         elif(len(attribute_list) == 3):   
-            self.MatchThreeItems(attribute_list, predicates)  
+            return self.MatchThreeItems(attribute_list, predicates, limit)  
         else:   
-            self.MatchChain(attribute_list, predicates)   
+            return self.MatchChain(attribute_list, predicates, limit)   
 
     def ModifyNode(self, attribute_list, predicates):   
         """
@@ -502,19 +660,35 @@ class Linker:
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".   
+        @rtype: Tuple
+        @return: Result of the check, see L{ResultCache.put}
         """   
         item1 = attribute_list[0]   
         item2 = attribute_list[1]   
         nodes1 = self.query_evaluator.match(item1[2], None, None)   
         nodes2 = self.query_evaluator.match(item2[2], None, None)      
+        paths = []
         for node1 in nodes1:   
             for node2 in nodes2:   
-                if (self.query_evaluator.check_path(node1[0], node2[0])):   
-                    print bcolors.OKBLUE + "A path exists between " \
-                    + str(node1) + " and " + str(node2) + bcolors.ENDC   
-                else:   
-                    print bcolors.FAIL + "No path exists between " \
-                    + str(node1) + " and " + str(node2) + bcolors.ENDC   
+                paths.append((node1, node2, 
+                    self.query_evaluator.check_path(node1[0], node2[0])))
+        self.PrintPaths(paths)
+        return ("PrintPaths", paths)
+
+    def PrintPaths(self, paths):   
+        """
+        Prints whether paths exist between pairs of nodes.      
+
+        @type paths: List 
+        @param paths: Tuples of the format (node1, node2, path exists)
+        """   
+        for node1, node2, exists in paths:   
+            if exists:   
+                print bcolors.OKBLUE + "A path exists between " \
+                + str(node1) + " and " + str(node2) + bcolors.ENDC   
+            else:   
+                print bcolors.FAIL + "No path exists between " \
+                + str(node1) + " and " + str(node2) + bcolors.ENDC   
 
     def ShortestPath(self, attribute_list):   
         """
@@ -523,27 +697,44 @@ class Linker:
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".   
+        @rtype: Tuple
+        @return: Result of the search, see L{ResultCache.put}
         """   
         item1 = attribute_list[0]   
         item2 = attribute_list[1]   
         nodes1 = self.query_evaluator.match(item1[2], None, None)   
         nodes2 = self.query_evaluator.match(item2[2], None, None)   
+        paths = []
         for node1 in nodes1:   
             for node2 in nodes2:   
+                path = None
                 if (self.query_evaluator.check_path(node1[0], node2[0])):
-                    path_list = self.query_evaluator.get_shortest_path\
-                    (node1[0], node2[0])
-                    print bcolors.OKGREEN \
-                    + "The nodes in the path between " + str(node1) \
-                    + " and " + str(node2) + " are: " + bcolors.ENDC    
-                    for node_id in path_list:   
-                        print bcolors.OKBLUE \
-                        + str((node_id, 
-                            self.query_evaluator.get_node_attrs\
-                            (node_id))) + bcolors.ENDC     
-                else:   
-                    print bcolors.FAIL + "No path exists between " + \
-                    str(node1)+ " and " + str(node2) + bcolors.ENDC   
+                    path = [(node_id, 
+                        self.query_evaluator.get_node_attrs(node_id)) 
+                        for node_id in self.query_evaluator.\
+                        get_shortest_path(node1[0], node2[0])]
+                paths.append((node1, node2, path))
+        self.PrintShortestPaths(paths)
+        return ("PrintShortestPaths", paths)
+
+    def PrintShortestPaths(self, paths):   
+        """
+        Prints the nodes of the shortest paths between pairs of nodes.      
+
+        @type paths: List 
+        @param paths: Tuples of the format (node1, node2, path), where the
+        path is a list of node tuples, or None if there is no path
+        """   
+        for node1, node2, path in paths:   
+            if path is not None:
+                print bcolors.OKGREEN \
+                + "The nodes in the path between " + str(node1) \
+                + " and " + str(node2) + " are: " + bcolors.ENDC    
+                for node in path:   
+                    print bcolors.OKBLUE + str(node) + bcolors.ENDC     
+            else:   
+                print bcolors.FAIL + "No path exists between " + \
+                str(node1)+ " and " + str(node2) + bcolors.ENDC   
 
     def getNeighbors(self, attribute_list):   
         """
@@ -552,25 +743,41 @@ class Linker:
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".   
+        @rtype: Tuple
+        @return: Result of the lookup, see L{ResultCache.put}
         """   
         item1 = attribute_list[0]   
         nodes = self.query_evaluator.match(item1[2], None, None)   
-        if nodes == None:   
+        neighbor_lists = None
+        if nodes != None:   
+            neighbor_lists = []
+            for node1 in nodes:           
+                neighbor_ids = self.query_evaluator.get_neighbors(node1[0])   
+                neighbor_lists.append([(neighbor_id, 
+                    self.query_evaluator.get_node_attrs(neighbor_id)) 
+                    for neighbor_id in neighbor_ids])
+        self.PrintNeighbors(neighbor_lists)
+        return ("PrintNeighbors", neighbor_lists)
+
+    def PrintNeighbors(self, neighbor_lists):   
+        """
+        Prints the neighbors of nodes.      
+
+        @type neighbor_lists: List 
+        @param neighbor_lists: List of the neighbor node tuples of every
+        node, or None if no node matched
+        """   
+        if neighbor_lists == None:   
             print bcolors.FAIL + "No Node matches found" + bcolors.ENDC   
         else:   
             print bcolors.OKGREEN + "NODE Neighbors:" + bcolors.ENDC   
             node_num = 1       
-            for node1 in nodes:           
-                neighbor_ids = self.query_evaluator.get_neighbors(node1[0])   
-                if (neighbor_ids == []): 
+            for neighbors in neighbor_lists:           
+                if (neighbors == []): 
                     print bcolors.FAIL + "Neighbors for Node " + \
                     str(node_num) + " = " + "No neighbors for Node(s)" + \
                     bcolors.ENDC   
                 else:   
-                    neighbors = []   
-                    for neighbor_id in neighbor_ids:
-                        neighbors.append((neighbor_id, 
-                            self.query_evaluator.get_node_attrs(neighbor_id)))   
                     print bcolors.OKBLUE + "Neighbors for Node " + \
                     str(node_num) + " = " + str(neighbors) + bcolors.ENDC   
             node_num += 1   
@@ -582,20 +789,148 @@ class Linker:
         @type attribute_list: List 
         @param attribute_list: List of parsed objects, where each
         element is of the form "Type: Identifier dictionary_attributes".   
+        @rtype: Tuple
+        @return: Result of the check, see L{ResultCache.put}
         """   
         item1 = attribute_list[0]   
         item2 = attribute_list[1]   
         nodes1 = self.query_evaluator.match(item1[2], None, None)   
         nodes2 = self.query_evaluator.match(item2[2], None, None)      
+        edges = []
         for node1 in nodes1:   
             for node2 in nodes2:   
-                if (self.query_evaluator.check_path(node1[0], node2[0])):   
-                    print bcolors.OKBLUE + \
-                    "A direct edge exists between " + str(node1) + \
-                    " and " + str(node2) + bcolors.ENDC   
-                else:   
-                    print bcolors.FAIL + "No direct edge exists between " + \
-                    str(node1) + " and " + str(node2) + bcolors.ENDC 
+                edges.append((node1, node2, 
+                    self.query_evaluator.check_path(node1[0], node2[0])))
+        self.PrintHasEdges(edges)
+        return ("PrintHasEdges", edges)
+
+    def PrintHasEdges(self, edges):   
+        """
+        Prints whether direct edges exist between pairs of nodes.      
+
+        @type edges: List 
+        @param edges: Tuples of the format (node1, node2, edge exists)
+        """   
+        for node1, node2, exists in edges:   
+            if exists:   
+                print bcolors.OKBLUE + \
+                "A direct edge exists between " + str(node1) + \
+                " and " + str(node2) + bcolors.ENDC   
+            else:   
+                print bcolors.FAIL + "No direct edge exists between " + \
+                str(node1) + " and " + str(node2) + bcolors.ENDC 
+
+    def getIndex(self, item):
+        """
+        Returns the index of node or edge attributes, depending on
+        the type of the parsed object.
+
+        @type item: List
+        @param item: Parsed object of the form "Type: Identifier
+        dictionary_attributes"
+        @rtype: L{AttributeIndex} object
+        @return: Index of the attributes of that type
+        """
+        if item[0] == "e:":
+            return self.gs.edge_index
+        return self.gs.node_index
+
+    def CreateIndex(self, attribute_list):
+        """
+        Indexes the values of the node or edge attributes named in the
+        parsed attribute list.
+
+        @type attribute_list: List 
+        @param attribute_list: List of parsed objects, where each
+        element is of the form "Type: Identifier dictionary_attributes"
+        and the identifier is the name of an attribute.
+        """
+        for item in attribute_list:
+            if self.getIndex(item).create(item[1]):
+                print bcolors.OKGREEN + "Created index on " + item[1] + \
+                    bcolors.ENDC
+            else:
+                print bcolors.FAIL + item[1] + " is already indexed" + \
+                    bcolors.ENDC
+
+    def DropIndex(self, attribute_list):
+        """
+        Stops indexing the node or edge attributes named in the
+        parsed attribute list.
+
+        @type attribute_list: List 
+        @param attribute_list: List of parsed objects, where each
+        element is of the form "Type: Identifier dictionary_attributes"
+        and the identifier is the name of an attribute.
+        """
+        for item in attribute_list:
+            if self.getIndex(item).drop(item[1]):
+                print bcolors.OKGREEN + "Dropped index on " + item[1] + \
+                    bcolors.ENDC
+            else:
+                print bcolors.FAIL + item[1] + " is not indexed" + \
+                    bcolors.ENDC
+
+    def Stats(self, attribute_list):
+        """
+        Prints the statistics of the graph and of the L{ResultCache}, or
+        of the node or edge attributes named in the parsed attribute list.
+
+        @type attribute_list: List 
+        @param attribute_list: List of parsed objects, where each
+        element is of the form "Type: Identifier dictionary_attributes"
+        and the identifier is the name of an attribute.
+        """
+        lines = []
+        if not attribute_list:
+            lines = self.gs.statistics.report() + [str(self.gs.results)]
+        for item in attribute_list:
+            lines += self.gs.statistics.report(item)
+        for line in lines:
+            print bcolors.OKBLUE + line + bcolors.ENDC
+
+    def Schema(self, attribute_list):
+        """
+        Declares the types of the node or edge attributes in the parsed
+        attribute list, or prints the declared types if there are none.
+
+        @type attribute_list: List 
+        @param attribute_list: List of parsed objects, where each
+        element is of the form "Type: Identifier dictionary_attributes"
+        and the attribute values are the names of the types.
+        """
+        if not attribute_list:
+            for line in self.gs.schema.report():
+                print bcolors.OKBLUE + line + bcolors.ENDC
+        for item in attribute_list:
+            for attr, type_name in sorted(item[2].iteritems()):
+                try:
+                    count = self.gs.schema.declare(item[0], attr, type_name)
+                except ValueError as e:
+                    print bcolors.FAIL + "Cannot declare " + attr + \
+                        " as " + type_name + ": " + str(e) + bcolors.ENDC
+                    continue
+                print bcolors.OKGREEN + "Declared " + attr + " as " + \
+                    type_name + ", converted " + str(count) + " values" + \
+                    bcolors.ENDC
+
+    def TypedAttributes(self, obj):
+        """
+        Returns the attribute list of a command with the values converted
+        to the types declared for them, see L{Schema.convert}.
+
+        @type obj: L{Command_Struct} object
+        @param obj: Command to execute
+        @rtype: List or None
+        @return: The attribute list, or None if a value does not have the
+        declared type
+        """
+        try:
+            return self.gs.schema.convert(obj.get_attr_list())
+        except ValueError as e:
+            print bcolors.FAIL + "ERROR in command " + obj.get_command() + \
+                ": " + str(e) + bcolors.ENDC
+            return None
 
     def execute(self):
         """
@@ -603,38 +938,94 @@ class Linker:
         """
         # iterate through objects returned by parser to execute queries
         for obj in self.list_objects:
-            command_name = obj.get_command()
-            attribute_list = obj.get_attr_list()   
-            predicates = obj.get_names()
-            if command_name == "CREATE":
-                self.CreateNode(attribute_list)   
-            elif command_name == "CREATEEDGE":   
-                self.CreateEdge(attribute_list)   
-            elif command_name == "MATCH":   
-                self.GeneralMatch(attribute_list, predicates)
-            elif command_name == "MODIFYNODE":   
-                self.ModifyNode(attribute_list, predicates)    
-            elif command_name == "MODIFYEDGE":   
-                self.ModifyEdge(attribute_list, predicates)
-            elif command_name == "DELETENODE":   
-                node_deleted = attribute_list[0]   
-                self.query_evaluator.delete_node(node_deleted[2])   
-            elif command_name == "DELETEEDGE":   
-                edge_deleted = attribute_list[0]   
-                self.query_evaluator.delete_rel(edge_deleted[2])   
-            elif command_name == "RETURN":  
-                self.ReturnIdent(attribute_list)   
-            elif command_name == "HASPATH":   
-                self.HasPath(attribute_list)
-            elif command_name == "CLEAR":   
-                self.query_evaluator.clear()   
-            elif command_name == "SHORTESTPATH":   
-                self.ShortestPath(attribute_list)
-            elif command_name == "SHOW":
-                self.gs.display()
-            elif command_name == "VISUALIZE":
-                self.query_evaluator.create_visual()   
-            elif command_name == "NEIGHBOR":
-                self.getNeighbors(attribute_list)
-            elif command_name == "HASEDGE":   
-                self.HasEdge(attribute_list)
\ No newline at end of file
+            self.execute_command(obj)
+
+    def execute_command(self, obj):
+        """
+        Executes a single command extracted by the parser.
+
+        @type obj: L{Command_Struct} object
+        @param obj: Command to execute
+        """
+        command_name = obj.get_command()
+        attribute_list = obj.get_attr_list()   
+        if command_name != "SCHEMA":
+            attribute_list = self.TypedAttributes(obj)
+            if attribute_list is None:
+                return
+        # Commands that only read the graph repeat their cached result
+        # while the graph does not change
+        if command_name in CACHED_COMMANDS:
+            results = self.gs.results
+            results.run(results.key(obj, attribute_list), self.run_command,
+                self.PrintResult, obj, attribute_list)
+        else:
+            self.run_command(obj, attribute_list)
+
+    def PrintResult(self, result):
+        """
+        Prints a result of a command again, see L{ResultCache}.
+
+        @type result: Tuple
+        @param result: Name of the method printing the result, and the rows
+        it prints
+        """
+        printer, rows = result
+        getattr(self, printer)(rows)
+
+    def run_command(self, obj, attribute_list):
+        """
+        Runs a single command extracted by the parser.
+
+        @type obj: L{Command_Struct} object
+        @param obj: Command to run
+        @type attribute_list: List
+        @param attribute_list: Attribute list of the command, with the
+        values converted to their declared types
+        @rtype: Tuple or None
+        @return: Result of a command that only reads the graph, see
+        L{ResultCache.put}
+        """
+        command_name = obj.get_command()
+        predicates = obj.get_names()
+        if command_name == "CREATE":
+            self.CreateNode(attribute_list)   
+        elif command_name == "CREATEEDGE":   
+            self.CreateEdge(attribute_list)   
+        elif command_name == "MATCH":   
+            return self.GeneralMatch(attribute_list, predicates, 
+                obj.get_limit())
+        elif command_name == "MODIFYNODE":   
+            self.ModifyNode(attribute_list, predicates)    
+        elif command_name == "MODIFYEDGE":   
+            self.ModifyEdge(attribute_list, predicates)
+        elif command_name == "DELETENODE":   
+            node_deleted = attribute_list[0]   
+            self.query_evaluator.delete_node(node_deleted[2])   
+        elif command_name == "DELETEEDGE":   
+            edge_deleted = attribute_list[0]   
+            self.query_evaluator.delete_rel(edge_deleted[2])   
+        elif command_name == "RETURN":  
+            self.ReturnIdent(attribute_list)   
+        elif command_name == "HASPATH":   
+            return self.HasPath(attribute_list)
+        elif command_name == "CLEAR":   
+            self.query_evaluator.clear()   
+        elif command_name == "SHORTESTPATH":   
+            return self.ShortestPath(attribute_list)
+        elif command_name == "SHOW":
+            self.gs.display()
+        elif command_name == "VISUALIZE":
+            self.query_evaluator.create_visual()   
+        elif command_name == "NEIGHBOR":
+            return self.getNeighbors(attribute_list)
+        elif command_name == "HASEDGE":   
+            return self.HasEdge(attribute_list)
+        elif command_name == "CREATEINDEX":
+            self.CreateIndex(attribute_list)
+        elif command_name == "DROPINDEX":
+            self.DropIndex(attribute_list)
+        elif command_name == "STATS":
+            self.Stats(attribute_list)
+        elif command_name == "SCHEMA":
+            self.Schema(attribute_list)
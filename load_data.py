@@ -1,8 +1,230 @@
+import gc
+import os
+import sys
+import csv
+import multiprocessing
+from array import array
+from itertools import izip, islice, repeat, count
 from query_evaluator import QueryEvaluator
 from graph_structure import GraphStructure
-from graph_storage import GraphStorage
+from graph_storage import GraphStorage, LOAD_PROCESSES
 from utilities import Utilities
+from write_ahead_log import WriteAheadLog
+from import_checkpoint import ImportCheckpoint
+from import_progress import ImportProgress, PROGRESS_INTERVAL
+from schema import infer_value
 
+# Approximate number of bytes of the text file loaded at a time.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of rows of a CSV file loaded at a time.
+BATCH_SIZE = 100000
+
+# Stands for the end of a line among the words of a range, see parse_range
+LINE_END = '\x01'
+
+# Number of rows imported between two checkpoints of an import.
+CHECKPOINT_ROWS = 5000000
+
+# Types a CSV column can be read as, from the most to the least specific.
+# A column gets the first type every value in it can be converted to, and
+# the values of other columns are typed one by one like the values of
+# commands.
+COLUMN_TYPES = [int, float, infer_value]
+
+
+def split_file(text_file, chunk_size, start=0):
+    """
+    Splits a text file into byte ranges of about chunk_size bytes that
+    start and end at line boundaries.
+
+    @type text_file: String
+    @param text_file: File to split
+    @type chunk_size: Integer
+    @param chunk_size: Approximate number of bytes in a range
+    @type start: Integer
+    @param start: Byte offset of a line to start the first range at
+    @rtype: List
+    @return: Tuples of (start offset, end offset) covering the rest of
+    the file
+    """
+    size = os.path.getsize(text_file)
+    ranges = []
+    f = open(text_file, 'rb')
+    while start < size:
+        f.seek(min(start + chunk_size, size))
+        # Moves the end of the range past the line it falls into
+        f.readline()
+        end = min(f.tell(), size)
+        ranges.append((start, end))
+        start = end
+    f.close()
+    return ranges
+
+
+def parse_range(args):
+    """
+    Parses the edges in a byte range of a text file. Used by the worker
+    processes that parse a file in parallel, so the result is kept
+    compact: the node names of the range are numbered locally and the
+    edges refer to these local numbers.
+
+    @type args: Tuple
+    @param args: Name of the text file, start offset and end offset
+    @rtype: Tuple
+    @return: List of node names, and the packed int arrays of the local
+    numbers of the edge sources and targets
+    """
+    text_file, start, end = args
+    f = open(text_file, 'rb')
+    f.seek(start)
+    data = f.read(end - start)
+    f.close()
+
+    if not data.endswith('\n'):
+        data += '\n'
+    # Every line of the range holds exactly one edge if its words are two
+    # names followed by a line end, over and over
+    words = data.replace('\n', ' ' + LINE_END + ' ').split()
+    line_ends = words[2::3]
+    if len(words) % 3 == 0 and words.count(LINE_END) == len(line_ends) \
+        and line_ends.count(LINE_END) == len(line_ends) and '#' not in data:
+        # The whole range is numbered at once
+        del words[2::3]
+        names = list(set(words))
+        local_ids = dict(izip(names, count()))
+        numbers = map(local_ids.__getitem__, words)
+        sources = array('i', numbers[0::2])
+        targets = array('i', numbers[1::2])
+    else:
+        local_ids = {}
+        sources = array('i')
+        targets = array('i')
+        for line in data.split('\n'):
+            # Skips commented and empty lines in text file
+            if not line or line[0] == '#':
+                continue
+            # Lines without two names hold no edge, names after the
+            # first two are ignored
+            line = line.split()
+            if len(line) < 2:
+                continue
+            sources.append(local_ids.setdefault(line[0], len(local_ids)))
+            targets.append(local_ids.setdefault(line[1], len(local_ids)))
+        names = [None] * len(local_ids)
+        for name, i in local_ids.iteritems():
+            names[i] = name
+    # Arrays are pickled as lists, strings are passed between processes
+    # much faster
+    return names, sources.tostring(), targets.tostring()
+
+
+def csv_delimiter(filename):
+    """
+    Returns the delimiter used by a CSV file, which is a tab for files
+    ending in .tsv or .tab and a comma otherwise.
+
+    @type filename: String
+    @param filename: Name of the CSV file
+    @rtype: String
+    @return: Delimiter of the columns
+    """
+    if os.path.splitext(filename)[1].lower() in ('.tsv', '.tab'):
+        return '\t'
+    return ','
+
+
+def infer_column_types(csv_file, delimiter):
+    """
+    Reads a CSV file with a header and finds the most specific type of
+    L{COLUMN_TYPES} that every value of a column can be converted to.
+    Empty values are ignored.
+
+    @type csv_file: String
+    @param csv_file: Name of the CSV file
+    @type delimiter: String
+    @param delimiter: Delimiter of the columns
+    @rtype: Tuple
+    @return: Column names from the header and the type of every column
+    """
+    f = open(csv_file, 'rb')
+    reader = csv.reader(f, delimiter=delimiter)
+    header = [name.strip() for name in reader.next()]
+    types = [0] * len(header)
+    # Columns that may still turn out to hold a more general type
+    columns = range(len(header))
+    last = len(COLUMN_TYPES) - 1
+    for row in reader:
+        for i in columns:
+            if i >= len(row) or row[i] == '':
+                continue
+            while types[i] < last:
+                try:
+                    COLUMN_TYPES[types[i]](row[i])
+                    break
+                except ValueError:
+                    types[i] += 1
+        columns = [i for i in columns if types[i] < last]
+    f.close()
+    return header, [COLUMN_TYPES[t] for t in types]
+
+
+def read_csv_rows(csv_file, delimiter, header, types, batch_size, offset=0):
+    """
+    Reads a CSV file with a header in batches of rows. Every row is
+    returned as the raw values of its first two columns and a dictionary
+    of its typed values, keyed by the column names. Empty values and
+    columns without a type are left out of the dictionary.
+
+    @type csv_file: String
+    @param csv_file: Name of the CSV file
+    @type delimiter: String
+    @param delimiter: Delimiter of the columns
+    @type header: List
+    @param header: Column names
+    @type types: List
+    @param types: Type of every column, or None for columns that are not
+    stored
+    @type batch_size: Integer
+    @param batch_size: Number of rows in a batch
+    @type offset: Integer
+    @param offset: Byte offset of the first row to read, or 0 to read the
+    file from the row after the header
+    @rtype: Generator
+    @return: Tuples of a list of (first value, second value, attributes)
+    tuples and the byte offset just past the last row of the batch
+    """
+    f = open(csv_file, 'rb')
+    # Byte offset just past the lines handed to the reader. The reader
+    # only reads the lines of the row it returns, so this is exact.
+    position = [0]
+    def lines():
+        for line in iter(f.readline, ''):
+            position[0] += len(line)
+            yield line
+    reader = csv.reader(lines(), delimiter=delimiter)
+    reader.next()
+    if offset:
+        f.seek(offset)
+        position[0] = offset
+    columns = zip(header, types)
+    try:
+        while True:
+            batch = []
+            for row in islice(reader, batch_size):
+                if not row:
+                    continue
+                attrs = {}
+                for (name, column_type), value in izip(columns, row):
+                    if value != '' and column_type is not None:
+                        attrs[name] = column_type(value)
+                batch.append((row[0], row[1] if len(row) > 1 else None, 
+                    attrs))
+            if not batch:
+                break
+            yield batch, position[0]
+    finally:
+        f.close()
 
 
 class LoadData:
@@ -25,8 +247,14 @@ class LoadData:
         # Loads data on disk
         self.graph_file = 'graph_file'
         self.id_file = 'id_file'
+        self.wal = WriteAheadLog('wal_file')
         self.load_data()
 
+        # Records how far an import got, so it can resume after a crash
+        self.checkpoint = ImportCheckpoint('import_file')
+        self.checkpoint_rows = CHECKPOINT_ROWS
+        self.progress_interval = PROGRESS_INTERVAL
+
         # Sets up a QueryEvaluator object to perform the loading operations
         self.q_eval = QueryEvaluator(gs)
 
@@ -36,51 +264,344 @@ class LoadData:
         object.
         """
         if Utilities.files_exist(self.graph_file, self.id_file):
-            self.gstorage.load_graph(self.graph_file, self.id_file)
+            self.gstorage.load_graph(self.graph_file, self.id_file,
+                LOAD_PROCESSES)
+        self.wal.replay(self.gs)
 
 
-    def load_text_file(self, text_file):
+    def load_text_file(self, text_file, chunk_size=CHUNK_SIZE, processes=1,
+        resume=True):
         """
         Loads the data from the text file into the in memory graph 
         structure stored in the L{QueryEvaluator} object and saves the
         data onto disk.
+
+        The file is split into byte ranges at line boundaries, so only the
+        nodes and edges of a few ranges are held outside the graph at a
+        time. With more than one process, the ranges are parsed by a pool
+        of worker processes while the ranges parsed before are added to
+        the graph. New nodes of a range get their ids in one step and the
+        edges are inserted with the bulk methods of the L{QueryEvaluator}.
+
+        @type text_file: String
+        @param text_file: File with one tab separated edge per line
+        @type chunk_size: Integer
+        @param chunk_size: Approximate number of bytes parsed at a time
+        @type processes: Integer
+        @param processes: Number of processes parsing the file
+        @type resume: Boolean
+        @param resume: If true, an import of the same file that was
+        interrupted continues from its last checkpoint
         """
-        # Stores a set of nodes and edges
-        node = set()
-        edge = set()
+        self.bulk_load(self.load_ranges, [text_file], resume, chunk_size,
+            processes)
 
-        f = open(text_file, 'r')
-        for line in f:
-            # Skips commented lines in text file
-            if line[0] == '#':
-                continue
-            # Stores nodes and edges in our set data structure
-            line = line.strip().split('\t')
-            node1, node2 = line[0], line[1]
-            node.add(node1)
-            node.add(node2)
-            edge.add((node1, node2))
+    def load_csv_files(self, node_file=None, edge_file=None, delimiter=None,
+        batch_size=BATCH_SIZE, resume=True):
+        """
+        Loads nodes and edges from CSV files into the in memory graph
+        structure and saves the data onto disk.
 
-        f.close()
+        Both files start with a header naming their columns. Every row of
+        the node file is a node, whose first column is the key edges refer
+        to the node by; rows without a key are skipped. Every row of the
+        edge file is an edge from the node with the key in the first column
+        to the node with the key in the second column. All columns of the
+        node file and all but the first two columns of the edge file are
+        stored as attributes. Values are stored as ints if every value of
+        their column is an int, as floats if every value is a number, and
+        otherwise typed one by one like the values of commands, see
+        L{infer_value}; empty values are left out. Nodes only named
+        in the edge file are created with just their key.
 
-        # Stores return value when a node is added
-        node_dict = {}
+        @type node_file: String
+        @param node_file: CSV file with one node per row, or None
+        @type edge_file: String
+        @param edge_file: CSV file with one edge per row, or None
+        @type delimiter: String
+        @param delimiter: Delimiter of the columns, by default a tab for
+        files ending in .tsv or .tab and a comma otherwise
+        @type batch_size: Integer
+        @param batch_size: Number of rows added to the graph at a time
+        @type resume: Boolean
+        @param resume: If true, an import of the same files that was
+        interrupted continues from its last checkpoint
+        """
+        self.bulk_load(self.load_csv_rows, [node_file, edge_file], resume,
+            delimiter, batch_size)
 
-        # Adds node and edges between the nodes in our graph database
-        for n in node:
-            n1 = self.q_eval.add_node({'id' : n})
-            node_dict[n] = n1
+    def bulk_load(self, load, files, resume, *args):
+        """
+        Calls the load function, which adds the data in the files to the
+        graph with the bulk methods of the L{QueryEvaluator}, and then saves
+        the graph onto disk. The loaded data is not written to the log;
+        instead the graph is saved every L{checkpoint_rows} rows together
+        with an L{ImportCheckpoint}, so an interrupted import can resume.
+
+        The load function is called with the position of the file to start
+        reading in the files, the byte offset to start reading that file
+        at, an empty dictionary for the node ids keyed by the node keys used
+        in the files, and the given arguments. If the import is resumed it
+        must first fill the dictionary with L{imported_nodes}, since rows
+        after the checkpoint may already be in the graph. It must call
+        L{imported} after each batch of rows it added to the graph.
+
+        @type load: Function
+        @param load: Function adding the data to the graph
+        @type files: List
+        @param files: Input files of the import, or None for unused ones
+        @type resume: Boolean
+        @param resume: If true, continues an interrupted import of the
+        same files
+        @type args: Anything
+        @param args: Arguments passed to the load function
+        """
+        self.files = '\t'.join([os.path.abspath(f) if f else '' 
+            for f in files])
+        checkpoint = self.checkpoint.load()
+        if checkpoint is not None and checkpoint['files'] != self.files:
+            checkpoint = None
+        # A resumed import first finds the nodes it already created, since
+        # the graph may have been written after the checkpoint was saved
+        self.resumed = resume and checkpoint is not None
+        if self.resumed and self.gs.get_id() < checkpoint['next_id']:
+            # The graph is older than the checkpoint, so the rows since
+            # its snapshot were lost and the input is read again
+            print 'Restarting import, the graph is older than its checkpoint.'
+            self.start_id = checkpoint['start_id']
+            source, offset, rows, edges = 0, 0, 0, 0
+        elif self.resumed:
+            print ('Resuming import from row ' + str(checkpoint['rows']) +
+                ' of the input.')
+            self.start_id = checkpoint['start_id']
+            source, offset = checkpoint['source'], checkpoint['offset']
+            rows, edges = checkpoint['rows'], checkpoint['edges']
+        else:
+            self.start_id = self.gs.get_id()
+            source, offset, rows, edges = 0, 0, 0, 0
+            # Remembers which nodes belong to the import before any of
+            # them can reach the disk
+            self.checkpoint.save(self.files, 0, 0, self.start_id,
+                self.start_id, 0, 0)
+        self.progress = ImportProgress(self.progress_interval, rows, edges)
+        self.checkpoint_at = rows + self.checkpoint_rows
 
-        for node1,node2 in edge:
-            self.q_eval.add_relationship(node_dict[node1], node_dict[node2], {})
+        # The storage is told which segments changed by imported instead
+        # of tracking the changes one by one
+        self.gs.remove_listener(self.gstorage)
+        # The load creates millions of dictionaries but no reference
+        # cycles, so the cycle collector would only slow it down
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            load(source, offset, {}, *args)
+        except:
+            # Changes of the last batch may not have been marked
+            self.gstorage.mark_all()
+            raise
+        finally:
+            if gc_enabled:
+                gc.enable()
+            self.gs.add_listener(self.gstorage)
 
-        # Saves the file to disk
+        # Saves the file to disk. The snapshot includes any changes that
+        # were replayed from the log, so the log can be discarded.
         self.gstorage.write_graph(self.graph_file, self.id_file)
+        self.wal.truncate()
+        self.checkpoint.remove()
+        self.progress.finish()
+
+    def imported(self, source, offset, rows, edges, node_ids):
+        """
+        Records that a batch of rows was added to the graph, reports the
+        progress of the import and saves the graph and an
+        L{ImportCheckpoint} if enough rows were added since the last one.
+
+        @type source: Integer
+        @param source: Position of the file being read in the input files
+        @type offset: Integer
+        @param offset: Byte offset just past the rows of the batch
+        @type rows: Integer
+        @param rows: Number of rows in the batch
+        @type edges: Integer
+        @param edges: Number of edges added by the batch
+        @type node_ids: List
+        @param node_ids: Lists of the ids of the nodes that were created or
+        changed by the batch, or that edges were added to
+        """
+        for ids in node_ids:
+            self.gstorage.mark_nodes(ids)
+        self.progress.update(rows, edges)
+        if self.progress.rows >= self.checkpoint_at:
+            self.gstorage.write_graph(self.graph_file, self.id_file)
+            self.wal.truncate()
+            self.checkpoint.save(self.files, source, offset, 
+                self.gs.get_id(), self.start_id, self.progress.rows,
+                self.progress.edges)
+            self.checkpoint_at = self.progress.rows + self.checkpoint_rows
+
+    def imported_nodes(self, key_name):
+        """
+        Returns the nodes created by the import so far, keyed by the value
+        of their key attribute. Used to resume an interrupted import.
+
+        @type key_name: String
+        @param key_name: Attribute holding the key of the node
+        @rtype: Dictionary
+        @return: Node ids keyed by node key
+        """
+        node_dict = {}
+        for node_id, attrs in self.gs.get_graph().node.iteritems():
+            if node_id > self.start_id and key_name in attrs:
+                node_dict[attrs[key_name]] = node_id
+        return node_dict
+
+    def load_csv_rows(self, source, offset, node_dict, delimiter, 
+        batch_size):
+        """
+        Adds the rows of the node and edge files to the graph. See
+        L{load_csv_files} and L{bulk_load}.
+        """
+        node_file, edge_file = self.files.split('\t')
+        key_name, key_type = 'id', infer_value
+        if node_file:
+            sep = delimiter or csv_delimiter(node_file)
+            header, types = infer_column_types(node_file, sep)
+            key_name, key_type = header[0], types[0]
+        if self.resumed:
+            node_dict.update(self.imported_nodes(key_name))
+
+        def node_key(key):
+            """ Converts a key from a file to the value stored with nodes. """
+            try:
+                return key_type(key)
+            except ValueError:
+                return infer_value(key)
+
+        if node_file and source == 0:
+            for batch, end in read_csv_rows(node_file, sep, header, types, 
+                batch_size, offset):
+                new_keys = []
+                new_attrs = {}
+                changed = []
+                for key, _, attrs in batch:
+                    if key == '':
+                        continue
+                    key = attrs[key_name]
+                    # Rows with the same key describe the same node
+                    if key in new_attrs:
+                        new_attrs[key].update(attrs)
+                    elif key in node_dict:
+                        node_attrs = self.q_eval.g.node[node_dict[key]]
+                        old_attrs = dict(node_attrs)
+                        node_attrs.update(attrs)
+                        self.gs.statistics.node_changed(node_dict[key], 
+                            old_attrs, node_attrs)
+                        changed.append(node_dict[key])
+                    else:
+                        new_keys.append(key)
+                        new_attrs[key] = attrs
+                node_ids = self.q_eval.add_nodes([new_attrs[key] for key in
+                    new_keys])
+                node_dict.update(izip(new_keys, node_ids))
+                self.imported(0, end, len(batch), 0, [node_ids, changed])
+            offset = 0
+
+        if edge_file:
+            sep = delimiter or csv_delimiter(edge_file)
+            header, types = infer_column_types(edge_file, sep)
+            # The node keys are not stored with the edge
+            types[0] = types[1] = None
+            for batch, end in read_csv_rows(edge_file, sep, header, types, 
+                batch_size, offset):
+                new_keys = []
+                edges = []
+                for node1, node2, attrs in batch:
+                    node1, node2 = node_key(node1), node_key(node2)
+                    for key in (node1, node2):
+                        if key not in node_dict:
+                            node_dict[key] = None
+                            new_keys.append(key)
+                    edges.append((node1, node2, attrs))
+                node_ids = self.q_eval.add_nodes([{key_name : key} 
+                    for key in new_keys])
+                node_dict.update(izip(new_keys, node_ids))
+                sources = [node_dict[node1] for node1, _, _ in edges]
+                targets = [node_dict[node2] for _, node2, _ in edges]
+                count = self.q_eval.add_relationships(izip(sources, targets,
+                    [attrs for _, _, attrs in edges]))
+                self.imported(1, end, len(batch), count, 
+                    [node_ids, sources, targets])
+
+    def load_ranges(self, source, offset, node_dict, chunk_size, processes):
+        """
+        Parses the byte ranges of a text file and adds them to the graph
+        in file order. See L{load_text_file} and L{bulk_load}.
+        """
+        text_file = self.files
+        ranges = [(text_file, start, end) for start, end in 
+            split_file(text_file, chunk_size, offset)]
+        if self.resumed:
+            node_dict.update(self.imported_nodes('id'))
+        if processes <= 1 or len(ranges) <= 1:
+            for r in ranges:
+                self.load_parsed(parse_range(r), node_dict, r[2])
+            return
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            # Parses a limited number of ranges ahead, so parsed ranges do
+            # not pile up while the graph is being built
+            window = 2 * processes
+            for i in xrange(0, len(ranges), window):
+                batch = ranges[i:i + window]
+                for r, parsed in izip(batch, pool.imap(parse_range, batch)):
+                    self.load_parsed(parsed, node_dict, r[2])
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def load_parsed(self, parsed, node_dict, end):
+        """
+        Adds the nodes and edges of a byte range parsed by L{parse_range}
+        to the graph. Ranges must be added in file order, so nodes get the
+        same ids however many processes parsed the file.
+
+        @type parsed: Tuple
+        @param parsed: Result of L{parse_range}
+        @type node_dict: Dictionary
+        @param node_dict: Node ids keyed by the id attribute of the node,
+        extended with the nodes first seen in this range
+        @type end: Integer
+        @param end: Byte offset of the end of the range
+        """
+        names, sources, targets = parsed
+        # Node names are stored typed, so they match the values of commands
+        keys = map(infer_value, names)
+        new_keys = []
+        for key in keys:
+            # Names such as 1 and 1.0 stand for the same node
+            if key not in node_dict:
+                node_dict[key] = None
+                new_keys.append(key)
+
+        # Adds node and edges between the nodes in our graph database
+        node_ids = self.q_eval.add_nodes([{'id' : key} for key in new_keys])
+        node_dict.update(izip(new_keys, node_ids))
+        local_ids = map(node_dict.__getitem__, keys)
+        sources = map(local_ids.__getitem__, array('i', sources))
+        targets = map(local_ids.__getitem__, array('i', targets))
+        count = self.q_eval.add_relationships(izip(sources, targets, 
+            repeat({})))
+        self.imported(0, end, len(sources), count, 
+            [node_ids, sources, targets])
 
 if __name__ == '__main__':
-    file_name = 'Wiki-Vote.txt'
     gs = GraphStructure()
     data = LoadData(gs)
-    data.load_text_file(file_name)
-    
-
+    if len(sys.argv) == 3:
+        # Node and edge CSV files
+        data.load_csv_files(sys.argv[1], sys.argv[2])
+    else:
+        file_name = sys.argv[1] if len(sys.argv) == 2 else 'Wiki-Vote.txt'
+        data.load_text_file(file_name, processes=LOAD_PROCESSES)
@@ -0,0 +1,38 @@
+from attribute_index import AttributeIndex
+
+
+def graph_nodes(g):
+    """
+    @type g: Graph
+    @param g: Directed graph
+    @rtype: Iterator
+    @return: Tuples of the id of a node and its attributes
+    """
+    return g.node.iteritems()
+
+
+class NodeIndex(AttributeIndex):
+    """
+    Index from node attribute values to the ids of the nodes that have
+    them, used by L{QueryEvaluator.match_node}.
+    """
+
+    def __init__(self, gs):
+        """
+        Creates an index without any indexed node attributes.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph whose nodes are indexed
+        """
+        AttributeIndex.__init__(self, gs, graph_nodes)
+
+    # Listener methods called by the GraphStructure
+
+    def node_added(self, node_id, attrs):
+        self.item_added(node_id, attrs)
+
+    def node_changed(self, node_id, old_attrs, attrs):
+        self.item_changed(node_id, old_attrs, attrs)
+
+    def node_removed(self, node_id, attrs, edges):
+        self.item_removed(node_id, attrs)
@@ -0,0 +1,142 @@
+from bisect import bisect_left, bisect_right
+
+
+def to_number(value):
+    """
+    Converts an attribute value to a number the way L{Predicates} compares
+    them.
+
+    @type value: Anything
+    @param value: Attribute value
+    @rtype: Float or None
+    @return: The value as a float, or None if it is not a number
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class OrderedValues:
+    """
+    The distinct values of an indexed attribute, sorted by their numeric
+    value, so the values in a range can be found by bisection. Values that
+    are not numbers are kept apart.
+
+    New numbers are appended to the sorted list and the list is sorted again
+    before the next range is looked up, which is cheap since only its tail
+    is out of order. Numbers that no longer have any value stay in the list
+    until more than half of the list is stale, and are taken back if they
+    get a value again, so every number is in the list once.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty set of values.
+        """
+        # Values by their numeric value
+        self.numbers = {}
+        # The numbers, sorted up to the last 'unsorted' entries
+        self.keys = []
+        self.unsorted = 0
+        # Entries of keys that are no longer in numbers
+        self.stale = set()
+        # Values that are not numbers
+        self.others = set()
+
+    def add(self, value):
+        """
+        Adds a value of the attribute.
+
+        @type value: Anything hashable
+        @param value: Attribute value
+        """
+        number = to_number(value)
+        if number is None:
+            self.others.add(value)
+        elif number != number:
+            # NaN is not in any range
+            return
+        elif number in self.numbers:
+            self.numbers[number].add(value)
+        else:
+            self.numbers[number] = set([value])
+            if number in self.stale:
+                self.stale.remove(number)
+            else:
+                self.keys.append(number)
+                self.unsorted += 1
+
+    def remove(self, value):
+        """
+        Removes a value of the attribute.
+
+        @type value: Anything hashable
+        @param value: Attribute value
+        """
+        number = to_number(value)
+        if number is None:
+            self.others.discard(value)
+            return
+        values = self.numbers.get(number)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del self.numbers[number]
+                self.stale.add(number)
+
+    def sort(self):
+        """
+        Sorts the numbers added since the last lookup and drops the stale
+        numbers if there are many of them.
+        """
+        if len(self.stale) > len(self.keys) / 2:
+            self.keys = sorted(self.numbers)
+            self.stale = set()
+        elif self.unsorted:
+            self.keys.sort()
+        self.unsorted = 0
+
+    def count(self, op, number):
+        """
+        Estimates how many values compare to a number like the operation
+        says, without collecting them.
+
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type number: Float
+        @param number: Number to compare the values against
+        @rtype: Integer
+        @return: Number of distinct numbers in the range
+        """
+        if op == "=":
+            return 1 if number in self.numbers else 0
+        self.sort()
+        if op == "<":
+            return bisect_left(self.keys, number)
+        return len(self.keys) - bisect_right(self.keys, number)
+
+    def find(self, op, number):
+        """
+        Finds the values that compare to a number like the operation says.
+
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type number: Float
+        @param number: Number to compare the values against
+        @rtype: List
+        @return: Values satisfying the comparison
+        """
+        if op == "=":
+            return list(self.numbers.get(number, ()))
+        self.sort()
+        if op == "<":
+            keys = self.keys[:bisect_left(self.keys, number)]
+        else:
+            keys = self.keys[bisect_right(self.keys, number):]
+        values = []
+        numbers = self.numbers
+        for key in keys:
+            if key in numbers:
+                values.extend(numbers[key])
+        return values
@@ -1,5 +1,7 @@
+import re
 import sys
 from Command_Struct import Command_Struct
+from schema import infer_value
 
 
 # The following finite state machine is used by the parser to
@@ -21,7 +23,8 @@ TOKEN_EDGE = 4      # Ex. e:
 TOKEN_BOOL = 5      # Ex. b:
 TOKEN_PRED = 6      # Ex. >, <, =
 TOKEN_END = 7       # Ex. ; - semicolon indicates termination
-TOKEN_ERROR = 8     # Ex. CREATE MATCH
+TOKEN_LIMIT = 8     # Ex. LIMIT
+TOKEN_ERROR = 9     # Ex. CREATE MATCH
 
 
 # Possible machine states
@@ -34,7 +37,8 @@ STATE_EDGE = 5
 STATE_BOOL = 6
 STATE_PRED = 7
 STATE_END = 8
-STATE_ERROR = 9
+STATE_LIMIT = 9
+STATE_ERROR = 10
 
 
 NUM_TOKENS = TOKEN_ERROR - TOKEN_COMMAND + 1
@@ -42,6 +46,64 @@ NUM_TOKENS = TOKEN_ERROR - TOKEN_COMMAND + 1
 NUM_STATES = STATE_ERROR - STATE_INIT 
 
 
+# Words that start a command, in lower case
+COMMANDS = frozenset(["create", "createedge", "match", "modifynode", 
+    "modifyedge", "deletenode", "deleteedge", "haspath", "shortestpath", 
+    "neighbor", "hasedge", "return", "clear", "show", "visualize",
+    "createindex", "dropindex", "stats", "schema"])
+
+# Words of the form x: that start a node, edge or bool, in lower case
+TYPE_TOKENS = {"n:" : TOKEN_NODE, "e:" : TOKEN_EDGE, "b:" : TOKEN_BOOL}
+
+# Splits a command into words and classifies every word in one pass. A
+# word with exactly one colon is an attribute (or a type such as n:), a
+# word with exactly one >, < or = is a predicate, and any other word is
+# a name (or a command).
+TOKEN_RE = re.compile(r"""
+    (?: (?P<end> ; )
+      | (?P<attr> [^\s:]* : [^\s:]* )
+      | (?P<pred> [^\s>]* > [^\s>]* | [^\s<]* < [^\s<]* | [^\s=]* = [^\s=]* )
+      | (?P<name> \S+ )
+    ) (?= \s | $ )""", re.VERBOSE)
+
+
+def word_token(kind, word):
+    """
+    Returns the token of a word matched by TOKEN_RE.
+
+    @type kind: String
+    @param kind: Name of the group of TOKEN_RE that matched the word
+    @type word: String
+    @param word: The matched word
+    @rtype: Integer
+    @return: An integer which represents a specific token command
+    """
+    if kind == "name":
+        if word.lower() in COMMANDS:
+            return TOKEN_COMMAND
+        if word.lower() == "limit":
+            return TOKEN_LIMIT
+        return TOKEN_NAME
+    if kind == "attr":
+        return TYPE_TOKENS.get(word.lower(), TOKEN_ATTR)
+    if kind == "pred":
+        return TOKEN_PRED
+    return TOKEN_END
+
+
+def tokenize(command):
+    """
+    Splits a command into words and finds the token of every word.
+
+    @type command: String
+    @param command: Command entered by the user
+    @rtype: List of tuples
+    @return: Tuples of the format (word, token)
+    """
+    return [(match.group(), word_token(match.lastgroup, match.group()))
+        for match in TOKEN_RE.finditer(command)]
+
+
 
 
 class Parser:
@@ -49,7 +111,6 @@ class Parser:
 
     def __init__(self, parsedString):
         self.parseStr = parsedString
-        self.words = parsedString.split()
 
         self.curr_token = -1  # current token being processed by the parser
         self.curr_list_token = -1 # specific for createEdge command
@@ -66,124 +127,9 @@ class Parser:
         self.curr_obj = None
         self.done = False        # whether we are done parsing 
 
-        # NOTE: The get token function should keep returning TOKEN_END if
-        # there is no more input. 
-
-
-        # The finite state machine used to parse input. Tokens are used to 
-        # transition from one state to another. Every entry in the table is 
-        # a tuple containing the next state and a function pointer. 
-        state_machine = [[0 for j in range(NUM_TOKENS)] for i in range(NUM_STATES)]
-
-
-        # STATE_INIT
-        state_machine[STATE_INIT][TOKEN_COMMAND] = (STATE_COMMAND, self.create_cmd_obj)
-        state_machine[STATE_INIT][TOKEN_NODE] = (STATE_ERROR, self.error)
-        state_machine[STATE_INIT][TOKEN_NAME] = (STATE_ERROR, self.error)
-        state_machine[STATE_INIT][TOKEN_ATTR] = (STATE_ERROR, self.error)
-        state_machine[STATE_INIT][TOKEN_EDGE] = (STATE_ERROR, self.error)
-        state_machine[STATE_INIT][TOKEN_BOOL] = (STATE_ERROR, self.error)
-        state_machine[STATE_INIT][TOKEN_PRED] = (STATE_ERROR, self.error)
-        state_machine[STATE_INIT][TOKEN_END] = (STATE_ERROR, self.finish)
-        state_machine[STATE_INIT][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_COMMAND
-        state_machine[STATE_COMMAND][TOKEN_COMMAND] = (STATE_ERROR, self.error)
-        state_machine[STATE_COMMAND][TOKEN_NODE] = (STATE_NODE, self.create_node)
-        state_machine[STATE_COMMAND][TOKEN_NAME] = (STATE_ERROR, self.error)
-        state_machine[STATE_COMMAND][TOKEN_ATTR] = (STATE_ERROR, self.error)
-        state_machine[STATE_COMMAND][TOKEN_EDGE] = (STATE_EDGE, self.create_edge)
-        state_machine[STATE_COMMAND][TOKEN_BOOL] = (STATE_BOOL, self.create_bool)
-        state_machine[STATE_COMMAND][TOKEN_PRED] = (STATE_ERROR, self.error)
-        state_machine[STATE_COMMAND][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_COMMAND][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_NODE
-        state_machine[STATE_NODE][TOKEN_COMMAND] = (STATE_ERROR, self.error)
-        state_machine[STATE_NODE][TOKEN_NODE] = (STATE_ERROR, self.error)
-        state_machine[STATE_NODE][TOKEN_NAME] = (STATE_NAME, self.add_name)
-        state_machine[STATE_NODE][TOKEN_ATTR] = (STATE_ERROR, self.error)
-        state_machine[STATE_NODE][TOKEN_EDGE] = (STATE_ERROR, self.error)
-        state_machine[STATE_NODE][TOKEN_BOOL] = (STATE_ERROR, self.error)
-        state_machine[STATE_NODE][TOKEN_PRED] = (STATE_ERROR, self.error)
-        state_machine[STATE_NODE][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_NODE][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_NAME
-        state_machine[STATE_NAME][TOKEN_COMMAND] = (STATE_ERROR, self.error)
-        state_machine[STATE_NAME][TOKEN_NODE] = (STATE_NODE, self.create_node)
-        state_machine[STATE_NAME][TOKEN_NAME] = (STATE_ERROR, self.error)
-        state_machine[STATE_NAME][TOKEN_ATTR] = (STATE_ATTR, self.add_attr)
-        state_machine[STATE_NAME][TOKEN_EDGE] = (STATE_EDGE, self.create_edge)
-        state_machine[STATE_NAME][TOKEN_BOOL] = (STATE_BOOL, self.create_bool)
-        state_machine[STATE_NAME][TOKEN_PRED] = (STATE_PRED, self.add_pred)
-        state_machine[STATE_NAME][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_NAME][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_ATTR
-        state_machine[STATE_ATTR][TOKEN_COMMAND] = (STATE_COMMAND, self.create_cmd_obj)
-        state_machine[STATE_ATTR][TOKEN_NODE] = (STATE_NODE, self.create_node)
-        state_machine[STATE_ATTR][TOKEN_NAME] = (STATE_ERROR, self.error)
-        state_machine[STATE_ATTR][TOKEN_ATTR] = (STATE_ATTR, self.add_attr)
-        state_machine[STATE_ATTR][TOKEN_EDGE] = (STATE_EDGE, self.create_edge)
-        state_machine[STATE_ATTR][TOKEN_BOOL] = (STATE_BOOL, self.create_bool)
-        state_machine[STATE_ATTR][TOKEN_PRED] = (STATE_PRED, self.add_pred)
-        state_machine[STATE_ATTR][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_ATTR][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_EDGE
-        state_machine[STATE_EDGE][TOKEN_COMMAND] = (STATE_ERROR, self.error)
-        state_machine[STATE_EDGE][TOKEN_NODE] = (STATE_ERROR, self.error)
-        state_machine[STATE_EDGE][TOKEN_NAME] = (STATE_NAME, self.add_name)
-        state_machine[STATE_EDGE][TOKEN_ATTR] = (STATE_ERROR, self.error)
-        state_machine[STATE_EDGE][TOKEN_EDGE] = (STATE_ERROR, self.error)
-        state_machine[STATE_EDGE][TOKEN_BOOL] = (STATE_ERROR, self.error)
-        state_machine[STATE_EDGE][TOKEN_PRED] = (STATE_ERROR, self.error)
-        state_machine[STATE_EDGE][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_EDGE][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_BOOL
-        state_machine[STATE_BOOL][TOKEN_COMMAND] = (STATE_ERROR, self.error)
-        state_machine[STATE_BOOL][TOKEN_NODE] = (STATE_ERROR, self.error)
-        state_machine[STATE_BOOL][TOKEN_NAME] = (STATE_NAME, self.add_name)
-        state_machine[STATE_BOOL][TOKEN_ATTR] = (STATE_ERROR, self.error)
-        state_machine[STATE_BOOL][TOKEN_EDGE] = (STATE_ERROR, self.error)
-        state_machine[STATE_BOOL][TOKEN_BOOL] = (STATE_ERROR, self.error)
-        state_machine[STATE_BOOL][TOKEN_PRED] = (STATE_ERROR, self.error)
-        state_machine[STATE_BOOL][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_BOOL][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_PRED
-        state_machine[STATE_PRED][TOKEN_COMMAND] = (STATE_COMMAND, self.create_cmd_obj)
-        state_machine[STATE_PRED][TOKEN_NODE] = (STATE_NODE, self.create_node)
-        state_machine[STATE_PRED][TOKEN_NAME] = (STATE_PRED, self.add_pred)
-        state_machine[STATE_PRED][TOKEN_ATTR] = (STATE_ATTR, self.add_attr)
-        state_machine[STATE_PRED][TOKEN_EDGE] = (STATE_EDGE, self.create_edge)
-        state_machine[STATE_PRED][TOKEN_BOOL] = (STATE_BOOL, self.create_bool)
-        state_machine[STATE_PRED][TOKEN_PRED] = (STATE_PRED, self.add_pred)
-        state_machine[STATE_PRED][TOKEN_END] = (STATE_END, self.finish)
-        state_machine[STATE_PRED][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-
-        # STATE_END
-        state_machine[STATE_END][TOKEN_COMMAND] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_NODE] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_NAME] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_ATTR] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_EDGE] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_BOOL] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_PRED] = (STATE_ERROR, self.error)
-        state_machine[STATE_END][TOKEN_END] = (STATE_ERROR, self.finish)
-        state_machine[STATE_END][TOKEN_ERROR] = (STATE_ERROR, self.error)
-
-        self.state_machine = state_machine
+        # The finite state machine is shared by all parsers, see
+        # STATE_MACHINE at the end of this module.
+        self.state_machine = STATE_MACHINE
 
     def get_token(self, word):
         """
@@ -195,31 +141,10 @@ class Parser:
         @rtype: Integer
         @return: An integer which represents a specific token command
         """
-
-        commands_list = ["create", "createedge", "match", "modifynode", 
-            "modifyedge", "deletenode", "deleteedge", "haspath", 
-            "shortestpath", "neighbor", "hasedge", "return", "clear", 
-            "show", "visualize"]
-
-        if (word.lower() in commands_list):
-            return TOKEN_COMMAND
-        elif (word.lower() == "n:"):
-            return TOKEN_NODE
-        elif (word.lower() == "e:"):
-            return TOKEN_EDGE
-        elif (word.lower() == "b:"):
-            return TOKEN_BOOL
-        elif (word == ";"):
-            return TOKEN_END
-        elif (word.count(":") == 1):
-            return TOKEN_ATTR
-        elif (word.count(">") == 1 or word.count("<") == 1 or
-                 word.count("=") == 1):
-            return TOKEN_PRED
-        elif (isinstance(word, basestring)):
+        match = TOKEN_RE.match(word)
+        if match is None or match.end() != len(word):
             return TOKEN_NAME
-        else:
-            return TOKEN_ERROR
+        return word_token(match.lastgroup, word)
 
     # Callback methods used in the finite state machine.
 
@@ -286,14 +211,18 @@ class Parser:
 
     def add_attr(self):
         """
-        Insert the attribute to our current object.
+        Insert the attribute to our current object. The values of node
+        and edge attributes are stored as the ints, floats, bools or
+        strings they stand for, see L{infer_value}.
         """
 
         lst = self.curr_word.split(":")
-        self.curr_obj.insert_attr(lst[0], lst[1])
 
+        if (self.curr_obj.get_attr_type() != "b:"):
+            self.curr_obj.insert_attr(lst[0], infer_value(lst[1]))
         # If we are currently on bool, store that value
-        if (self.curr_obj.get_attr_type() == "b:"):
+        else:
+            self.curr_obj.insert_attr(lst[0], lst[1])
             if (lst[0].lower() != "val" or (lst[1] != "0" and lst[1] != "1")):
                 self.error()
             else:
@@ -302,11 +231,18 @@ class Parser:
     def add_pred(self):
         """
         Insert the predicate into the names list of our
-        current object. If the current word does not contain any
+        current object. A NOT following an AND or an OR negates the
+        predicate after it. If the current word does not contain any
         predicate information, an error is tossed.
         """
+        names = self.curr_obj.get_names()
         if (self.curr_word.lower() == "and" or self.curr_word.lower() == "or"):
             self.curr_obj.insert_name(self.curr_word.upper())
+        elif (self.curr_word.lower() == "not"):
+            if (names and names[-1] in ("AND", "OR")):
+                names[-1] += " NOT"
+            else:
+                self.error()
         elif (">" in self.curr_word):
             lst = self.curr_word.split(">")
             self.curr_obj.insert_name([lst[0], ">", lst[1], self.curr_iden])
@@ -320,6 +256,24 @@ class Parser:
             self.error()
 
 
+    def start_limit(self):
+        """
+        Starts the LIMIT clause of the current object. The limit stays 0,
+        which is not a valid limit, until the number of results is given.
+        """
+        self.curr_obj.set_limit(0)
+
+    def add_limit(self):
+        """
+        Sets the maximum number of results of the current object. If the
+        current word is not a number, an error is tossed.
+        """
+        if not self.curr_word.isdigit():
+            self.error()
+        else:
+            self.curr_obj.set_limit(int(self.curr_word))
+
+
 ############################################################
 #   Functions that deal with running and ending the program.
 ############################################################
@@ -389,8 +343,14 @@ class Parser:
         information about commands and their arguments.
         """
         
-        for word in self.words:
-            if (self.done or (self.words[len(self.words) - 1] == word)):
+        tokens = tokenize(self.parseStr)
+        if not tokens:
+            return
+        last_word = tokens[-1][0]
+        state_machine = self.state_machine
+
+        for word, token in tokens:
+            if (self.done or (last_word == word)):
                 # Do a last update on the names for match commands
                 for i in range(0, len(self.obj_list)):
                     if self.obj_list[i].get_command() == "MATCH":
@@ -399,15 +359,93 @@ class Parser:
                 break
             
             self.curr_word = word
-            self.curr_token = self.get_token(word)
-
-            # print "this is current token " + str(self.current_token)
+            self.curr_token = token
 
             # run the state machine one step forward
-            tuppy = self.state_machine[self.curr_state][self.curr_token]
+            tuppy = state_machine[self.curr_state][token]
 
             # execute callback method corresponding to this transition 
-            tuppy[1]()
+            tuppy[1](self)
 
             # transition to the next state
-            self.curr_state = tuppy[0] 
+            self.curr_state = tuppy[0]
+
+
+# The finite state machine used to parse input. Tokens are used to 
+# transition from one state to another. Every entry in the table is 
+# a tuple containing the next state and the L{Parser} method to call.
+# The table is built once, when the module is imported.
+TRANSITIONS = [
+    # STATE_INIT
+    [(STATE_COMMAND, "create_cmd_obj"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "finish"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error")],
+    # STATE_COMMAND
+    [(STATE_ERROR, "error"), (STATE_NODE, "create_node"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_EDGE, "create_edge"), (STATE_BOOL, "create_bool"),
+     (STATE_ERROR, "error"), (STATE_END, "finish"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error")],
+    # STATE_NODE
+    [(STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_NAME, "add_name"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_END, "finish"), (STATE_NAME, "add_name"),
+     (STATE_ERROR, "error")],
+    # STATE_NAME
+    [(STATE_ERROR, "error"), (STATE_NODE, "create_node"),
+     (STATE_ERROR, "error"), (STATE_ATTR, "add_attr"),
+     (STATE_EDGE, "create_edge"), (STATE_BOOL, "create_bool"),
+     (STATE_PRED, "add_pred"), (STATE_END, "finish"),
+     (STATE_LIMIT, "start_limit"), (STATE_ERROR, "error")],
+    # STATE_ATTR
+    [(STATE_COMMAND, "create_cmd_obj"), (STATE_NODE, "create_node"),
+     (STATE_ERROR, "error"), (STATE_ATTR, "add_attr"),
+     (STATE_EDGE, "create_edge"), (STATE_BOOL, "create_bool"),
+     (STATE_PRED, "add_pred"), (STATE_END, "finish"),
+     (STATE_LIMIT, "start_limit"), (STATE_ERROR, "error")],
+    # STATE_EDGE
+    [(STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_NAME, "add_name"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_END, "finish"), (STATE_NAME, "add_name"),
+     (STATE_ERROR, "error")],
+    # STATE_BOOL
+    [(STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_NAME, "add_name"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_END, "finish"), (STATE_NAME, "add_name"),
+     (STATE_ERROR, "error")],
+    # STATE_PRED
+    [(STATE_COMMAND, "create_cmd_obj"), (STATE_NODE, "create_node"),
+     (STATE_PRED, "add_pred"), (STATE_ATTR, "add_attr"),
+     (STATE_EDGE, "create_edge"), (STATE_BOOL, "create_bool"),
+     (STATE_PRED, "add_pred"), (STATE_END, "finish"),
+     (STATE_LIMIT, "start_limit"), (STATE_ERROR, "error")],
+    # STATE_END
+    [(STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "finish"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error")],
+    # STATE_LIMIT
+    [(STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_END, "add_limit"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error"), (STATE_ERROR, "error"), (STATE_ERROR, "error"),
+     (STATE_ERROR, "error")]]
+
+STATE_MACHINE = [[(next_state, Parser.__dict__[callback])
+    for next_state, callback in row] for row in TRANSITIONS]
+
+
+if __name__ == '__main__':
+    # Measures how many statements per second the parser handles
+    import time
+    statements = ["create n: a name:x age:1 ;",
+        "createedge n: a name:x e: r type:f n: b name:y ;",
+        "match n: a name:x age>5 e: r type:f n: b name:y ;",
+        "modifynode n: a name:x n: a age:3 b: c val:1 ;",
+        "return n: a n: b ;"]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    start = time.time()
+    for i in xrange(count):
+        parser = Parser(statements[i % len(statements)])
+        parser.run()
+    print "%d statements/s" % (count / (time.time() - start))
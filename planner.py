@@ -0,0 +1,203 @@
+from ordered_values import to_number
+
+# Fraction of the items guessed to match an attribute value or predicate
+# that no index knows about
+EQUAL_SELECTIVITY = 0.1
+RANGE_SELECTIVITY = 1 / 3.0
+
+
+class Planner:
+    """
+    Chooses how L{QueryEvaluator.multi_match} evaluates a MATCH chain. The
+    number of nodes matching each node of the chain is estimated from the
+    L{GraphStatistics} and the node and edge indexes, and the chain is
+    expanded from the node whose expansion in both directions is expected
+    to walk the fewest edges.
+
+    The predicates of the nodes other than the first one are either used
+    to filter the matching nodes before the chain is expanded, or applied
+    to the nodes the expansion reaches, whichever looks at fewer nodes.
+    """
+
+    def __init__(self, gs):
+        """
+        @type gs: L{GraphStructure} object
+        @param gs: Graph the chains are matched in
+        """
+        self.gs = gs
+
+    def value_count(self, values, attrs):
+        """
+        Estimates the number of items that have the attributes, as the
+        number of items having the rarest of their values.
+
+        @type values: Dictionary
+        @param values: Numbers of items by attribute name and value, see
+        L{GraphStatistics}
+        @type attrs: Dictionary
+        @param attrs: Attributes to match
+        @rtype: Float or None
+        @return: Estimated number of items, or None if the values are not
+        counted
+        """
+        count = None
+        for attr, value in attrs.iteritems():
+            try:
+                value_count = values.get(attr, {}).get(value, 0)
+            except TypeError:
+                continue
+            if count is None or value_count < count:
+                count = value_count
+        return None if count is None else float(count)
+
+    def node_count(self, node_attrs):
+        """
+        Estimates the number of nodes that have the attributes.
+
+        @type node_attrs: Dictionary
+        @param node_attrs: Node attributes to match
+        @rtype: Float
+        @return: Estimated number of nodes
+        """
+        statistics = self.gs.statistics
+        if not node_attrs:
+            return float(statistics.nodes)
+        count = self.value_count(statistics.node_values, node_attrs)
+        if count is not None:
+            return count
+        return statistics.nodes * EQUAL_SELECTIVITY ** len(node_attrs)
+
+    def lookup_cost(self, node_attrs):
+        """
+        Estimates the number of nodes looked at to find the nodes that have
+        the attributes.
+
+        @type node_attrs: Dictionary
+        @param node_attrs: Node attributes to match
+        @rtype: Float
+        @return: Estimated number of nodes
+        """
+        keys = self.gs.node_index.lookup(node_attrs)
+        if keys is not None:
+            return float(len(keys))
+        return float(self.gs.statistics.nodes)
+
+    def edge_fraction(self, rel_attrs):
+        """
+        Estimates the fraction of the edges that have the attributes.
+
+        @type rel_attrs: Dictionary
+        @param rel_attrs: Relationship attributes to match
+        @rtype: Float
+        @return: Estimated fraction of the edges
+        """
+        statistics = self.gs.statistics
+        if not rel_attrs or not statistics.edges:
+            return 1.0
+        count = self.value_count(statistics.edge_values, rel_attrs)
+        if count is not None:
+            return count / statistics.edges
+        return EQUAL_SELECTIVITY ** len(rel_attrs)
+
+    def comparison_fraction(self, attr, op, value):
+        """
+        Estimates the fraction of the nodes that satisfy a comparison of a
+        predicate, using the ordered values of the attribute if it is
+        indexed.
+
+        @type attr: String
+        @param attr: Attribute compared
+        @type op: String that is either "<", "=", or ">".
+        @param op: Comparison of the values with the number
+        @type value: String
+        @param value: Number to compare the values against
+        @rtype: Float
+        @return: Estimated fraction of the nodes
+        """
+        number = to_number(value)
+        if number is None:
+            return 0.0
+        index = self.gs.node_index
+        if attr in index.ordered:
+            ordered = index.ordered[attr]
+            total = len(ordered.numbers) + len(ordered.others)
+            if not total:
+                return 0.0
+            return min(1.0, ordered.count(op, number) / float(total))
+        if op == "=":
+            return EQUAL_SELECTIVITY
+        return RANGE_SELECTIVITY
+
+    def predicate_fraction(self, predicates):
+        """
+        Estimates the fraction of the nodes that satisfy the predicates of
+        a node.
+
+        @type predicates: List
+        @param predicates: Parsed predicates, alternating with the AND, OR,
+        AND NOT or OR NOT strings that combine them
+        @rtype: Float
+        @return: Estimated fraction of the nodes
+        """
+        fraction = 1.0
+        for position in range(0, len(predicates), 2):
+            pred = predicates[position]
+            pred_fraction = self.comparison_fraction(pred[0], pred[1], pred[2])
+            if position > 0 and predicates[position - 1].endswith('NOT'):
+                pred_fraction = 1.0 - pred_fraction
+            if position == 0:
+                fraction = pred_fraction
+            elif predicates[position - 1].startswith('OR'):
+                fraction = min(1.0, fraction + pred_fraction)
+            else:
+                fraction *= pred_fraction
+        return fraction
+
+    def plan(self, node_attr_list, rel_attr_list, predicates):
+        """
+        Chooses the node a chain is expanded from, and the nodes whose
+        predicates are applied before the expansion.
+
+        @type node_attr_list: List of node attributes
+        @param node_attr_list: Attributes of the nodes of the chain
+        @type rel_attr_list: List of relationship attributes
+        @param rel_attr_list: Attributes of the edges of the chain
+        @type predicates: Dictionary
+        @param predicates: Parsed predicates by the position of their node
+        in the chain
+        @rtype: Tuple
+        @return: Position of the node to expand the chain from, and the set
+        of the positions whose predicates are applied before expanding
+        """
+        statistics = self.gs.statistics
+        total = max(statistics.nodes, 1)
+        degree = statistics.edges / float(total)
+        counts = []
+        for position, node_attrs in enumerate(node_attr_list):
+            count = self.node_count(node_attrs)
+            if position in predicates:
+                count *= self.predicate_fraction(predicates[position])
+            counts.append(count)
+        fractions = [self.edge_fraction(rel_attrs)
+            for rel_attrs in rel_attr_list]
+
+        best = None
+        for start in range(len(node_attr_list)):
+            cost = 0.0
+            filtered = set([start]) & set(predicates)
+            for step in (1, -1):
+                reached = counts[start]
+                position = start + step
+                while 0 <= position < len(node_attr_list):
+                    walked = reached * degree
+                    cost += walked
+                    if position in predicates and \
+                        self.lookup_cost(node_attr_list[position]) <= walked:
+                        filtered.add(position)
+                    edge = min(position, position - step)
+                    reached = min(counts[position], walked *
+                        fractions[edge] * counts[position] / total)
+                    position += step
+            if best is None or cost < best[0]:
+                best = (cost, start, filtered)
+        return best[1], best[2]
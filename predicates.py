@@ -1,3 +1,8 @@
+from bitmap import Bitmap
+from column_store import SCAN_SPEEDUP
+from schema import NUMBER_TYPES
+
+
 class Predicates:   
     """
     L{Predicates} contains the methods to perform filtering on node   
@@ -52,6 +57,15 @@ class Predicates:
         if val == "ERROR":
             print "ERROR : Comparison Value must be an number..."
             return []
+        # The index is only used if the predicate is selective, since
+        # collecting many nodes from it is slower than comparing them
+        index = self.gs.node_index
+        if op in ("<", ">", "=") and attr in index.indexes and \
+            index.ordered[attr].count(op, val) * 4 <= len(node_list):
+            return self.__filter_indexed(node_list, attr, val, op)
+        if op in ("<", ">", "=") and \
+            self.gs.columns.get(attr, len(node_list)):
+            return self.__filter_column(node_list, attr, val, op)
         if op == "<":
             return self.__filter_less(node_list, attr, val)
         elif op == ">":
@@ -62,6 +76,143 @@ class Predicates:
             print "ERROR : Invalid predicate operation..."
             return []
 
+    def matching_ids(self, node_list, attr, value, op, universe):
+        """
+        Finds the nodes that satisfy a predicate like L{filter}, as a
+        L{Bitmap} of their ids. The nodes are looked up in the ordered index
+        of the attribute if that is expected to be the fastest, otherwise
+        the values in the column of the attribute are compared, see
+        L{ColumnStore}, or else the nodes of the list are filtered.
+
+        @type node_list: List or None
+        @param node_list: List of nodes. Each node is a tuple consisting 
+        of an id and a dictionary of attributes. Can be None if the
+        attribute is indexed or has a column.
+        @type attr: String
+        @param attr: Attribute used to filter node
+        @type value: String that represents a number.
+        @param value: Value to compare the node attributes against. 
+        @type op: String that is either "<", "=", or ">".
+        @param op: Operation to perform when comparing each node attribute 
+                   against value. 
+        @type universe: L{Bitmap} or None
+        @param universe: Ids of the nodes that are filtered, or None if
+        they are the nodes of node_list
+        @rtype: L{Bitmap}
+        @return: Ids of the nodes that satisfy the predicate.
+        """
+        val = self.__str2float(value)
+        if val == "ERROR":
+            print "ERROR : Comparison Value must be an number..."
+            return Bitmap()
+        if op not in ("<", ">", "="):
+            print "ERROR : Invalid predicate operation..."
+            return Bitmap()
+        total = self.gs.statistics.nodes
+        rows = total if node_list is None else len(node_list)
+        column = self.gs.columns.get(attr, rows)
+        # The index is used if it is expected to find fewer nodes than the
+        # list has, or than a column compares in the same time, guessing
+        # that every value is as common as the others
+        index = self.gs.node_index
+        if attr in index.indexes:
+            found = index.ordered[attr].count(op, val) * total / \
+                max(len(index.indexes[attr]), 1)
+            if column:
+                found *= SCAN_SPEEDUP
+            use_index = found <= rows or (node_list is None and not column)
+        else:
+            use_index = False
+        if use_index:
+            if universe is None:
+                universe = Bitmap(n[0] for n in node_list)
+            if index.ordered[attr].others:
+                for n in Bitmap(index.non_numeric(attr)) & universe:
+                    print "ERROR : Got attribute value that is not a number..."
+            return Bitmap(index.range(attr, op, val)) & universe
+        if column and node_list is None:
+            ids, errors = self.gs.columns.find(attr, op, val)
+            if universe is not None:
+                ids = ids & universe
+                errors = errors & universe
+            self.__print_errors(len(errors))
+            return ids
+        if column:
+            nodes = self.__filter_column(node_list, attr, val, op)
+        elif op == "<":
+            nodes = self.__filter_less(node_list, attr, val)
+        elif op == ">":
+            nodes = self.__filter_greater(node_list, attr, val)
+        else:
+            nodes = self.__filter_equal(node_list, attr, val)
+        return Bitmap(n[0] for n in nodes)
+
+    def __filter_column(self, node_list, attr, val, op):
+        """
+        Private helper function that filters a list of nodes like
+        L{filter} by comparing all their values in the column of the
+        attribute at once, see L{ColumnStore}. Nodes whose value is not a
+        number are reported by a single error.
+
+        @type node_list: List
+        @param node_list: List of nodes. Each node is a tuple consisting 
+        of an id and a dictionary of attributes.
+        @type attr: String
+        @param attr: Attribute with a column used to filter node
+        @type val: Float
+        @param val: Value to compare the node attributes against. 
+        @type op: String that is either "<", "=", or ">".
+        @param op: Operation to perform when comparing each node attribute 
+                   against value. 
+        @rtype: List
+        @return: Filtered list of nodes that satisfy the predicate. 
+        """
+        positions, errors = self.gs.columns.filter(attr, op, val,
+            [n[0] for n in node_list])
+        self.__print_errors(errors)
+        return [node_list[position] for position in positions]
+
+    def __print_errors(self, errors):
+        """
+        Private helper function that reports attribute values that are not
+        numbers.
+
+        @type errors: Integer
+        @param errors: Number of the values
+        """
+        if errors:
+            print "ERROR : Got " + str(errors) + \
+                " attribute values that are not numbers..."
+
+    def __filter_indexed(self, node_list, attr, val, op):
+        """
+        Private helper function that filters a list of nodes like
+        L{filter} by looking up the nodes satisfying the predicate in the
+        ordered index of the attribute, instead of converting the value of
+        every node to a number.
+
+        @type node_list: List
+        @param node_list: List of nodes. Each node is a tuple consisting 
+        of an id and a dictionary of attributes.
+        @type attr: String
+        @param attr: Indexed attribute used to filter node
+        @type val: Float
+        @param val: Value to compare the node attributes against. 
+        @type op: String that is either "<", "=", or ">".
+        @param op: Operation to perform when comparing each node attribute 
+                   against value. 
+        @rtype: List
+        @return: Filtered list of nodes that satisfy the predicate. 
+        """
+        index = self.gs.node_index
+        node_ids = index.range(attr, op, val)
+        if index.ordered[attr].others:
+            errors = index.non_numeric(attr)
+            for n in node_list:
+                if n[0] in errors:
+                    print "ERROR : Got attribute value that is not a number..."
+        return [n for n in node_list if n[0] in node_ids]
+
     def __filter_less(self, node_list, attr, val):
         """
         Private helper function that takes a list of nodes, an
@@ -81,7 +232,10 @@ class Predicates:
         """
         ret = []
         for n in node_list:
-            attr_val = self.__str2float(n[1][attr])
+            attr_val = n[1][attr]
+            # Typed numbers are compared as they are
+            if type(attr_val) not in NUMBER_TYPES:
+                attr_val = self.__str2float(attr_val)
             if attr_val == "ERROR":
                 print "ERROR : Got attribute value that is not a number..."
                 continue
@@ -108,7 +262,10 @@ class Predicates:
         """
         ret = []
         for n in node_list:
-            attr_val = self.__str2float(n[1][attr])
+            attr_val = n[1][attr]
+            # Typed numbers are compared as they are
+            if type(attr_val) not in NUMBER_TYPES:
+                attr_val = self.__str2float(attr_val)
             if attr_val == "ERROR":
                 print "ERROR : Got attribute value that is not a number..."
                 continue
@@ -135,7 +292,10 @@ class Predicates:
         """
         ret = []
         for n in node_list:
-            attr_val = self.__str2float(n[1][attr])
+            attr_val = n[1][attr]
+            # Typed numbers are compared as they are
+            if type(attr_val) not in NUMBER_TYPES:
+                attr_val = self.__str2float(attr_val)
             if attr_val == "ERROR":
                 print "ERROR : Got attribute value that is not a number..."
                 continue
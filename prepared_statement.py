@@ -0,0 +1,125 @@
+import re
+from Command_Struct import Command_Struct
+from schema import infer_value
+
+# A parameter of a prepared statement, such as $1
+PARAMETER_RE = re.compile(r"^\$([1-9][0-9]*)$")
+
+
+class PreparedStatement:
+    """
+    A statement that is parsed and checked once and then executed many
+    times with different values. Attribute values and predicate values of
+    the statement can be parameters $1, $2, ..., which are replaced by the
+    values given when the statement is executed. For example:
+
+        prepare knows createedge n: a id:$1 e: r type:knows n: b id:$2 ;
+        execute knows 17 42 ;
+    """
+
+    def __init__(self, name, commands):
+        """
+        Takes the commands of a parsed and checked statement.
+
+        @type name: String
+        @param name: Name the statement is executed by
+        @type commands: List of L{Command_Struct} objects
+        @param commands: Commands of the statement
+        """
+        self.name = name
+        self.commands = commands
+        # Number of values an execution must give
+        self.count = 0
+        # Tuples of the position of a command that contains parameters,
+        # the parameters in its attributes as (position of the attributes,
+        # attribute name, parameter number) tuples, and whether its
+        # predicates contain parameters
+        self.parameterized = []
+        for position, command in enumerate(commands):
+            attr_parameters = []
+            for attr_position, item in enumerate(command.get_attr_list()):
+                for key, value in item[2].iteritems():
+                    number = self.parameter(value)
+                    if number:
+                        attr_parameters.append((attr_position, key, number))
+                        self.count = max(self.count, number)
+            name_parameters = self.max_parameter(command.get_names())
+            self.count = max(self.count, name_parameters)
+            if attr_parameters or name_parameters:
+                self.parameterized.append((position, attr_parameters,
+                    name_parameters > 0))
+
+    def parameter(self, value):
+        """
+        Returns the number of the parameter a value stands for.
+
+        @type value: Anything
+        @param value: Attribute or predicate value
+        @rtype: Integer
+        @return: Number of the parameter, or 0 if the value is not one
+        """
+        if not isinstance(value, basestring):
+            return 0
+        match = PARAMETER_RE.match(value)
+        return int(match.group(1)) if match else 0
+
+    def max_parameter(self, item):
+        """
+        Finds the highest parameter used in the predicates of a command.
+
+        @type item: List or string
+        @param item: Predicates of a command, or a part of them
+        @rtype: Integer
+        @return: Number of the highest parameter, or 0 if there is none
+        """
+        if isinstance(item, basestring):
+            return self.parameter(item)
+        return max([self.max_parameter(part) for part in item] + [0])
+
+    def bind(self, values):
+        """
+        Returns the commands of the statement with the parameters replaced
+        by the values. The commands without parameters are shared by every
+        execution, the others are copied. Values bound to attributes are
+        typed like the values of parsed commands, see L{infer_value}.
+
+        @type values: List of strings
+        @param values: Values of the parameters $1, $2, ...
+        @rtype: List of L{Command_Struct} objects
+        @return: Commands to execute
+        """
+        commands = list(self.commands)
+        for position, attr_parameters, name_parameters in self.parameterized:
+            command = commands[position]
+            bound = Command_Struct(command.get_command())
+            bound.attr = list(command.get_attr_list())
+            for attr_position, key, number in attr_parameters:
+                item = bound.attr[attr_position]
+                if item is command.get_attr_list()[attr_position]:
+                    item = [item[0], item[1], dict(item[2])]
+                    bound.attr[attr_position] = item
+                item[2][key] = infer_value(values[number - 1])
+            if name_parameters:
+                bound.name = self.substitute(command.get_names(), values)
+            else:
+                bound.name = command.get_names()
+            bound.bool = command.get_bool()
+            bound.limit = command.get_limit()
+            commands[position] = bound
+        return commands
+
+    def substitute(self, item, values):
+        """
+        Copies the predicates of a command, replacing parameters by their
+        values.
+
+        @type item: List or string
+        @param item: Predicates of a command, or a part of them
+        @type values: List of strings
+        @param values: Values of the parameters $1, $2, ...
+        @return: The copy
+        """
+        if isinstance(item, basestring):
+            number = self.parameter(item)
+            return values[number - 1] if number else item
+        return [self.substitute(part, values) for part in item]
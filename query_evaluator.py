@@ -1,7 +1,30 @@
 from graph_structure import GraphStructure
 import networkx as nx
+from itertools import islice
 from visualize_graph import VisualizeGraph
 
+# Sizes of the first and the largest chunks L{QueryEvaluator.iter_filter}
+# filters at a time
+FILTER_CHUNK_SIZE = 256
+MAX_FILTER_CHUNK_SIZE = 65536
+
+def has_attrs(attrs, pattern):
+    """
+    Checks that a node or edge has all the attributes of a pattern.
+
+    @type attrs: Dictionary
+    @param attrs: Attributes of the node or edge
+    @type pattern: Dictionary
+    @param pattern: Attributes to match
+    @rtype: Boolean
+    @return: True if every attribute of the pattern has the same value
+    """
+    for attr, value in pattern.iteritems():
+        if attr not in attrs or attrs[attr] != value:
+            return False
+    return True
+
+
 class QueryEvaluator:
     """
     L{QueryEvaluator} performs evalution of graph query language by 
@@ -99,29 +122,92 @@ class QueryEvaluator:
         @return: Edge tuples in the format (node1_id, node2_id, edge_attributes)        
         """   
 
-        nodes1 = []
-        if (Filtered_nodes1 != None):   
-            nodes1 = Filtered_nodes1
+        return sorted(self.iter_node_node_rel(node1_attrs, node2_attrs, 
+            rel_attrs, Filtered_nodes1, Filtered_nodes2), 
+            key=lambda edge: (edge[0], edge[1]))
+
+    def iter_node_node_rel(self, node1_attrs, node2_attrs, rel_attrs, 
+        Filtered_nodes1=None, Filtered_nodes2=None):
+        """
+        Generates the edges found by L{match_node_node_rel} one at a time,
+        in no particular order.
+
+        @type node1_attrs: Dictionary
+        @param node1_attrs: Node 1 attributes to match   
+        @type node2_attrs: Dictionary
+        @param node2_attrs: Node 2 attributes to match
+        @type rel_attrs: Dictionary
+        @param rel_attrs: Relationship attributes to match
+        @rtype: Generator of tuples
+        @return: Edge tuples in the format (node1_id, node2_id, edge_attributes)        
+        """
+        nodes1 = self.candidate_nodes(node1_attrs, Filtered_nodes1)
+        nodes2 = self.candidate_nodes(node2_attrs, Filtered_nodes2)
+        return self.iter_join(nodes1, nodes2, rel_attrs)
+
+    def iter_join(self, nodes1, nodes2, rel_attrs):
+        """
+        Generates the edges from one set of nodes to another. The edges are
+        found by walking the adjacency of the nodes on the side with fewer
+        candidates, or by checking the candidate edges of an edge index if
+        there are fewer of those.
+
+        @type nodes1: Set of Integers or None
+        @param nodes1: Ids of the source nodes, or None for every node
+        @type nodes2: Set of Integers or None
+        @param nodes2: Ids of the target nodes, or None for every node
+        @type rel_attrs: Dictionary
+        @param rel_attrs: Relationship attributes to match
+        @rtype: Generator of tuples
+        @return: Edge tuples in the format (node1_id, node2_id,
+        edge_attributes), in no particular order
+        """
+        edge_keys = self.gs.edge_index.lookup(rel_attrs)
+        sizes = [len(nodes) for nodes in [nodes1, nodes2, edge_keys]
+            if nodes is not None]
+        if edge_keys is not None and len(edge_keys) == min(sizes):
+            succ = self.g.succ
+            for node1_id, node2_id in edge_keys:
+                edge_attrs = succ[node1_id][node2_id]
+                if (nodes1 is None or node1_id in nodes1) and \
+                    (nodes2 is None or node2_id in nodes2) and \
+                    has_attrs(edge_attrs, rel_attrs):
+                    yield (node1_id, node2_id, edge_attrs)
+        elif nodes2 is None or (nodes1 is not None and
+            len(nodes1) <= len(nodes2)):
+            if nodes1 is None:
+                nodes1 = self.g.succ
+            succ = self.g.succ
+            for node1_id in nodes1:
+                for node2_id, edge_attrs in succ[node1_id].iteritems():
+                    if (nodes2 is None or node2_id in nodes2) and \
+                        has_attrs(edge_attrs, rel_attrs):
+                        yield (node1_id, node2_id, edge_attrs)
         else:
-            nodes1 = self.match_node(node1_attrs)   
-        edges = self.match_rel(rel_attrs)   
-        node_rels = []
-        for node in nodes1:
-            # Finds all neighbors of node satisfying node 2 attributes
-            neighbors = self.filter_nodes(self.g.neighbors(node[0]), node2_attrs)
-            if (Filtered_nodes2 != None):   
-                Filtered_nodes2ids = []   
-                for node in Filtered_nodes2:   
-                    Filtered_nodes2ids.append(node[0])
-                neighbors = [val for val in neighbors if val in Filtered_nodes2ids]
-            for node2_id in neighbors:
-                # Iterates through out edges of first node
-                in_edges = self.g.in_edges(node[0], data=True)   
-                out_edges = self.g.out_edges(node[0], data=True)
-                for edge in edges:   
-                    if (edge in in_edges or edge in out_edges) and node2_id in edge:   
-                        node_rels.append(edge) 
-        return node_rels
+            pred = self.g.pred
+            for node2_id in nodes2:
+                for node1_id, edge_attrs in pred[node2_id].iteritems():
+                    if (nodes1 is None or node1_id in nodes1) and \
+                        has_attrs(edge_attrs, rel_attrs):
+                        yield (node1_id, node2_id, edge_attrs)
+
+    def candidate_nodes(self, node_attrs, filtered_nodes=None):
+        """
+        Finds the ids of the nodes that can be an end of a matched edge.
+
+        @type node_attrs: Dictionary
+        @param node_attrs: Node attributes to match
+        @type filtered_nodes: List of tuples or None
+        @param filtered_nodes: Node tuples already matched and filtered by
+        predicates, used instead of the node attributes if given
+        @rtype: Set of Integers or None
+        @return: Ids of the nodes, or None if every node can be an end
+        """
+        if filtered_nodes is not None:
+            return set(node[0] for node in filtered_nodes)
+        if not node_attrs:
+            return None
+        return set(node[0] for node in self.iter_nodes(node_attrs))
 
     def filter_nodes(self, node_id_lst, node_attrs):
         """
@@ -150,11 +236,32 @@ class QueryEvaluator:
         @rtype: list of tuples
         @return: Edge tuples in the format (node1_id, node2_id, edge_attributes)           
         """   
-        edges = []   
-        for node1_id, node2_id, edge_attributes in self.g.edges(data=True):   
-            if all(item in edge_attributes.items() for item in rel_attrs.items()):
-                edges.append((node1_id, node2_id, edge_attributes))
-        return edges       
+        return list(self.iter_rels(rel_attrs))
+
+    def iter_rels(self, rel_attrs):
+        """
+        Generates the relationships that have the specified relationship
+        attributes one at a time.
+
+        @type rel_attrs: Dictionary
+        @param rel_attrs: Relationship attributes to match
+        @rtype: Generator of tuples
+        @return: Edge tuples in the format (node1_id, node2_id, edge_attributes)
+        """
+        succ = self.g.succ
+        # Only the edges having an indexed value need to be checked
+        keys = self.gs.edge_index.lookup(rel_attrs)
+        if keys is not None:
+            for node1_id, node2_id in sorted(keys):
+                edge_attrs = succ[node1_id][node2_id]
+                if has_attrs(edge_attrs, rel_attrs):
+                    yield (node1_id, node2_id, edge_attrs)
+            return
+
+        for node1_id, out in succ.iteritems():
+            for node2_id, edge_attrs in out.iteritems():
+                if has_attrs(edge_attrs, rel_attrs):
+                    yield (node1_id, node2_id, edge_attrs)
     
     def match_node(self, node_attrs):   
         """ 
@@ -165,12 +272,80 @@ class QueryEvaluator:
         @rtype: list of tuples
         @return: Node tuples of the format (node_id, node_attributes)              
         """
-        nodes = []
-        for node_id, node_attributes in self.g.nodes(data=True):   
-            if all(item in node_attributes.items() for item in 
-            node_attrs.items()):   
-               nodes.append((node_id, node_attributes))
-        return nodes
+        return list(self.iter_nodes(node_attrs))
+
+    def iter_nodes(self, node_attrs):
+        """
+        Generates the nodes that have the specified node attributes one at
+        a time.
+
+        @type node_attrs: Dictionary
+        @param node_attrs: Node attributes to match
+        @rtype: Generator of tuples
+        @return: Node tuples of the format (node_id, node_attributes)
+        """
+        node = self.g.node
+        # Only the nodes having an indexed value need to be checked
+        node_ids = self.gs.node_index.lookup(node_attrs)
+        if node_ids is not None:
+            for node_id in sorted(node_ids):
+                if has_attrs(node[node_id], node_attrs):
+                    yield (node_id, node[node_id])
+            return
+
+        for node_id, node_attributes in node.iteritems():
+            if has_attrs(node_attributes, node_attrs):
+                yield (node_id, node_attributes)
+
+    def iter_node_ids(self, node_ids, node_attrs, attr_names=()):
+        """
+        Generates the nodes of a set of node ids that exist and have the
+        specified node attributes, one at a time.
+
+        @type node_ids: Iterable of Integers
+        @param node_ids: Ids of the candidate nodes
+        @type node_attrs: Dictionary
+        @param node_attrs: Node attributes to match
+        @type attr_names: List of Strings
+        @param attr_names: Names of attributes the nodes must have, whatever
+        their values
+        @rtype: Generator of tuples
+        @return: Node tuples of the format (node_id, node_attributes)
+        """
+        node = self.g.node
+        for node_id in node_ids:
+            node_attributes = node.get(node_id)
+            if node_attributes is not None and \
+                has_attrs(node_attributes, node_attrs) and \
+                all(attr in node_attributes for attr in attr_names):
+                yield (node_id, node_attributes)
+
+    def iter_filter(self, nodes, node_filter, chunk_size=FILTER_CHUNK_SIZE):
+        """
+        Filters generated nodes a chunk at a time, so a filter working on
+        lists of nodes can be applied without collecting every node first.
+        The first chunk is small so the first nodes come out quickly, and
+        every chunk is twice as large as the one before up to
+        MAX_FILTER_CHUNK_SIZE, so long results are filtered in few passes.
+
+        @type nodes: Iterable of tuples
+        @param nodes: Node tuples of the format (node_id, node_attributes)
+        @type node_filter: Function
+        @param node_filter: Function taking and returning a list of node
+        tuples
+        @type chunk_size: Integer
+        @param chunk_size: Number of nodes in the first chunk
+        @rtype: Generator of tuples
+        @return: Node tuples kept by the filter
+        """
+        nodes = iter(nodes)
+        while True:
+            chunk = list(islice(nodes, chunk_size))
+            if not chunk:
+                return
+            for node in node_filter(chunk):
+                yield node
+            chunk_size = min(2 * chunk_size, MAX_FILTER_CHUNK_SIZE)
 
 
     def add_node(self, node_attrs):
@@ -187,6 +362,7 @@ class QueryEvaluator:
         """
         self.gs.inc_id()
         self.g.add_node(self.gs.get_id(), node_attrs)
+        self.gs.notify('node_added', self.gs.get_id(), node_attrs)
         return (self.gs.get_id(), node_attrs)   
 
     def add_relationship(self, node1, node2, edge_attrs):
@@ -207,9 +383,101 @@ class QueryEvaluator:
         """
         node1_id, node1_props = node1
         node2_id, node2_props = node2
-        self.g.add_edge(node1_id, node2_id, edge_attrs)   
+        if self.g.has_edge(node1_id, node2_id):
+            old_attrs = dict(self.g[node1_id][node2_id])
+            self.g.add_edge(node1_id, node2_id, edge_attrs)
+            self.gs.notify('edge_changed', node1_id, node2_id, old_attrs,
+                self.g[node1_id][node2_id])
+        else:
+            self.g.add_edge(node1_id, node2_id, edge_attrs)
+            self.gs.notify('edge_added', node1_id, node2_id,
+                self.g[node1_id][node2_id])
         return (node1_id, node2_id, edge_attrs)
 
+    def add_nodes(self, node_attrs_list):
+        """
+        Creates a node for every attribute dictionary in the list. The ids
+        are assigned in one step and the nodes are stored directly in the
+        graph, which is much faster than calling L{add_node} for every
+        node when loading large graphs.
+
+        @type node_attrs_list: list of dicts
+        @param node_attrs_list: Attributes of the nodes to create
+        @rtype: list of Integers
+        @return: Unique ids of the created nodes, in the order of the
+                attribute dictionaries.
+        """
+        start = self.gs.get_id() + 1
+        node_ids = range(start, start + len(node_attrs_list))
+        self.gs.set_id(start + len(node_attrs_list) - 1)
+        node = self.g.node
+        succ = self.g.succ
+        pred = self.g.pred
+        for node_id, node_attrs in zip(node_ids, node_attrs_list):
+            node[node_id] = node_attrs
+            succ[node_id] = {}
+            pred[node_id] = {}
+        if self.gs.listeners:
+            for node_id, node_attrs in zip(node_ids, node_attrs_list):
+                self.gs.notify('node_added', node_id, node_attrs)
+        else:
+            self.gs.statistics.nodes_added(node_ids, node_attrs_list)
+        return node_ids
+
+    def add_relationships(self, edges):
+        """
+        Creates the relationships in the list between existing nodes. An
+        edge that already exists gets the new attributes added to it, like
+        in L{add_relationship}. The adjacency of the graph is filled in
+        directly, which is much faster than calling L{add_relationship} for
+        every edge when loading large graphs.
+
+        @type edges: list of tuples
+        @param edges: Edges in the format (starting node id, ending node id,
+                      edge attributes)
+        @rtype: Integer
+        @return: Number of relationships that did not exist before.
+        """
+        succ = self.g.succ
+        pred = self.g.pred
+        count = 0
+        if not self.gs.listeners:
+            # The statistics are updated once for all the new edges
+            statistics = self.gs.statistics
+            added = []
+            for node1_id, node2_id, edge_attrs in edges:
+                out = succ[node1_id]
+                if node2_id in out:
+                    if edge_attrs:
+                        attrs = out[node2_id]
+                        old_attrs = dict(attrs)
+                        attrs.update(edge_attrs)
+                        statistics.edge_changed(node1_id, node2_id, 
+                            old_attrs, attrs)
+                else:
+                    attrs = edge_attrs.copy()
+                    out[node2_id] = attrs
+                    pred[node2_id][node1_id] = attrs
+                    added.append((node1_id, node2_id, attrs))
+            statistics.edges_added(added)
+            return len(added)
+
+        for node1_id, node2_id, edge_attrs in edges:
+            out = succ[node1_id]
+            if node2_id in out:
+                attrs = out[node2_id]
+                old_attrs = dict(attrs)
+                attrs.update(edge_attrs)
+                self.gs.notify('edge_changed', node1_id, node2_id, old_attrs,
+                    attrs)
+            else:
+                attrs = edge_attrs.copy()
+                out[node2_id] = attrs
+                pred[node2_id][node1_id] = attrs
+                count += 1
+                self.gs.notify('edge_added', node1_id, node2_id, attrs)
+        return count
+
     def delete_node(self, node_attrs):   
         """ 
         Deletes the nodes containing the specified node attributes and all of   
@@ -222,7 +490,12 @@ class QueryEvaluator:
         """   
         nodes = self.match_node(node_attrs)   
         for node in nodes:   
+            # Remember the edges removed along with the node
+            edges = self.g.out_edges(node[0], data=True)
+            edges += [edge for edge in self.g.in_edges(node[0], data=True)
+                if edge[0] != edge[1]]
             self.g.remove_node(node[0])   
+            self.gs.notify('node_removed', node[0], node[1], edges)
             
             self.gs.delete_identifier(node)      
 
@@ -239,6 +512,7 @@ class QueryEvaluator:
         edges = self.match_rel(rel_attrs)
         for edge in edges:
             self.g.remove_edge(edge[0], edge[1])   
+            self.gs.notify('edge_removed', edge[0], edge[1], edge[2])
 
     def modify_node(self, node_attrs, attr_change, update_type):   
         """ 
@@ -259,6 +533,7 @@ class QueryEvaluator:
         nodes = self.match_node(node_attrs)   
         for node1 in nodes:
             current_node_attrs = self.g.node[node1[0]] 
+            old_attrs = dict(current_node_attrs)
             if not update_type:   
                 key_values = attr_change.keys()
                 for key_val in key_values:   
@@ -269,6 +544,8 @@ class QueryEvaluator:
                 for key_val in attr_keys:   
                     current_node_attrs[key_val] = attr_change[key_val]   
                 self.g.node[node1[0]] = current_node_attrs   
+            self.gs.notify('node_changed', node1[0], old_attrs,
+                current_node_attrs)
 
     def modify_rel(self, rel_attrs, rel_change, update_type):   
         """ 
@@ -289,6 +566,7 @@ class QueryEvaluator:
         edges = self.match_rel(rel_attrs)   
         for edge in edges:   
             current_edge_attrs = self.g[edge[0]][edge[1]]   
+            old_attrs = dict(current_edge_attrs)
             if (not update_type):   
                 key_values = rel_change.keys()
                 for key_val in key_values:   
@@ -299,6 +577,8 @@ class QueryEvaluator:
                 for key_val in attr_keys:   
                     current_edge_attrs[key_val] = rel_change[key_val]   
                 self.g[edge[0]][edge[1]] = current_edge_attrs   
+            self.gs.notify('edge_changed', edge[0], edge[1], old_attrs,
+                current_edge_attrs)
 
     def set_rel_attrs(self, node1_id, node2_id, rel_attrs):   
         """ 
@@ -314,7 +594,12 @@ class QueryEvaluator:
         @rtype: None
         @return: None           
         """   
-        self.g[node1_id][node2_id] = rel_attrs  
+        # Both adjacencies share the attribute dictionary of an edge
+        old_attrs = self.g.succ[node1_id][node2_id]
+        self.g.succ[node1_id][node2_id] = rel_attrs
+        self.g.pred[node2_id][node1_id] = rel_attrs
+        self.gs.notify('edge_changed', node1_id, node2_id, old_attrs, 
+            rel_attrs)
 
     def get_rel_attrs(self, node1_id, node2_id):   
         """ 
@@ -352,74 +637,210 @@ class QueryEvaluator:
         @rtype: None
         @return: None           
         """   
+        old_attrs = self.g.node[node_id]
         self.g.node[node_id] = node_attributes
+        self.gs.notify('node_changed', node_id, old_attrs, node_attributes)
 
-    def consolidate(self, edge_list):   
-        """ 
-        Consolidates the connected nodes in the edge_list by checking if   
-        there are common nodes in the edge tuples 
-
-        @type edge_list: Dictionary
-        @param edge_list: Dictionary containing lists of edge 
-        tuples to consolidate  
-        @rtype: Dictionary
-        @return: Consolidated dictionary of lists of edge tuples.            
-        """      
-        i = 0
-        consolidated_list = {}
-        consolidated_nodes = []
-        for x in range(len(edge_list) - 1):
-            nodes1 = edge_list[x]
-            nodes2 = edge_list[x + 1]
-            for node1 in nodes1:
-                for node2 in nodes2:   
-                    if (node1[1] == node2[0]):   
-                        consolidated_nodes.append((node1[0], node2[1]))   
-            if (not consolidated_nodes):   
-                return None   
-            consolidated_list[i] = consolidated_nodes
-            i += 1
-        return consolidated_list
-    
-    def multi_match(self, node_attr_list, rel_attr_list, filtered_nodes):   
+    def multi_match(self, node_attr_list, rel_attr_list, filtered_nodes=None, 
+        start=0, node_filters=None):   
         """ 
         Determines if there is a chain of nodes described by the node_attr_list   
         and rel_attr_list in the graph. Then returns the first and last node   
         of this chain.    
 
+        The chain is expanded one relationship at a time in both directions
+        from the start node, usually chosen by the L{Planner}. Each frontier
+        maps the nodes reached so far to the start nodes of the chains
+        reaching them, and the edges of the next relationship are only
+        looked up from the nodes of the frontier, so chains that meet at a
+        node are followed once.
+
         @type node_attr_list: List of node attributes   
         @param node_attr_list: List of node attributes to match the nodes in 
         the desired chain.   
         @type rel_attr_list: List of relationship attributes   
         @param rel_attr_list: List of relationship attributes to match 
         the edes in the chain    
-        @rtype: Dictionary
-        @return: The first and last node of the chain found or None if no   
-        chain exists with the specified node attributes and   
-        the relationship attributes             
+        @type filtered_nodes: List
+        @param filtered_nodes: For each node of the chain, the node tuples
+        already matched and filtered by predicates, or None
+        @type start: Integer
+        @param start: Position of the node the chain is expanded from
+        @type node_filters: List
+        @param node_filters: For each node of the chain, a function taking
+        and returning a list of node tuples, which filters the nodes the
+        chain reaches, or None
+        @rtype: List of tuples
+        @return: The matching edges if the chain has one relationship,
+        otherwise the distinct (first node id, last node id) pairs of the
+        chains found. None if no chain exists with the specified node
+        attributes and the relationship attributes             
         """   
-        i = 0   
-        edge_list = {}   
-        for x in range(len(node_attr_list) - 1):   
-            edges = self.match_node_node_rel(node_attr_list[x], 
-                node_attr_list[x + 1], rel_attr_list[x], filtered_nodes[x], filtered_nodes[x + 1])   
+        count = len(node_attr_list)
+        if filtered_nodes is None:
+            filtered_nodes = [None] * count
+        if node_filters is None:
+            node_filters = [None] * count
+        if len(rel_attr_list) == 1:
+            edges = self.match_node_node_rel(node_attr_list[0], 
+                node_attr_list[1], rel_attr_list[0], filtered_nodes[0], 
+                filtered_nodes[1])
+            for position in range(2):
+                if node_filters[position] is not None:
+                    kept = self.filter_ids(set(edge[position] 
+                        for edge in edges), node_filters[position])
+                    edges = [edge for edge in edges if edge[position] in kept]
+            return edges or None
+
+        start_ids = self.candidate_nodes(node_attr_list[start], 
+            filtered_nodes[start])
+        if start_ids is None:
+            start_ids = self.g.node
+        if node_filters[start] is not None:
+            start_ids = self.filter_ids(start_ids, node_filters[start])
+        # Chains to the right of the start by their last node, and to the
+        # left by their first node
+        lasts = dict((node_id, set([node_id])) for node_id in start_ids)
+        firsts = dict((node_id, set([node_id])) for node_id in start_ids)
+        for x in range(start, count - 1):
+            lasts = self.expand(lasts, node_attr_list[x + 1], 
+                rel_attr_list[x], filtered_nodes[x + 1], node_filters[x + 1], 
+                True)
             # Break out if no match exists between the nodes and relationship
-            if edges == []:
-                edge_list = {}
-                break
-            edge_list[i] = edges   
-            i += 1
-
-        # Return none if no match was found
-        if edge_list == {}:
-            return None
-
-        while (len(edge_list) != 1):   
-            edge_list = self.consolidate(edge_list)   
-            if (edge_list == {}):   
+            if not lasts:
                 return None
-                
-        return (edge_list[0])   
+        for x in range(start - 1, -1, -1):
+            firsts = self.expand(firsts, node_attr_list[x], rel_attr_list[x], 
+                filtered_nodes[x], node_filters[x], False)
+            if not firsts:
+                return None
+
+        # Join both halves of the chains on their start node
+        last_ids = {}
+        for last_id, start_ids in lasts.iteritems():
+            for start_id in start_ids:
+                last_ids.setdefault(start_id, []).append(last_id)
+        pairs = set()
+        for first_id, start_ids in firsts.iteritems():
+            for start_id in start_ids:
+                for last_id in last_ids.get(start_id, ()):
+                    pairs.add((first_id, last_id))
+        return sorted(pairs) or None
+
+    def expand(self, frontier, node_attrs, rel_attrs, filtered_nodes, 
+        node_filter, forward):
+        """
+        Expands a chain by one relationship.
+
+        @type frontier: Dictionary
+        @param frontier: Sets of start node ids by the id of the node at the
+        end of the chain
+        @type node_attrs: Dictionary
+        @param node_attrs: Attributes of the next node of the chain
+        @type rel_attrs: Dictionary
+        @param rel_attrs: Attributes of the relationship to the next node
+        @type filtered_nodes: List of tuples or None
+        @param filtered_nodes: Node tuples the next node can be
+        @type node_filter: Function or None
+        @param node_filter: Function filtering the node tuples reached
+        @type forward: Boolean
+        @param forward: True to follow the relationship from the end of the
+        chain, False to follow it backwards
+        @rtype: Dictionary
+        @return: Sets of start node ids by the id of the next node
+        """
+        nodes = self.candidate_nodes(node_attrs, filtered_nodes)
+        joined = {}
+        if forward:
+            for node1_id, node2_id, edge_attrs in self.iter_join(frontier, 
+                nodes, rel_attrs):
+                joined.setdefault(node2_id, set()).update(frontier[node1_id])
+        else:
+            for node1_id, node2_id, edge_attrs in self.iter_join(nodes, 
+                frontier, rel_attrs):
+                joined.setdefault(node1_id, set()).update(frontier[node2_id])
+        if node_filter is not None and joined:
+            kept = self.filter_ids(joined, node_filter)
+            joined = dict((node_id, joined[node_id]) for node_id in kept)
+        return joined
+
+    def filter_ids(self, node_ids, node_filter):
+        """
+        Filters nodes by their attributes.
+
+        @type node_ids: Iterable of Integers
+        @param node_ids: Ids of the nodes to filter
+        @type node_filter: Function
+        @param node_filter: Function taking and returning a list of node
+        tuples
+        @rtype: Set of Integers
+        @return: Ids of the nodes kept by the filter
+        """
+        node = self.g.node
+        return set(kept[0] for kept in 
+            node_filter([(node_id, node[node_id]) for node_id in node_ids]))
+
+    def iter_chain(self, node_attr_list, rel_attr_list, filtered_nodes=None, 
+        node_filters=None):
+        """
+        Generates the (first node id, last node id) pairs of the chains
+        found by L{multi_match} one at a time. Unlike L{multi_match}, the
+        chains are followed from one first node at a time, so the first
+        pairs are found without expanding every chain.
+
+        @type node_attr_list: List of node attributes   
+        @param node_attr_list: List of node attributes to match the nodes in 
+        the desired chain.   
+        @type rel_attr_list: List of relationship attributes   
+        @param rel_attr_list: List of relationship attributes to match 
+        the edes in the chain    
+        @type filtered_nodes: List
+        @param filtered_nodes: For each node of the chain, the node tuples
+        already matched and filtered by predicates, or None
+        @type node_filters: List
+        @param node_filters: For each node of the chain, a function taking
+        and returning a list of node tuples, which filters the nodes the
+        chain reaches, or None
+        @rtype: Generator of tuples
+        @return: Distinct (first node id, last node id) pairs, grouped by
+        their first node
+        """
+        count = len(node_attr_list)
+        if filtered_nodes is None:
+            filtered_nodes = [None] * count
+        if node_filters is None:
+            node_filters = [None] * count
+        candidates = [self.candidate_nodes(node_attr_list[x], 
+            filtered_nodes[x]) for x in range(count)]
+        first_nodes = self.iter_nodes(node_attr_list[0])
+        if candidates[0] is not None:
+            node = self.g.node
+            first_nodes = ((node_id, node[node_id]) 
+                for node_id in candidates[0])
+        if node_filters[0] is not None:
+            first_nodes = self.iter_filter(first_nodes, node_filters[0])
+
+        succ = self.g.succ
+        for first_id, first_attrs in first_nodes:
+            # Nodes reached by the chains from the first node, each once
+            frontier = [first_id]
+            for x in range(count - 1):
+                nodes = candidates[x + 1]
+                rel_attrs = rel_attr_list[x]
+                reached = set()
+                for node1_id in frontier:
+                    for node2_id, edge_attrs in succ[node1_id].iteritems():
+                        if (nodes is None or node2_id in nodes) and \
+                            has_attrs(edge_attrs, rel_attrs):
+                            reached.add(node2_id)
+                if node_filters[x + 1] is not None and reached:
+                    reached = self.filter_ids(reached, node_filters[x + 1])
+                if not reached:
+                    break
+                frontier = reached
+            else:
+                for last_id in sorted(frontier):
+                    yield (first_id, last_id)
 
     def check_path(self, source_id, target_id):   
         """ 
@@ -465,6 +886,8 @@ class QueryEvaluator:
                       
         """   
         self.gs.clear_all()
+        self.g = self.gs.get_graph()
+        self.gs.notify('graph_cleared')
 
     def is_connected(self, node1_id, node2_id):   
         """ 
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+
+# Default number of results kept in the cache
+RESULT_CACHE_SIZE = 256
+# Default number of rows kept in the cache, results with more rows than a
+# quarter of it are not cached
+RESULT_CACHE_ROWS = 1 << 18
+# Commands that only read the graph, whose results can be cached
+CACHED_COMMANDS = frozenset(["MATCH", "NEIGHBOR", "SHORTESTPATH", "HASPATH",
+    "HASEDGE"])
+
+
+def count_rows(result):
+    """
+    @type result: Tuple
+    @param result: Result of a command, see L{ResultCache.put}
+    @rtype: Integer
+    @return: Number of rows of the result
+    """
+    return len(result[1] or ())
+
+
+class ResultCache:
+    """
+    Least recently used cache of the results of the commands that only
+    read the graph, such as MATCH and NEIGHBOR. A command is looked up by
+    its parsed form, so statements that only differ in their whitespace or
+    in how a value is written share a result.
+
+    A result is what the command found, as the name of the L{Linker}
+    method printing it and the rows it prints, and the identifiers the
+    command set. A cached result is printed again by that method, so
+    nothing else printed while the command ran is repeated. A result is
+    only used while the graph has not changed since the command was run: every change to the graph moves the epoch of the
+    L{GraphStatistics} on, which makes every cached result stale without
+    looking at them. Stale results are dropped when they are looked up or
+    evicted.
+
+    The cache keeps at most a number of results and of rows, and counts its
+    hits and misses.
+    """
+
+    def __init__(self, gs, size=RESULT_CACHE_SIZE,
+        max_rows=RESULT_CACHE_ROWS):
+        """
+        Creates an empty cache.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph the results are computed from
+        @type size: Integer
+        @param size: Maximum number of results to keep
+        @type max_rows: Integer
+        @param max_rows: Maximum number of rows to keep
+        """
+        self.gs = gs
+        self.size = size
+        self.max_rows = max_rows
+        # Tuples of the epoch, result and identifiers of a command by key
+        self.results = OrderedDict()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, obj, attribute_list):
+        """
+        Returns the key of a command in the cache.
+
+        @type obj: L{Command_Struct} object
+        @param obj: Command
+        @type attribute_list: List
+        @param attribute_list: Attribute list of the command, with the
+        values converted to their declared types
+        @rtype: Tuple
+        @return: Key of the command
+        """
+        return (obj.get_command(), tuple((item[0], item[1],
+            tuple(sorted(item[2].iteritems()))) for item in attribute_list),
+            repr(obj.get_names()), obj.get_limit())
+
+    def get(self, key):
+        """
+        Looks up the result of a command and marks it as the most recently
+        used.
+
+        @type key: Tuple
+        @param key: Key of the command, see L{key}
+        @rtype: Tuple or None
+        @return: Result and identifiers of the command, or None if there is
+        no current result
+        """
+        result = self.results.pop(key, None)
+        if result is not None and result[0] != self.gs.statistics.epoch:
+            self.rows -= count_rows(result[1])
+            result = None
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results[key] = result
+        return result[1:]
+
+    def put(self, key, epoch, result, identifiers):
+        """
+        Adds the result of a command, evicting the least recently used
+        results until it fits.
+
+        @type key: Tuple
+        @param key: Key of the command, see L{key}
+        @type epoch: Integer
+        @param epoch: Epoch of the graph the result was computed from
+        @type result: Tuple
+        @param result: Name of the L{Linker} method printing the result of
+        the command, and the rows it prints
+        @type identifiers: Dictionary
+        @param identifiers: Identifiers set by the command and their values
+        """
+        old = self.results.pop(key, None)
+        if old is not None:
+            self.rows -= count_rows(old[1])
+        rows = count_rows(result)
+        while self.results and (len(self.results) >= self.size or
+            self.rows + rows > self.max_rows):
+            evicted = self.results.popitem(last=False)[1]
+            self.rows -= count_rows(evicted[1])
+        self.results[key] = (epoch, result, identifiers)
+        self.rows += rows
+
+    def run(self, key, function, show, *args):
+        """
+        Runs a command, or shows its cached result and sets its identifiers
+        again if the cache has a current one. The result of the command is
+        cached unless it changed the graph or has too many rows.
+
+        @type key: Tuple
+        @param key: Key of the command, see L{key}
+        @type function: Function
+        @param function: Function running the command, which returns its
+        result, see L{put}, or None if it cannot be cached
+        @type show: Function
+        @param show: Function printing a cached result
+        @type args: Anything
+        @param args: Arguments of the function
+        """
+        cached = self.get(key)
+        if cached is not None:
+            result, identifiers = cached
+            show(result)
+            self.gs.identifier.update(identifiers)
+            return
+        epoch = self.gs.statistics.epoch
+        before = dict(self.gs.identifier)
+        result = function(*args)
+        if result is None or self.gs.statistics.epoch != epoch or \
+            count_rows(result) > self.max_rows >> 2:
+            return
+        identifiers = dict((name, value) for name, value in
+            self.gs.identifier.iteritems() if before.get(name) is not value)
+        self.put(key, epoch, result, identifiers)
+
+    def clear(self):
+        """
+        Removes every result from the cache.
+        """
+        self.results.clear()
+        self.rows = 0
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        ratio = 100.0 * self.hits / lookups if lookups else 0.0
+        return "Result cache: " + str(len(self.results)) + " results, " + \
+            str(self.hits) + " hits, " + str(self.misses) + " misses, " + \
+            "%.1f%% hit ratio" % ratio
@@ -0,0 +1,239 @@
+import os
+import re
+
+# Integers written without leading zeros, so values such as zip codes
+# keep their digits
+INT_RE = re.compile(r"^-?(0|[1-9][0-9]*)$")
+FLOAT_RE = re.compile(
+    r"^-?[0-9]+(\.[0-9]+([eE][-+]?[0-9]+)?|[eE][-+]?[0-9]+)$")
+# Types of attribute values that predicates compare without converting
+NUMBER_TYPES = (int, long, float)
+# Type names of SCHEMA, auto removes the declared type of an attribute
+TYPE_NAMES = ("int", "float", "bool", "string", "auto")
+
+
+def infer_value(text):
+    """
+    Converts the text of an attribute value to the value it stands for:
+    an int, a float, a bool for true or false, and otherwise the text.
+
+    @type text: String
+    @param text: Attribute value as written in a command
+    @rtype: Integer, Float, Boolean or String
+    @return: The typed value
+    """
+    if INT_RE.match(text):
+        return int(text)
+    if FLOAT_RE.match(text):
+        return float(text)
+    lower = text.lower()
+    if lower == "true":
+        return True
+    if lower == "false":
+        return False
+    return text
+
+
+def infer_attrs(attrs):
+    """
+    Types the string values of an attribute dictionary in place, like the
+    values of commands, see L{infer_value}.
+
+    @type attrs: Dictionary
+    @param attrs: Attributes of a node or edge
+    @rtype: Boolean
+    @return: True if a value was typed
+    """
+    typed = False
+    for attr, value in attrs.items():
+        if isinstance(value, str):
+            new_value = infer_value(value)
+            if new_value is not value:
+                attrs[attr] = new_value
+                typed = True
+    return typed
+
+
+def convert_value(value, type_name):
+    """
+    Converts an attribute value to a declared type. Numbers are only
+    converted to ints if they have no fraction, and strings of digits
+    with leading zeros are numbers too.
+
+    @type value: Anything
+    @param value: Attribute value
+    @type type_name: String
+    @param type_name: One of TYPE_NAMES except auto
+    @rtype: Integer, Float, Boolean or String
+    @return: The converted value
+    @raise ValueError: If the value does not have the type
+    """
+    if isinstance(value, basestring) and type_name != "string":
+        value = infer_value(value)
+        if isinstance(value, basestring) and type_name != "bool":
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+    if type_name == "string":
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return value if isinstance(value, basestring) else str(value)
+    if type_name == "bool":
+        if isinstance(value, bool):
+            return value
+        if type(value) in NUMBER_TYPES and value in (0, 1):
+            return bool(value)
+    elif type(value) in NUMBER_TYPES:
+        if type_name == "float":
+            return float(value)
+        if value % 1 == 0:
+            return int(value)
+    raise ValueError(str(value) + " is not a " + type_name)
+
+
+class Schema:
+    """
+    Declared types of node and edge attributes, set with the SCHEMA
+    command. Attribute values written in commands are typed when they are
+    parsed, see L{infer_value}, and the values of attributes with a
+    declared type are converted to it before a command runs, so a value
+    that cannot be converted is rejected instead of stored.
+
+    Declaring a type converts the values the graph already has, so every
+    value of the attribute has the type from then on. The declared types
+    are kept in a small text file, one "type: attribute type" per line,
+    so they are restored when the database is started.
+    """
+
+    def __init__(self, gs):
+        """
+        Creates a schema without any declared types.
+
+        @type gs: L{GraphStructure} object
+        @param gs: Graph whose attributes are typed
+        """
+        self.gs = gs
+        # Declared type names by attribute name, for n: and e:
+        self.types = {"n:": {}, "e:": {}}
+        self.schema_file = None
+
+    def load(self, schema_file):
+        """
+        Restores the types declared in the file, and keeps the file up to
+        date with later declarations. The values in the graph already have
+        the types, so they are not converted again.
+
+        @type schema_file: String
+        @param schema_file: File listing the declared types
+        """
+        self.schema_file = schema_file
+        if os.path.isfile(schema_file):
+            f = open(schema_file, 'r')
+            for line in f:
+                words = line.split()
+                if len(words) == 3:
+                    self.types[words[0]][words[1]] = words[2]
+            f.close()
+
+    def save(self):
+        """
+        Writes the declared types to the schema file.
+        """
+        if self.schema_file is None:
+            return
+        f = open(self.schema_file + '.tmp', 'w')
+        f.write(''.join(line + '\n' for line in self.report()))
+        f.close()
+        os.rename(self.schema_file + '.tmp', self.schema_file)
+
+    def report(self):
+        """
+        @rtype: List of strings
+        @return: One line for every declared type
+        """
+        return [attr_type + " " + attr + " " + type_name
+            for attr_type in ("n:", "e:")
+            for attr, type_name in sorted(self.types[attr_type].iteritems())]
+
+    def items(self, attr_type):
+        """
+        Returns the attribute dictionaries of the nodes or edges.
+
+        @type attr_type: String
+        @param attr_type: "n:" for nodes or "e:" for edges
+        @rtype: Iterator
+        @return: Tuples of the key of an item and its attributes
+        """
+        g = self.gs.get_graph()
+        if attr_type == "n:":
+            return g.node.iteritems()
+        return (((node1, node2), attrs)
+            for node1, node2, attrs in g.edges_iter(data=True))
+
+    def declare(self, attr_type, attr, type_name):
+        """
+        Declares the type of a node or edge attribute and converts the
+        values the graph has for it. Nothing is changed if one of the
+        values cannot be converted.
+
+        @type attr_type: String
+        @param attr_type: "n:" for nodes or "e:" for edges
+        @type attr: String
+        @param attr: Name of the attribute
+        @type type_name: String
+        @param type_name: One of TYPE_NAMES, auto removes the declaration
+        @rtype: Integer
+        @return: Number of values converted
+        @raise ValueError: If a value cannot be converted
+        """
+        types = self.types[attr_type]
+        if type_name == "auto":
+            types.pop(attr, None)
+            self.save()
+            return 0
+        changes = []
+        for key, attrs in self.items(attr_type):
+            if attr in attrs:
+                value = convert_value(attrs[attr], type_name)
+                if type(value) is not type(attrs[attr]) or \
+                    value != attrs[attr]:
+                    changes.append((key, attrs, value))
+        for key, attrs, value in changes:
+            old_attrs = dict(attrs)
+            attrs[attr] = value
+            if attr_type == "n:":
+                self.gs.notify('node_changed', key, old_attrs, attrs)
+            else:
+                self.gs.notify('edge_changed', key[0], key[1], old_attrs,
+                    attrs)
+        types[attr] = type_name
+        self.save()
+        return len(changes)
+
+    def convert(self, attribute_list):
+        """
+        Converts the attribute values of a parsed command to their
+        declared types. Parsed commands can be executed again, so items
+        whose values change are copied.
+
+        @type attribute_list: List
+        @param attribute_list: List of parsed objects, where each
+        element is of the form "Type: Identifier dictionary_attributes"
+        @rtype: List
+        @return: The attribute list with the values converted
+        @raise ValueError: If a value cannot be converted
+        """
+        if not self.types["n:"] and not self.types["e:"]:
+            return attribute_list
+        converted = []
+        for item in attribute_list:
+            types = self.types.get(item[0])
+            if types and any(attr in types for attr in item[2]):
+                attrs = dict(item[2])
+                for attr, value in attrs.iteritems():
+                    if attr in types:
+                        attrs[attr] = convert_value(value, types[attr])
+                item = [item[0], item[1], attrs]
+            converted.append(item)
+        return converted
@@ -2,11 +2,13 @@ import sys
 from parser import *
 from linker import Linker
 from graph_structure import GraphStructure
-from graph_storage import GraphStorage
+from graph_storage import GraphStorage, LOAD_PROCESSES
+from write_ahead_log import WriteAheadLog
+from checkpointer import Checkpointer
 import networkx as nx
 from utilities import Utilities
 from BatchExecute import BatchExecute
-from error_checking import Error_Checking
+from statement_cache import StatementCache
 import readline
 
 class StartDatabase:
@@ -27,15 +29,23 @@ class StartDatabase:
         # Loads data on disk
         self.graph_file = 'graph_file'
         self.id_file = 'id_file'
+        self.wal = WriteAheadLog('wal_file')
         self.load_persistent_data()
 
+        # Folds the log into the snapshot in the background
+        self.checkpointer = Checkpointer(self.gstorage, self.wal, 
+            self.graph_file, self.id_file)
+
         # Stores verbose flag
         self.verbose = verbose
 
+        # Parsed and checked statements, by their text
+        self.statement_cache = StatementCache()
+
         # If flag is set, need to execute commands in file that user passed.
         if flag:
             print "Loading batch file..."
-            BatchExecute(self.gs, sys.argv[1])
+            BatchExecute(self.gs, sys.argv[1], self.checkpointer)
             print "Done executing batch file!"
 
 
@@ -46,37 +56,25 @@ class StartDatabase:
         """
         print "Loading database from disk..."
         if Utilities.files_exist(self.graph_file, self.id_file):
-            self.gstorage.load_graph(self.graph_file, self.id_file)
+            self.gstorage.load_graph(self.graph_file, self.id_file,
+                LOAD_PROCESSES)
             print "Finished loading database from disk."
         else:
             print "No files to load from."
 
-    def has_Errors(self, parser):
-        """
-        This method checks the command entered by the user
-        for any errors and if there are any, don't create
-        a linker.
-
-        @type parser: Object
-        @param parser: Parser instance used to check for errors
-        @rtype: Boolean
-        @return: Boolean indicating whether errors exist
-        """
-
-        # First check if state machine produced any error
-        # If errors exist, then don't create linker
-        if (parser.get_Errors()):
-            print "State machine Error"
-            return True
+        # Reapplies the changes made since the last snapshot, then logs
+        # every further change
+        replayed = self.wal.replay(self.gs)
+        if replayed:
+            print "Replayed " + str(replayed) + " changes from the log."
+        self.wal.open()
+        self.gs.add_listener(self.wal)
 
-        # Create error class instance
-        errorCheck = Error_Checking(parser.get_object_list())
-        # If there are errors, don't create linker 
-        if errorCheck.check_commands():
-            print "Command state Error"
-            return True       
-
-        return False
+        # Rebuilds the indexes of node and edge attributes
+        self.gs.node_index.load('index_file')
+        self.gs.edge_index.load('edge_index_file')
+        # Restores the declared types of the attributes
+        self.gs.schema.load('schema_file')
 
     def run(self):
         """
@@ -101,30 +99,29 @@ class StartDatabase:
                 command = raw_input("... ")
             command_str = " ".join(commands)
 
-            # Start the parser and parse the commands
-            if (command_str[-1] == ";"):
-                real_command = command_str[:-1] + " ;" # need to add space for parser 
-                parser = Parser(real_command)
-                parser.run()
-            else:
-                print "ERROR INVALID QUERY"
-            
-
-            # Check if user entered any errors in query.
+            # Parse the commands and check them for errors, unless the
+            # same statement was seen before.
             # If there are no errors, then create linker
-            if (not(self.has_Errors(parser))):
-                linker = Linker(parser.get_object_list(), self.gs)
+            real_command = command_str[:-1] + " ;" # need to add space for parser 
+            commands = self.statement_cache.compile(real_command)
+            if commands is not None:
+                linker = Linker(commands, self.gs)
                 linker.execute()
             # Else, print the error
             else:
                 print "Invalid Query"
 
+            self.checkpointer.maybe_checkpoint()
+
 
     def exit(self):
         """
         Persists the graph data and exits the graph database.
         """
         print
+        if self.verbose:
+            print self.statement_cache
+            print self.gs.results
         self.persist_data()
         print "Exiting microDB..."
 
@@ -133,7 +130,10 @@ class StartDatabase:
         Persists the GraphStructure object onto disk.
         """
         print "Writing database back to disk..." 
+        self.checkpointer.wait()
         self.gstorage.write_graph(self.graph_file, self.id_file)
+        # Every logged change is now part of the snapshot
+        self.wal.truncate()
 
 
 # Start our main programs
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from parser import Parser
+from error_checking import Error_Checking
+from prepared_statement import PreparedStatement
+
+# Default number of statements kept in the cache.
+STATEMENT_CACHE_SIZE = 1024
+
+
+class StatementCache:
+    """
+    Least recently used cache of parsed and validated statements. A
+    statement is looked up by its text with the whitespace normalized, so a
+    statement that was seen before skips both the L{Parser} and the
+    L{Error_Checking} of its commands. Only statements without errors are
+    cached.
+
+    The cache also keeps the L{PreparedStatement} objects created by
+    PREPARE statements, which EXECUTE statements run.
+
+    The cached L{Command_Struct} objects are shared by every execution of
+    the statement, so the L{Linker} must not modify them.
+    """
+
+    def __init__(self, size=STATEMENT_CACHE_SIZE):
+        """
+        Creates an empty cache.
+
+        @type size: Integer
+        @param size: Maximum number of statements to keep
+        """
+        self.size = size
+        self.statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Prepared statements by their name
+        self.prepared = {}
+
+    def normalize(self, statement):
+        """
+        Returns the key of a statement in the cache. Runs of whitespace are
+        replaced by a single space, which the parser does not distinguish.
+
+        @type statement: String
+        @param statement: Statement formatted for the parser
+        @rtype: String
+        @return: Normalized statement
+        """
+        return " ".join(statement.split())
+
+    def get(self, statement):
+        """
+        Looks up a statement and marks it as the most recently used.
+
+        @type statement: String
+        @param statement: Statement formatted for the parser
+        @rtype: List of L{Command_Struct} objects or None
+        @return: Commands of the statement, or None if it is not cached
+        """
+        key = self.normalize(statement)
+        commands = self.statements.pop(key, None)
+        if commands is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.statements[key] = commands
+        return commands
+
+    def put(self, statement, commands):
+        """
+        Adds the commands of a statement, evicting the least recently used
+        statement if the cache is full.
+
+        @type statement: String
+        @param statement: Statement formatted for the parser
+        @type commands: List of L{Command_Struct} objects
+        @param commands: Validated commands of the statement
+        """
+        key = self.normalize(statement)
+        self.statements.pop(key, None)
+        if len(self.statements) >= self.size:
+            self.statements.popitem(last=False)
+        self.statements[key] = commands
+
+    def compile(self, statement, check=True):
+        """
+        Returns the commands of a statement, parsing and checking it only
+        if it is not cached yet.
+
+        @type statement: String
+        @param statement: Statement formatted for the parser
+        @type check: Boolean
+        @param check: Whether to check the commands with L{Error_Checking}
+        @rtype: List of L{Command_Struct} objects or None
+        @return: Commands of the statement, or None if it has errors
+        """
+        words = statement.split(None, 2)
+        if words and words[0].lower() == "prepare":
+            return self.prepare(words[1:])
+        if words and words[0].lower() == "execute":
+            return self.execute(statement.split()[1:-1])
+
+        commands = self.get(statement)
+        if commands is not None:
+            return commands
+        commands = self.parse(statement, check)
+        if commands is not None:
+            self.put(statement, commands)
+        return commands
+
+    def parse(self, statement, check=True):
+        """
+        Parses a statement and checks its commands for errors.
+
+        @type statement: String
+        @param statement: Statement formatted for the parser
+        @type check: Boolean
+        @param check: Whether to check the commands with L{Error_Checking}
+        @rtype: List of L{Command_Struct} objects or None
+        @return: Commands of the statement, or None if it has errors
+        """
+        parser = Parser(statement)
+        parser.run()
+        # If the state machine produced any error, the statement is invalid
+        if parser.get_Errors():
+            print "State machine Error"
+            return None
+        commands = parser.get_object_list()
+        if check and Error_Checking(commands).check_commands():
+            print "Command state Error"
+            return None
+        return commands
+
+    def prepare(self, words):
+        """
+        Executes a PREPARE statement, which parses and checks a statement
+        and stores it under a name for EXECUTE statements.
+
+        @type words: List of strings
+        @param words: Name of the prepared statement and the statement
+        @rtype: List or None
+        @return: No commands, or None if the statement has errors
+        """
+        if len(words) < 2:
+            print "ERROR: PREPARE needs a name and a statement"
+            return None
+        commands = self.parse(words[1])
+        if commands is None:
+            return None
+        self.prepared[words[0]] = PreparedStatement(words[0], commands)
+        return []
+
+    def execute(self, words):
+        """
+        Executes an EXECUTE statement, which binds values to the parameters
+        of a prepared statement.
+
+        @type words: List of strings
+        @param words: Name of the prepared statement and the values of its
+        parameters
+        @rtype: List of L{Command_Struct} objects or None
+        @return: Commands to execute, or None if the statement has errors
+        """
+        if not words or words[0] not in self.prepared:
+            print "ERROR: No prepared statement " + " ".join(words[:1])
+            return None
+        prepared = self.prepared[words[0]]
+        values = words[1:]
+        if len(values) != prepared.count:
+            print "ERROR: " + prepared.name + " takes " + \
+                str(prepared.count) + " values"
+            return None
+        return prepared.bind(values)
+
+    def clear(self):
+        """
+        Removes every statement from the cache.
+        """
+        self.statements.clear()
+
+    def __str__(self):
+        return "Statement cache: " + str(len(self.statements)) + \
+            " statements, " + str(self.hits) + " hits, " + \
+            str(self.misses) + " misses"
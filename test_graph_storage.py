@@ -0,0 +1,678 @@
+import os
+import shutil
+import tempfile
+import unittest
+from struct import pack
+from query_evaluator import QueryEvaluator
+from graph_structure import GraphStructure
+import graph_storage
+from graph_storage import GraphStorage
+from write_ahead_log import WriteAheadLog
+from csr_snapshot import CSRSnapshot
+from fileIO import write_array
+from checkpointer import Checkpointer
+from load_data import LoadData
+from import_checkpoint import ImportCheckpoint
+import BatchExecute as batch_execute
+from BatchExecute import BatchExecute
+from linker import Linker
+from statement_cache import StatementCache
+
+class TestGraphStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.graph_file = os.path.join(self.dir, 'graph_file')
+        self.id_file = os.path.join(self.dir, 'id_file')
+        self.wal_file = os.path.join(self.dir, 'wal_file')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_wal_replay(self):
+        """
+        Tests that L{WriteAheadLog.replay} restores every logged mutation.
+        """
+        gs = GraphStructure()
+        wal = WriteAheadLog(self.wal_file)
+        wal.open()
+        gs.add_listener(wal)
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Label' : 'Person', 'Name' : 'Alice', 'Age' : 23})
+        node2 = q.add_node({'Label' : 'Person', 'Name' : 'Bob'})
+        node3 = q.add_node({'Label' : 'Person', 'Name' : 'John'})
+        q.add_relationship(node1, node2, {'rel_type' : 'friend'})
+        q.add_relationship(node2, node3, {'rel_type' : 'friend'})
+        q.modify_node({'Name' : 'Bob'}, {'Age' : '10'}, True)
+        q.modify_rel({'rel_type' : 'friend'}, {'since' : 2010}, True)
+        q.delete_node({'Name' : 'John'})
+        wal.close()
+
+        gs2 = GraphStructure()
+        self.assertEqual(WriteAheadLog(self.wal_file).replay(gs2), 9)
+        g1, g2 = gs.get_graph(), gs2.get_graph()
+        self.assertEqual(sorted(g1.nodes(data=True)),
+            sorted(g2.nodes(data=True)))
+        self.assertEqual(sorted(g1.edges(data=True)),
+            sorted(g2.edges(data=True)))
+        self.assertEqual(gs2.get_id(), 3)
+
+    def test_wal_torn_record(self):
+        """
+        Tests that a partially written record at the end of the log is
+        ignored and cut off.
+        """
+        gs = GraphStructure()
+        wal = WriteAheadLog(self.wal_file)
+        wal.open()
+        gs.add_listener(wal)
+        q = QueryEvaluator(gs)
+        q.add_node({'Name' : 'Alice'})
+        q.add_node({'Name' : 'Bob'})
+        wal.close()
+        size = os.path.getsize(self.wal_file)
+        f = open(self.wal_file, 'r+b')
+        f.truncate(size - 3)
+        f.close()
+
+        gs2 = GraphStructure()
+        self.assertEqual(WriteAheadLog(self.wal_file).replay(gs2), 1)
+        self.assertEqual(gs2.get_graph().nodes(data=True),
+            [(1, {'Name' : 'Alice'})])
+        self.assertTrue(os.path.getsize(self.wal_file) < size - 3)
+
+    def test_checkpoint(self):
+        """
+        Tests that the log only has to hold changes made after the last
+        snapshot.
+        """
+        gs = GraphStructure()
+        gstorage = GraphStorage(gs)
+        wal = WriteAheadLog(self.wal_file)
+        wal.open()
+        gs.add_listener(wal)
+        q = QueryEvaluator(gs)
+        q.add_node({'Name' : 'Alice'})
+        gstorage.write_graph(self.graph_file, self.id_file)
+        wal.truncate()
+        q.add_node({'Name' : 'Bob'})
+        q.clear()
+        q.add_node({'Name' : 'John'})
+        wal.close()
+
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(WriteAheadLog(self.wal_file).replay(gs2), 3)
+        self.assertEqual(gs2.get_graph().nodes(data=True),
+            [(1, {'Name' : 'John'})])
+        self.assertEqual(gs2.get_id(), 1)
+
+    def test_snapshot(self):
+        """
+        Tests that a L{CSRSnapshot} written by L{GraphStorage.write_graph}
+        restores the graph and exposes its adjacency.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Label' : 'Person', 'Name' : u'Al\xefce', 
+            'Age' : 23, 'Height' : 1.5})
+        node2 = q.add_node({})
+        node3 = q.add_node({'Label' : 'Person', 'Tags' : ('a', 'b')})
+        q.add_relationship(node1, node2, {'rel_type' : 'friend'})
+        q.add_relationship(node2, node3, {})
+        q.add_relationship(node3, node1, {'since' : 2010})
+        q.add_relationship(node3, node3, {})
+        gstorage = GraphStorage(gs)
+        gstorage.write_graph(self.graph_file, self.id_file)
+
+        snapshot = CSRSnapshot(gstorage.segment_file(self.graph_file, 0, 1))
+        self.assertEqual(list(snapshot.successors(node3[0])), [1, 3])
+        self.assertEqual(list(snapshot.predecessors(node1[0])), [3])
+        self.assertEqual(list(snapshot.successors(4)), [])
+        self.assertEqual(snapshot.node_attrs(0), node1[1])
+        snapshot.close()
+
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        g1, g2 = gs.get_graph(), gs2.get_graph()
+        self.assertEqual(g1.nodes(data=True), g2.nodes(data=True))
+        self.assertEqual(sorted(g1.edges(data=True)),
+            sorted(g2.edges(data=True)))
+        self.assertEqual(sorted(g1.in_edges(1, data=True)),
+            sorted(g2.in_edges(1, data=True)))
+        self.assertEqual(gs2.get_id(), 3)
+
+    def test_saved_statistics(self):
+        """
+        Tests that the L{GraphStatistics} are saved with a snapshot and only
+        loaded with the same graph.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Label' : 'Person'})
+        node2 = q.add_node({'Label' : 'Person'})
+        q.add_relationship(node1, node2, {'rel_type' : 'friend'})
+        gstorage = GraphStorage(gs)
+        gstorage.write_graph(self.graph_file, self.id_file)
+
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(gs2.statistics.node_values,
+            {'Label' : {'Person' : 2}})
+        self.assertEqual(gs2.statistics.out_degrees, {0 : 1, 1 : 1})
+        # Statistics saved with another graph are computed again
+        gs.statistics.edges = 5
+        stats_file = gstorage.stats_file(self.graph_file, gstorage.generation)
+        gs.statistics.save(stats_file)
+        self.assertFalse(gs2.statistics.load(stats_file))
+        gs3 = GraphStructure()
+        GraphStorage(gs3).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(gs3.statistics.edges, 1)
+
+    def test_interrupted_write(self):
+        """
+        Tests that a crash while L{GraphStorage.write_graph} writes the
+        graph leaves the previous write of the graph to load, and that the
+        files of the interrupted write are removed by the next write.
+        """
+        gs = GraphStructure()
+        gstorage = GraphStorage(gs, 2)
+        q = QueryEvaluator(gs)
+        nodes = [q.add_node({'Name' : str(i)}) for i in range(4)]
+        q.add_relationship(nodes[0], nodes[3], {'rel_type' : 'friend'})
+        gstorage.write_graph(self.graph_file, self.id_file)
+        saved = [(node_id, dict(attrs)) for node_id, attrs in
+            sorted(gs.get_graph().nodes(data=True))]
+
+        q.modify_node({'Name' : '0'}, {'Age' : 10}, True)
+        q.delete_node({'Name' : '3'})
+        q.add_node({'Name' : '4'})
+        for crash in ['write_manifest', 'save']:
+            target = gstorage if crash == 'write_manifest' else gs.statistics
+            def fail(*args):
+                raise IOError("disk full")
+            setattr(target, crash, fail)
+            try:
+                self.assertRaises(IOError, gstorage.write_graph,
+                    self.graph_file, self.id_file)
+            finally:
+                delattr(target, crash)
+            gs2 = GraphStructure()
+            GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+            self.assertEqual(sorted(gs2.get_graph().nodes(data=True)), saved)
+            self.assertEqual(gs2.get_graph().edges(), [(1, 4)])
+            self.assertEqual(gs2.statistics.nodes, 4)
+            self.assertEqual(gs2.get_id(), 4)
+
+        gstorage.write_graph(self.graph_file, self.id_file)
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(gs2.get_graph().nodes(data=True),
+            gs.get_graph().nodes(data=True))
+        self.assertEqual(gs2.get_id(), 5)
+        self.assertEqual(sorted(os.listdir(self.dir)), ['graph_file',
+            'graph_file.0.2', 'graph_file.1.1', 'graph_file.2.2',
+            'graph_file.stats.2', 'id_file'])
+
+    def test_old_segments(self):
+        """
+        Tests that L{GraphStorage.load_graph} loads graph files written
+        before segments were versioned, and that the next write replaces
+        their files.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        nodes = [q.add_node({'Name' : 'n' + str(i)}) for i in range(3)]
+        q.add_relationship(nodes[0], nodes[2], {})
+        for segment, node_ids in [(0, [1]), (1, [2, 3])]:
+            CSRSnapshot.write(self.graph_file + '.' + str(segment),
+                gs.get_graph(), 3, node_ids)
+        f = open(self.graph_file, 'wb')
+        f.write(pack(graph_storage.OLD_MANIFEST_FORMAT,
+            graph_storage.OLD_SEGMENT_MAGIC, 2, 3, 2))
+        write_array(f, 'i', [0, 1])
+        f.close()
+        f = open(self.id_file, 'w')
+        f.write('3')
+        f.close()
+
+        gs2 = GraphStructure()
+        gstorage = GraphStorage(gs2)
+        gstorage.load_graph(self.graph_file, self.id_file)
+        self.assertEqual(gs2.get_graph().nodes(data=True),
+            gs.get_graph().nodes(data=True))
+        self.assertEqual(gs2.get_graph().edges(), [(1, 3)])
+        self.assertEqual(gstorage.segments, {0 : 0, 1 : 0})
+        QueryEvaluator(gs2).add_node({'Name' : 'n3'})
+        gstorage.write_graph(self.graph_file, self.id_file)
+        self.assertEqual(gstorage.segments, {0 : 0, 1 : 0, 2 : 1})
+        gstorage.full_write = True
+        gstorage.write_graph(self.graph_file, self.id_file)
+        self.assertEqual(sorted(os.listdir(self.dir)), ['graph_file',
+            'graph_file.0.2', 'graph_file.1.2', 'graph_file.2.2',
+            'graph_file.stats.2', 'id_file'])
+
+    def test_dirty_segments(self):
+        """
+        Tests that L{GraphStorage.write_graph} only rewrites the segments
+        touched since the last write.
+        """
+        gs = GraphStructure()
+        gstorage = GraphStorage(gs, 2)
+        q = QueryEvaluator(gs)
+        nodes = [q.add_node({'Name' : str(i)}) for i in range(7)]
+        q.add_relationship(nodes[0], nodes[6], {'rel_type' : 'friend'})
+        gstorage.write_graph(self.graph_file, self.id_file)
+        self.assertEqual(gstorage.segments, {0 : 1, 1 : 1, 2 : 1, 3 : 1})
+
+        q.modify_node({'Name' : '2'}, {'Age' : '10'}, True)
+        gstorage.write_graph(self.graph_file, self.id_file)
+        self.assertEqual(gstorage.segments, {0 : 1, 1 : 2, 2 : 1, 3 : 1})
+
+        # Deleting a node rewrites the segments of its neighbors
+        q.delete_node({'Name' : '6'})
+        q.delete_node({'Name' : '5'})
+        gstorage.write_graph(self.graph_file, self.id_file)
+        self.assertEqual(gstorage.segments, {0 : 3, 1 : 2, 2 : 1})
+        # The files of older versions and of the empty segment are removed
+        self.assertEqual(sorted(os.listdir(self.dir)), ['graph_file',
+            'graph_file.0.3', 'graph_file.1.2', 'graph_file.2.1',
+            'graph_file.stats.3', 'id_file'])
+
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(gs.get_graph().nodes(data=True), 
+            gs2.get_graph().nodes(data=True))
+        self.assertEqual(gs2.get_graph().edges(), [])
+        self.assertEqual(gs2.get_id(), 7)
+
+    def test_parallel_load(self):
+        """
+        Tests loading segments whose edges cross segment boundaries with
+        several processes.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        nodes = [q.add_node({'Name' : str(i)}) for i in range(10)]
+        for i in range(10):
+            q.add_relationship(nodes[i], nodes[(i * 3) % 10], {'w' : i})
+            q.add_relationship(nodes[i], nodes[(i + 7) % 10], {})
+        GraphStorage(gs, 3).write_graph(self.graph_file, self.id_file)
+
+        for processes in [1, 3]:
+            gs2 = GraphStructure()
+            # Four segments are enough for the pool
+            saved_segments = graph_storage.PARALLEL_SEGMENTS
+            graph_storage.PARALLEL_SEGMENTS = 2
+            try:
+                GraphStorage(gs2).load_graph(self.graph_file, self.id_file,
+                    processes)
+            finally:
+                graph_storage.PARALLEL_SEGMENTS = saved_segments
+            g1, g2 = gs.get_graph(), gs2.get_graph()
+            self.assertEqual(g1.nodes(data=True), g2.nodes(data=True))
+            self.assertEqual(sorted(g1.edges(data=True)),
+                sorted(g2.edges(data=True)))
+            self.assertEqual(sorted(g1.in_edges(data=True)),
+                sorted(g2.in_edges(data=True)))
+
+    def test_load_text_file(self):
+        """
+        Tests that L{LoadData.load_text_file} gives the same graph however
+        the file is split and parsed.
+        """
+        text_file = os.path.join(self.dir, 'edges.txt')
+        f = open(text_file, 'w')
+        f.write('# comment\n1\t2\n2\t3\n\n3 1\n1\t2\n4\t4\n2\t4')
+        f.close()
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            graphs = []
+            for chunk_size, processes in [(1024, 1), (4, 1), (4, 3)]:
+                for name in ['graph_file', 'id_file', 'wal_file']:
+                    if os.path.exists(name):
+                        os.remove(name)
+                gs = GraphStructure()
+                LoadData(gs).load_text_file(text_file, chunk_size, processes)
+                graphs.append(gs.get_graph())
+        finally:
+            os.chdir(cwd)
+
+        for g in graphs:
+            names = dict((n, attrs['id']) for n, attrs in g.nodes(data=True))
+            self.assertEqual(sorted(names.values()), [1, 2, 3, 4])
+            self.assertEqual(sorted((names[n1], names[n2]) for n1, n2 in 
+                g.edges()), [(1, 2), (2, 3), (2, 4), (3, 1), (4, 4)])
+        self.assertEqual(graphs[1].nodes(data=True), 
+            graphs[2].nodes(data=True))
+
+    def test_load_uneven_lines(self):
+        """
+        Tests that L{LoadData.load_text_file} does not pair the names of
+        different lines when a line has more or fewer than two names.
+        """
+        text_file = os.path.join(self.dir, 'edges.txt')
+        f = open(text_file, 'w')
+        f.write('a b c\nd\ne f\n')
+        f.close()
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            gs = GraphStructure()
+            LoadData(gs).load_text_file(text_file)
+        finally:
+            os.chdir(cwd)
+
+        g = gs.get_graph()
+        names = dict((n, attrs['id']) for n, attrs in g.nodes(data=True))
+        self.assertEqual(sorted(names.values()), ['a', 'b', 'e', 'f'])
+        self.assertEqual(sorted((names[n1], names[n2]) for n1, n2 in
+            g.edges()), [('a', 'b'), ('e', 'f')])
+
+    def test_match_loaded_ids(self):
+        """
+        Tests that the node names of a loaded edge list are typed like the
+        values of commands, and that the string values of graphs saved
+        before values were typed are typed when they are loaded.
+        """
+        text_file = os.path.join(self.dir, 'edges.txt')
+        f = open(text_file, 'w')
+        f.write('1\t2\n2\t3\n')
+        f.close()
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            gs = GraphStructure()
+            LoadData(gs).load_text_file(text_file)
+        finally:
+            os.chdir(cwd)
+        cache = StatementCache()
+        for statement in ['match n: a id:2 ;', 'neighbor n: b id:1 ;',
+            'createedge n: a id:1 e: r t:x n: b id:3 ;']:
+            Linker(cache.compile(statement), gs).execute()
+        g = gs.get_graph()
+        self.assertEqual(gs.get_identifier('a'), [(3, {'id' : 2})])
+        self.assertEqual(sorted((g.node[n1]['id'], g.node[n2]['id'])
+            for n1, n2 in g.edges()), [(1, 2), (1, 3), (2, 3)])
+
+        # A graph saved without typed statistics
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'id' : '1', 'Name' : 'Alice'})
+        node2 = q.add_node({'id' : '2', 'Name' : 'Bob'})
+        q.add_relationship(node1, node2, {'since' : '2010'})
+        gstorage = GraphStorage(gs)
+        gstorage.write_graph(self.graph_file, self.id_file)
+        os.remove(gstorage.stats_file(self.graph_file, gstorage.generation))
+        for i in range(2):
+            gs2 = GraphStructure()
+            gstorage2 = GraphStorage(gs2)
+            gstorage2.load_graph(self.graph_file, self.id_file)
+            self.assertEqual(gs2.get_graph().nodes(data=True),
+                [(1, {'id' : 1, 'Name' : 'Alice'}),
+                (2, {'id' : 2, 'Name' : 'Bob'})])
+            self.assertEqual(gs2.get_graph().edges(data=True),
+                [(1, 2, {'since' : 2010})])
+            self.assertEqual(gs2.statistics.node_values['id'], {1 : 1, 2 : 1})
+            gstorage2.write_graph(self.graph_file, self.id_file)
+
+    def test_load_csv_files(self):
+        """
+        Tests that L{LoadData.load_csv_files} stores typed attributes of
+        nodes and edges.
+        """
+        node_file = os.path.join(self.dir, 'nodes.csv')
+        edge_file = os.path.join(self.dir, 'edges.tsv')
+        f = open(node_file, 'w')
+        f.write('id,Name,Age,Height\n1,Alice,23,1.5\n2,Bob,,2\n'
+            '3,"Smith, John",40,1.75\n')
+        f.close()
+        f = open(edge_file, 'w')
+        f.write('src\tdst\tsince\tweight\n1\t2\t2010\t1\n2\t4\t\tn/a\n')
+        f.close()
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            gs = GraphStructure()
+            LoadData(gs).load_csv_files(node_file, edge_file, batch_size=2)
+        finally:
+            os.chdir(cwd)
+
+        g = gs.get_graph()
+        self.assertEqual(g.nodes(data=True), [
+            (1, {'id' : 1, 'Name' : 'Alice', 'Age' : 23, 'Height' : 1.5}),
+            (2, {'id' : 2, 'Name' : 'Bob', 'Height' : 2.0}),
+            (3, {'id' : 3, 'Name' : 'Smith, John', 'Age' : 40, 
+                'Height' : 1.75}),
+            (4, {'id' : 4})])
+        self.assertEqual(sorted(g.edges(data=True)), [
+            (1, 2, {'since' : 2010, 'weight' : 1}),
+            (2, 4, {'weight' : 'n/a'})])
+
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(g.nodes(data=True), gs2.get_graph().nodes(data=True))
+
+    def test_resume_import(self):
+        """
+        Tests that an import interrupted after a checkpoint resumes from
+        it and gives the same graph as an uninterrupted import.
+        """
+        text_file = os.path.join(self.dir, 'edges.txt')
+        f = open(text_file, 'w')
+        for i in range(20):
+            f.write('%d\t%d\n' % (i, (i * 7) % 20))
+        f.close()
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            gs = GraphStructure()
+            data = LoadData(gs)
+            data.checkpoint_rows = 5
+            load_parsed = data.load_parsed
+            def crash(parsed, node_dict, end):
+                if end > 60:
+                    raise KeyboardInterrupt()
+                load_parsed(parsed, node_dict, end)
+            data.load_parsed = crash
+            self.assertRaises(KeyboardInterrupt, data.load_text_file,
+                text_file, 16)
+            self.assertTrue(os.path.exists('import_file'))
+
+            gs2 = GraphStructure()
+            LoadData(gs2).load_text_file(text_file, 16)
+            self.assertFalse(os.path.exists('import_file'))
+            for name in ['graph_file', 'id_file', 'wal_file']:
+                os.remove(name)
+            gs3 = GraphStructure()
+            LoadData(gs3).load_text_file(text_file, 16)
+        finally:
+            os.chdir(cwd)
+
+        g2, g3 = gs2.get_graph(), gs3.get_graph()
+        self.assertEqual(g2.number_of_nodes(), 20)
+        self.assertEqual(g2.nodes(data=True), g3.nodes(data=True))
+        self.assertEqual(sorted(g2.edges()), sorted(g3.edges()))
+        self.assertEqual(gs2.get_id(), 20)
+
+    def test_resume_after_snapshot(self):
+        """
+        Tests that an import stopped after writing the graph but before
+        saving its checkpoint does not create its nodes again when it
+        resumes.
+        """
+        text_file = os.path.join(self.dir, 'edges.txt')
+        f = open(text_file, 'w')
+        for i in range(20):
+            f.write('%d\t%d\n' % (i, (i * 7) % 20))
+        f.close()
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            gs = GraphStructure()
+            data = LoadData(gs)
+            data.checkpoint_rows = 5
+            save = data.checkpoint.save
+            def crash(*args):
+                # The first checkpoint is saved before anything is loaded
+                if args[2]:
+                    raise KeyboardInterrupt()
+                save(*args)
+            data.checkpoint.save = crash
+            self.assertRaises(KeyboardInterrupt, data.load_text_file,
+                text_file, 16)
+            self.assertEqual(ImportCheckpoint('import_file').load()['offset'],
+                0)
+
+            gs2 = GraphStructure()
+            LoadData(gs2).load_text_file(text_file, 16)
+            self.assertFalse(os.path.exists('import_file'))
+        finally:
+            os.chdir(cwd)
+
+        g2 = gs2.get_graph()
+        self.assertEqual(g2.number_of_nodes(), 20)
+        self.assertEqual(sorted(attrs['id'] for attrs in g2.node.values()),
+            range(20))
+        self.assertEqual(g2.number_of_edges(), 20)
+        self.assertEqual(gs2.get_id(), 20)
+
+    def test_background_checkpoint(self):
+        """
+        Tests that changes made while a L{Checkpointer} writes a snapshot
+        in the background are kept in the log.
+        """
+        gs = GraphStructure()
+        gstorage = GraphStorage(gs)
+        wal = WriteAheadLog(self.wal_file)
+        wal.open()
+        gs.add_listener(wal)
+        checkpointer = Checkpointer(gstorage, wal, self.graph_file,
+            self.id_file, None, 1)
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Name' : 'Alice'})
+        checkpointer.maybe_checkpoint()
+        self.assertTrue(checkpointer.pid is not None)
+        node2 = q.add_node({'Name' : 'Bob'})
+        q.add_relationship(node1, node2, {'rel_type' : 'friend'})
+        checkpointer.wait()
+        self.assertFalse(os.path.exists(wal.old_file))
+        wal.close()
+
+        gs2 = GraphStructure()
+        GraphStorage(gs2).load_graph(self.graph_file, self.id_file)
+        self.assertEqual(gs2.get_graph().nodes(data=True), [node1])
+        self.assertEqual(WriteAheadLog(self.wal_file).replay(gs2), 2)
+        self.assertEqual(gs2.get_graph().edges(data=True),
+            [(1, 2, {'rel_type' : 'friend'})])
+
+
+    def test_compiled_batch(self):
+        """
+        Tests that a compiled L{BatchExecute} gives the same graph as
+        executing the commands one at a time, and that a batch with an
+        error in it changes nothing.
+        """
+        batch_file = os.path.join(self.dir, 'batch.txt')
+        f = open(batch_file, 'w')
+        f.write('# Batch\n'
+            'create n: a name:x age:1;\n'
+            'create n: b name:y age:2 n: c name:z age:1;\n'
+            'createedge n: a name:x e: r type:f n: b name:y;\n'
+            'createedge n: a age:1 e: r type:g n: c name:z;\n'
+            'deletenode n: a name:y;\n'
+            'create n: d name:y;\n'
+            'createedge n: a name:y e: r type:h n: b age:1;\n')
+        f.close()
+        gs1 = GraphStructure()
+        BatchExecute(gs1, batch_file)
+        gs2 = GraphStructure()
+        BatchExecute(gs2, batch_file, compiled=False)
+        g1, g2 = gs1.get_graph(), gs2.get_graph()
+        self.assertEqual(g1.nodes(data=True), g2.nodes(data=True))
+        self.assertEqual(sorted(g1.edges(data=True)),
+            sorted(g2.edges(data=True)))
+        self.assertEqual(sorted(g1.edges()), [(1, 3), (3, 3), (4, 1), (4, 3)])
+        self.assertEqual(gs1.get_id(), gs2.get_id())
+
+        f = open(batch_file, 'a')
+        f.write('create n: e name:w\n')
+        f.close()
+        gs3 = GraphStructure()
+        BatchExecute(gs3, batch_file)
+        self.assertEqual(gs3.get_graph().number_of_nodes(), 0)
+
+    def test_batch_node_index(self):
+        """
+        Tests that a compiled L{BatchExecute} finds the nodes of edges
+        through the node index of the graph while other commands change
+        the nodes, and only keeps the indexes the batch asks for.
+        """
+        batch_file = os.path.join(self.dir, 'batch.txt')
+        f = open(batch_file, 'w')
+        f.write('create n: a name:x age:1 n: b name:y age:2;\n'
+            'createedge n: a name:x e: r type:f n: b age:2;\n'
+            'modifynode n: a name:y n: a age:1 b: c val:1;\n'
+            'createedge n: a name:y e: r type:g n: b age:1;\n'
+            'createindex n: age;\n'
+            'deletenode n: a name:x;\n'
+            'create n: c name:x age:2;\n'
+            'createedge n: a name:x e: r type:h n: b age:1;\n')
+        f.close()
+        gs1 = GraphStructure()
+        gs1.node_index.create('type')
+        BatchExecute(gs1, batch_file)
+        gs2 = GraphStructure()
+        BatchExecute(gs2, batch_file, compiled=False)
+        g1, g2 = gs1.get_graph(), gs2.get_graph()
+        self.assertEqual(g1.nodes(data=True), g2.nodes(data=True))
+        self.assertEqual(sorted(g1.edges(data=True)),
+            sorted(g2.edges(data=True)))
+        self.assertEqual(sorted(g1.edges()), [(2, 2), (3, 2)])
+        self.assertEqual(sorted(gs1.node_index.indexes), ['age', 'type'])
+
+    def test_batch_checkpoints(self):
+        """
+        Tests that a compiled L{BatchExecute} polls the checkpointer after
+        every command that changes the graph, like the interactive loop.
+        """
+        batch_file = os.path.join(self.dir, 'batch.txt')
+        f = open(batch_file, 'w')
+        f.write('create n: a name:x age:1;\n'
+            'create n: b name:y age:2 n: c name:z age:1;\n'
+            'createedge n: a name:x e: r type:f n: b name:y;\n'
+            'createedge n: a age:1 e: r type:g n: c name:z;\n'
+            'deletenode n: a name:y;\n'
+            'create n: d name:y;\n'
+            'createedge n: a name:y e: r type:h n: b age:1;\n')
+        f.close()
+        gs = GraphStructure()
+
+        class PollCounter:
+            def __init__(self):
+                self.sizes = []
+
+            def maybe_checkpoint(self):
+                g = gs.get_graph()
+                self.sizes.append((g.number_of_nodes(), g.number_of_edges()))
+
+        checkpointer = PollCounter()
+        BatchExecute(gs, batch_file, checkpointer)
+        self.assertEqual(checkpointer.sizes,
+            [(3, 0), (3, 3), (2, 2), (3, 2), (3, 4)])
+
+        # Every CREATE and CREATEEDGE command is executed on its own
+        saved_size = batch_execute.WRITE_BATCH_SIZE
+        batch_execute.WRITE_BATCH_SIZE = 1
+        try:
+            gs = GraphStructure()
+            checkpointer = PollCounter()
+            BatchExecute(gs, batch_file, checkpointer)
+        finally:
+            batch_execute.WRITE_BATCH_SIZE = saved_size
+        self.assertEqual(checkpointer.sizes,
+            [(1, 0), (3, 0), (3, 1), (3, 3), (2, 2), (3, 2), (3, 4)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,19 @@
+import sys
 import unittest
+from cStringIO import StringIO
+from itertools import islice
 from query_evaluator import QueryEvaluator
 from graph_structure import GraphStructure
 from predicates import Predicates
 from project import Project
+from linker import Linker
+from statement_cache import StatementCache
+from parser import Parser
+from planner import Planner
+from bitmap import Bitmap, id_range
+from result_cache import ResultCache
+from ordered_values import OrderedValues
+import column_store
 
 class TestQueryEvaluator(unittest.TestCase):
 
@@ -49,6 +60,331 @@ class TestQueryEvaluator(unittest.TestCase):
         edge2 = q.add_relationship(node2, node3, edge_attrs2)
         self.assertEqual(edge2, (node2[0], node3[0], edge_attrs2))
 
+    def test_add_nodes_relationships(self):
+        """
+        Tests L{QueryEvaluator.add_nodes} and
+        L{QueryEvaluator.add_relationships} methods for L{QueryEvaluator}.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Name' : 'Alice'})
+        ids = q.add_nodes([{'Name' : 'Bob'}, {'Name' : 'John'}])
+        self.assertEqual(ids, [2, 3])
+        self.assertEqual(gs.get_id(), 3)
+        self.assertEqual(q.match_node({'Name' : 'John'}),
+            [(3, {'Name' : 'John'})])
+        empty = {}
+        count = q.add_relationships([(1, 2, empty), (2, 3, empty),
+            (1, 2, {'rel_type' : 'friend'})])
+        self.assertEqual(count, 2)
+        self.assertEqual(sorted(gs.get_graph().edges(data=True)),
+            [(1, 2, {'rel_type' : 'friend'}), (2, 3, {})])
+        self.assertEqual(gs.get_graph().in_edges(3), [(2, 3)])
+        self.assertEqual(empty, {})
+
+    def test_statement_cache(self):
+        """
+        Tests that L{StatementCache} parses a statement once and that the
+        cached commands can be executed again.
+        """
+        gs = GraphStructure()
+        cache = StatementCache(2)
+        commands = cache.compile('create n: a Name:Alice ;')
+        self.assertEqual(cache.compile('create  n: a\tName:Alice ;'), commands)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        Linker(commands, gs).execute()
+        Linker(commands, gs).execute()
+        g = gs.get_graph()
+        g.node[1]['Age'] = '30'
+        self.assertEqual(g.node[2], {'Name' : 'Alice'})
+        # Invalid statements are not cached
+        self.assertEqual(cache.compile('create e: a Name:Alice ;'), None)
+        self.assertEqual(len(cache.statements), 1)
+        # The least recently used statement is evicted
+        cache.compile('show ;')
+        cache.compile('create n: a Name:Alice ;')
+        cache.compile('clear ;')
+        self.assertEqual(cache.statements.keys(),
+            ['create n: a Name:Alice ;', 'clear ;'])
+
+    def test_result_cache(self):
+        """
+        Tests that L{ResultCache} repeats the results of commands while the
+        graph does not change, and evicts the least recently used ones.
+        """
+        gs = GraphStructure()
+        gs.results = ResultCache(gs, 2)
+        q = QueryEvaluator(gs)
+        cache = StatementCache()
+        node1 = q.add_node({'Label' : 'Person', 'Age' : 30})
+        node2 = q.add_node({'Label' : 'Person', 'Age' : 40})
+        q.add_relationship(node1, node2, {'type' : 'knows'})
+        for statement in ['match n: a Label:Person Age>35 ;',
+            'match  n: b Label:Person Age>35 ;',
+            'match n: a Label:Person Age>35 ;']:
+            Linker(cache.compile(statement), gs).execute()
+        self.assertEqual((gs.results.hits, gs.results.misses), (1, 2))
+        self.assertEqual(gs.get_identifier('a'), [node2])
+        self.assertEqual(gs.get_identifier('b'), [node2])
+        # Changing the graph makes every result stale
+        q.modify_node({'Age' : 30}, {'Age' : 50}, True)
+        Linker(cache.compile('match n: a Label:Person Age>35 ;'),
+            gs).execute()
+        self.assertEqual((gs.results.hits, gs.results.misses), (1, 3))
+        self.assertEqual(len(gs.get_identifier('a')), 2)
+        # Commands that change the graph are not cached
+        Linker(cache.compile('create n: c Label:Person ;'), gs).execute()
+        Linker(cache.compile('create n: c Label:Person ;'), gs).execute()
+        self.assertEqual(len(gs.get_graph()), 4)
+        for statement in ['neighbor n: a Age:40 ;', 'hasedge n: a Age:50 '
+            'n: b Age:40 ;', 'match n: a Label:Person Age>35 ;']:
+            Linker(cache.compile(statement), gs).execute()
+        self.assertEqual(len(gs.results.results), 2)
+        self.assertEqual(str(gs.results), "Result cache: 2 results, "
+            "1 hits, 6 misses, 14.3% hit ratio")
+
+    def test_parser(self):
+        """
+        Tests the L{Command_Struct} objects that L{Parser} creates for valid
+        statements, and that malformed statements are errors.
+        """
+        def parse(statement):
+            parser = Parser(statement)
+            parser.run()
+            self.assertFalse(parser.get_Errors())
+            return [(c.get_command(), c.get_attr_list(), c.get_names(),
+                c.get_bool(), c.get_limit()) for c in parser.get_object_list()]
+
+        self.assertEqual(parse('create n: a name:x age:1 n: b name:y ;'),
+            [('CREATE', [['n:', 'a', {'name' : 'x', 'age' : 1}],
+                ['n:', 'b', {'name' : 'y'}]], [], -1, None)])
+        self.assertEqual(parse('createedge n: a name:x e: r type:f n: b ;'),
+            [('CREATEEDGE', [['n:', 'a', {'name' : 'x'}],
+                ['e:', 'r', {'type' : 'f'}], ['n:', 'b', {}]], [], -1, None)])
+        self.assertEqual(parse('match n: a Label:Person Age>30 AND Age<50 ;'),
+            [('MATCH', [['n:', 'a', {'Label' : 'Person'}]],
+                [[['Age', '>', '30', 'a'], 'AND', ['Age', '<', '50', 'a']]],
+                -1, None)])
+        self.assertEqual(parse('MATCH n: a Age>30 AND NOT Age>40 limit 5 ;'),
+            [('MATCH', [['n:', 'a', {}]],
+                [[['Age', '>', '30', 'a'], 'AND NOT', ['Age', '>', '40', 'a']]],
+                -1, 5)])
+        self.assertEqual(parse('match n: a Age>30 OR Age<20 e: r n: b ;'),
+            [('MATCH', [['n:', 'a', {}], ['e:', 'r', {}], ['n:', 'b', {}]],
+                [[['Age', '>', '30', 'a'], 'OR', ['Age', '<', '20', 'a']]],
+                -1, None)])
+        self.assertEqual(parse('modifynode n: a name:x n: a age:3 b: c val:1 ;'),
+            [('MODIFYNODE', [['n:', 'a', {'name' : 'x'}],
+                ['n:', 'a', {'age' : 3}], ['b:', 'c', {'val' : '1'}]],
+                [], 1, None)])
+        self.assertEqual(parse('modifyedge n: a e: r w:1 n: b e: r w:2.5 '
+            'b: c val:0 ;'),
+            [('MODIFYEDGE', [['n:', 'a', {}], ['e:', 'r', {'w' : 1}],
+                ['n:', 'b', {}], ['e:', 'r', {'w' : 2.5}],
+                ['b:', 'c', {'val' : '0'}]], [], 0, None)])
+        self.assertEqual(parse('deletenode n: a name:x ;'),
+            [('DELETENODE', [['n:', 'a', {'name' : 'x'}]], [], -1, None)])
+        self.assertEqual(parse('hasedge n: a name:x n: b name:y ;'),
+            [('HASEDGE', [['n:', 'a', {'name' : 'x'}],
+                ['n:', 'b', {'name' : 'y'}]], [], -1, None)])
+        self.assertEqual(parse('return n: a n: b ;'),
+            [('RETURN', [['n:', 'a', {}], ['n:', 'b', {}]], [], -1, None)])
+        self.assertEqual(parse('show ;'), [('SHOW', [], [], -1, None)])
+        self.assertEqual(parse(''), [])
+
+        # Malformed statements are errors of the state machine
+        for statement in ['n: a name:x ;', 'create match n: a ;',
+                'match n: a limit x ;', 'match n: a name:x AND NOT ;',
+                'modifynode n: a name:x b: c val:2 ;']:
+            parser = Parser(statement)
+            parser.run()
+            self.assertTrue(parser.get_Errors(), statement)
+            self.assertEqual(StatementCache().parse(statement), None)
+        # A LIMIT without a number is left for L{Error_Checking}
+        self.assertEqual(parse('match n: a limit ;'),
+            [('MATCH', [['n:', 'a', {}]], [], -1, 0)])
+        self.assertEqual(StatementCache().parse('match n: a limit ;'), None)
+
+    def test_result_cache_output(self):
+        """
+        Tests that L{ResultCache} keeps what commands found instead of what
+        they printed, and that cached results are printed like the results
+        of the commands.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        cache = StatementCache()
+        nodes = [q.add_node({'Label' : 'Person', 'Age' : age})
+            for age in [30, 40, 50]]
+        q.add_relationship(nodes[0], nodes[1], {'type' : 'knows'})
+        q.add_relationship(nodes[1], nodes[2], {'type' : 'knows'})
+
+        def run(statement):
+            objects = cache.compile(statement)
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                Linker(objects, gs).execute()
+                return sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+
+        # Output printed by anything else while a command runs is not cached
+        iter_nodes = QueryEvaluator.iter_nodes
+        def noisy_iter_nodes(self, node_attrs):
+            print "debug"
+            return iter_nodes(self, node_attrs)
+        QueryEvaluator.iter_nodes = noisy_iter_nodes
+        try:
+            output = run('match n: a Label:Person ;')
+        finally:
+            QueryEvaluator.iter_nodes = iter_nodes
+        self.assertTrue(output.startswith("debug\n"))
+        self.assertEqual(run('match n: a Label:Person ;'), output[6:])
+        self.assertEqual(gs.results.results.values()[0][1],
+            ('PrintNodes', q.match_node({'Label' : 'Person'})))
+
+        for statement in ['match n: a Age:30 e: r type:knows n: b ;',
+            'match e: r type:knows ;',
+            'match n: a Age:30 e: r n: b e: s n: c ;',
+            'match n: a e: r n: b e: s n: c limit 1 ;',
+            'neighbor n: a Age:40 ;', 'shortestpath n: a Age:30 n: b ;',
+            'haspath n: a Age:50 n: b Age:30 ;',
+            'hasedge n: a Age:30 n: b Age:40 ;']:
+            gs.set_identifier('a', None)
+            output = run(statement)
+            identifier = gs.get_identifier('a')
+            gs.set_identifier('a', None)
+            self.assertEqual(run(statement), output)
+            self.assertEqual(gs.get_identifier('a'), identifier)
+        self.assertEqual((gs.results.hits, gs.results.misses), (9, 9))
+
+    def test_prepared_statement(self):
+        """
+        Tests that PREPARE and EXECUTE statements bind values to the
+        parameters of a statement without changing it.
+        """
+        gs = GraphStructure()
+        cache = StatementCache()
+        self.assertEqual(cache.compile(
+            'prepare person create n: a id:$1 Name:$2 ;'), [])
+        cache.compile('prepare knows createedge n: a id:$1 '
+            'e: r type:knows n: b id:$2 ;')
+        for statement in ['execute person 1 Alice ;',
+            'execute person 2 Bob ;', 'execute knows 2 1 ;']:
+            Linker(cache.compile(statement), gs).execute()
+        g = gs.get_graph()
+        self.assertEqual(g.nodes(data=True), [(1, {'id' : 1,
+            'Name' : 'Alice'}), (2, {'id' : 2, 'Name' : 'Bob'})])
+        self.assertEqual(g.edges(data=True), [(2, 1, {'type' : 'knows'})])
+        self.assertEqual(cache.compile('execute knows 1 ;'), None)
+        self.assertEqual(cache.compile('execute unknown 1 ;'), None)
+        # Predicate values can be parameters too
+        cache.compile('prepare older match n: a Label:Person age>$1 ;')
+        names = cache.compile('execute older 30 ;')[0].get_names()
+        self.assertEqual(names, [[['age', '>', '30', 'a']]])
+        self.assertEqual(cache.prepared['older'].commands[0].get_names(),
+            [[['age', '>', '$1', 'a']]])
+
+    def test_node_index(self):
+        """
+        Tests that L{QueryEvaluator.match_node} gives the same nodes with an
+        index on a node attribute, and that the index follows changes.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Label' : 'Person', 'Name' : 'Alice'})
+        self.assertTrue(gs.node_index.create('Name'))
+        self.assertFalse(gs.node_index.create('Name'))
+        node2 = q.add_node({'Label' : 'Person', 'Name' : 'Bob'})
+        node3 = q.add_node({'Label' : 'Alien', 'Name' : 'Bob'})
+        self.assertEqual(q.match_node({'Name' : 'Bob'}), [node2, node3])
+        self.assertEqual(q.match_node({'Name' : 'Bob', 'Label' : 'Alien'}),
+            [node3])
+        q.modify_node({'Name' : 'Alice'}, {'Name' : 'Carol'}, 1)
+        self.assertEqual(q.match_node({'Name' : 'Alice'}), [])
+        self.assertEqual(q.match_node({'Name' : 'Carol'}), [node1])
+        q.delete_node({'Label' : 'Alien'})
+        self.assertEqual(q.match_node({'Name' : 'Bob'}), [node2])
+        q.set_node_attrs(2, {'Label' : 'Person'})
+        self.assertEqual(q.match_node({'Name' : 'Bob'}), [])
+        self.assertTrue(gs.node_index.drop('Name'))
+        self.assertEqual(gs.listeners, [])
+        # Indexes are created and dropped with commands
+        cache = StatementCache()
+        Linker(cache.compile('createindex n: Label ;'), gs).execute()
+        self.assertEqual(gs.node_index.lookup({'Label' : 'Person'}),
+            set([1, 2]))
+        self.assertEqual(cache.compile('createindex n: Label:Person ;'),
+            None)
+        Linker(cache.compile('dropindex n: Label ;'), gs).execute()
+        self.assertEqual(gs.node_index.indexes, {})
+
+    def test_edge_index(self):
+        """
+        Tests that L{QueryEvaluator.match_rel} gives the same edges with an
+        index on an edge attribute, and that the index follows changes.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Name' : 'Alice'})
+        node2 = q.add_node({'Name' : 'Bob'})
+        node3 = q.add_node({'Name' : 'Carol'})
+        q.add_relationship(node1, node2, {'rel_type' : 'friend'})
+        Linker(StatementCache().compile('createindex e: rel_type ;'),
+            gs).execute()
+        q.add_relationship(node2, node3, {'rel_type' : 'friend'})
+        q.add_relationships([(3, 1, {'rel_type' : 'enemy'})])
+        self.assertEqual(q.match_rel({'rel_type' : 'friend'}),
+            [(1, 2, {'rel_type' : 'friend'}), (2, 3, {'rel_type' : 'friend'})])
+        q.modify_rel({'rel_type' : 'enemy'}, {'rel_type' : 'friend'}, 1)
+        self.assertEqual(len(q.match_rel({'rel_type' : 'friend'})), 3)
+        q.delete_rel({'rel_type' : 'friend', 'since' : '2001'})
+        q.set_rel_attrs(1, 2, {'rel_type' : 'colleague'})
+        self.assertEqual(q.match_rel({'rel_type' : 'colleague'}),
+            [(1, 2, {'rel_type' : 'colleague'})])
+        q.delete_node({'Name' : 'Carol'})
+        self.assertEqual(q.match_rel({'rel_type' : 'friend'}), [])
+        q.delete_rel({'rel_type' : 'colleague'})
+        self.assertEqual(gs.edge_index.indexes, {'rel_type' : {}})
+
+    def test_join_sides(self):
+        """
+        Tests that L{QueryEvaluator.match_node_node_rel} finds the same
+        edges whether the join starts from the source nodes, the target
+        nodes or an edge index, also after the attributes of an edge are
+        set.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        nodes = [q.add_node({'n' : name}) for name in 'abcd']
+        q.add_relationship(nodes[0], nodes[1], {'w' : '1'})
+        q.add_relationship(nodes[0], nodes[2], {'w' : '1'})
+        q.add_relationship(nodes[2], nodes[1], {'w' : '3'})
+        q.add_relationship(nodes[3], nodes[0], {'w' : '1'})
+        q.set_rel_attrs(1, 2, {'w' : '2'})
+
+        # The join starts from the source nodes, from the target nodes, and
+        # from the edge index once there is one
+        for node1_attrs, node2_attrs in [({'n' : 'a'}, {}),
+            ({}, {'n' : 'b'}), ({}, {})]:
+            if not node1_attrs and not node2_attrs:
+                Linker(StatementCache().compile('createindex e: w ;'),
+                    gs).execute()
+            self.assertEqual(q.match_node_node_rel(node1_attrs, node2_attrs,
+                {'w' : '2'}), [(1, 2, {'w' : '2'})])
+            self.assertEqual([edge for edge in q.match_node_node_rel(
+                node1_attrs, node2_attrs, {'w' : '1'}) if edge[:2] == (1, 2)],
+                [])
+        self.assertEqual(q.match_node_node_rel({'n' : 'a'}, {}, {}),
+            [(1, 2, {'w' : '2'}), (1, 3, {'w' : '1'})])
+        self.assertEqual(q.match_node_node_rel({}, {'n' : 'b'}, {}),
+            [(1, 2, {'w' : '2'}), (3, 2, {'w' : '3'})])
+        self.assertEqual(q.match_node_node_rel({}, {}, {'w' : '1'}),
+            [(1, 3, {'w' : '1'}), (4, 1, {'w' : '1'})])
+        self.assertEqual(q.match_node_node_rel({'n' : 'd'}, {'n' : 'a'}, {}),
+            [(4, 1, {'w' : '1'})])
+
     def test_match_node(self):
         """
         Tests L{QueryEvaluator.match_node} method for L{QueryEvaluator}.
@@ -334,6 +670,212 @@ class TestQueryEvaluator(unittest.TestCase):
         result4 = q.multi_match([{}, {}], [{}])
         self.assertEqual(result4, [edge1, edge2, edge3, edge4])
 
+    def test_planned_chain(self):
+        """
+        Tests that a chain is matched from the node chosen by the
+        L{Planner}, with predicates applied while the chain is expanded.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        cache = StatementCache()
+        people = [q.add_node({'Label' : 'Person', 'Age' : str(age)})
+            for age in range(20)]
+        target = q.add_node({'Label' : 'Bank'})
+        for x in range(19):
+            q.add_relationship(people[x], people[x + 1], {'rel' : 'knows'})
+        q.add_relationship(people[19], target, {'rel' : 'owns'})
+        Linker(cache.compile('createindex n: Label ;'), gs).execute()
+        node_attr_list = [{'Label' : 'Person'}, {'Label' : 'Person'},
+            {'Label' : 'Bank'}]
+        rel_attr_list = [{'rel' : 'knows'}, {'rel' : 'owns'}]
+        start, prefiltered = Planner(gs).plan(node_attr_list, rel_attr_list, {})
+        self.assertEqual(start, 2)
+        result = [(people[18][0], target[0])]
+        for start in range(3):
+            self.assertEqual(q.multi_match(node_attr_list, rel_attr_list,
+                start=start), result)
+        Linker(cache.compile('match n: a Label:Person Age>15 e: b rel:knows '
+            'n: c Label:Person e: d rel:knows n: e Label:Person Age<19 ;'),
+            gs).execute()
+        self.assertEqual(gs.get_identifier('a'), [(people[16][0],
+            people[18][0])])
+
+    def test_match_limit(self):
+        """
+        Tests that a MATCH with a LIMIT stops after enough results, and that
+        the streamed chains are the ones L{QueryEvaluator.multi_match} finds.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        cache = StatementCache()
+        people = [q.add_node({'Label' : 'Person', 'Age' : str(age)})
+            for age in range(10)]
+        for x in range(9):
+            q.add_relationship(people[x], people[x + 1], {'rel' : 'knows'})
+        Linker(cache.compile('match n: a Label:Person limit 3 ;'), gs).execute()
+        self.assertEqual(gs.get_identifier('a'), people[:3])
+        Linker(cache.compile('match n: a Label:Person Age>4 limit 2 ;'),
+            gs).execute()
+        self.assertEqual(gs.get_identifier('a'), people[5:7])
+        Linker(cache.compile('match n: a Label:Person e: b rel:knows '
+            'n: c Label:Person limit 100 ;'), gs).execute()
+        self.assertEqual(len(gs.get_identifier('a')), 9)
+        self.assertEqual(cache.compile('create n: a Label:Person limit 2 ;'),
+            None)
+        self.assertEqual(cache.compile('match n: a Label:Person limit 0 ;'),
+            None)
+        node_attr_list = [{'Label' : 'Person'}] * 4
+        rel_attr_list = [{'rel' : 'knows'}] * 3
+        result = q.multi_match(node_attr_list, rel_attr_list)
+        self.assertEqual(sorted(q.iter_chain(node_attr_list, rel_attr_list)),
+            result)
+        self.assertEqual(list(islice(q.iter_chain(node_attr_list,
+            rel_attr_list), 2)), result[:2])
+
+    def test_bitmap_predicates(self):
+        """
+        Tests that predicates combined with AND, OR and NOT as L{Bitmap}s
+        give the same nodes whether their attributes are indexed or not.
+        """
+        ids = [3, 70000, 70001, 200000]
+        self.assertEqual(list(Bitmap(ids)), ids)
+        self.assertEqual(list(Bitmap(ids) & id_range(4, 70001)), [70000])
+        self.assertEqual(list(Bitmap(ids) | Bitmap([5])), [3, 5] + ids[1:])
+        self.assertEqual(list(Bitmap(ids) - Bitmap(ids[:2])), ids[2:])
+        self.assertEqual(len(id_range(1, 140000)), 139999)
+        self.assertTrue(200000 in Bitmap(ids))
+        self.assertFalse(4 in Bitmap(ids))
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        cache = StatementCache()
+        nodes = [q.add_node({'Label' : 'Person', 'Age' : str(x),
+            'Score' : str(x % 3)}) for x in range(10)]
+        q.add_node({'Label' : 'Person', 'Age' : '4'})
+        queries = [('Age>6 OR Score=1', [1, 4, 7, 8, 9]),
+            ('Age<3 OR Age>6 AND Score=0', [0, 9]),
+            ('Age<8 AND NOT Score=0', [1, 2, 4, 5, 7]),
+            ('Age>7 OR NOT Score=1', [0, 2, 3, 5, 6, 8, 9])]
+        for indexed in (False, True):
+            if indexed:
+                Linker(cache.compile('createindex n: Age ;'), gs).execute()
+                Linker(cache.compile('createindex n: Score ;'), gs).execute()
+            for preds, result in queries:
+                Linker(cache.compile('match n: a Label:Person ' + preds +
+                    ' ;'), gs).execute()
+                self.assertEqual(gs.get_identifier('a'),
+                    [nodes[x] for x in result])
+        self.assertEqual(cache.compile('match n: a Age>1 NOT Age>3 ;'), None)
+
+    def test_typed_values(self):
+        """
+        Tests that attribute values are typed when they are parsed, and
+        converted to the types declared by SCHEMA.
+        """
+        gs = GraphStructure()
+        cache = StatementCache()
+        for statement in ['create n: a salary:100 zip:02134 rate:0.5 '
+            'flag:true Name:Alice ;', 'create n: b salary:abc ;']:
+            Linker(cache.compile(statement), gs).execute()
+        g = gs.get_graph()
+        self.assertEqual(g.node[1], {'salary' : 100, 'zip' : '02134',
+            'rate' : 0.5, 'flag' : True, 'Name' : 'Alice'})
+        self.assertEqual(type(g.node[1]['salary']), int)
+        Linker(cache.compile('match n: a salary:100.0 ;'), gs).execute()
+        self.assertEqual(gs.get_identifier('a'), [(1, g.node[1])])
+        # Declaring a type fails if a value cannot be converted
+        Linker(cache.compile('schema n: s salary:float ;'), gs).execute()
+        self.assertEqual(gs.schema.report(), [])
+        Linker(cache.compile('deletenode n: b salary:abc ;'), gs).execute()
+        Linker(cache.compile('schema n: s salary:float zip:int ;'),
+            gs).execute()
+        self.assertEqual(gs.schema.report(),
+            ['n: salary float', 'n: zip int'])
+        self.assertEqual(g.node[1]['zip'], 2134)
+        self.assertEqual(type(g.node[1]['salary']), float)
+        # Values of later commands are converted, or the command fails
+        for statement in ['create n: c salary:7 ;',
+            'create n: d salary:high ;']:
+            Linker(cache.compile(statement), gs).execute()
+        self.assertEqual(g.nodes(data=True)[-1], (3, {'salary' : 7.0}))
+        self.assertEqual(type(g.node[3]['salary']), float)
+        Linker(cache.compile('schema n: s salary:auto ;'), gs).execute()
+        self.assertEqual(gs.schema.report(), ['n: zip int'])
+
+    def test_column_store(self):
+        """
+        Tests that predicates give the same nodes with and without the
+        columns of the L{ColumnStore}, and that the columns follow changes.
+        """
+        saved_numpy = column_store.numpy
+        if saved_numpy is not None:
+            mask = saved_numpy.arange(200000) % 70000 == 1
+            ids = column_store.mask_bitmap(mask)
+            self.assertEqual(list(Bitmap(ids)), [1, 70001, 140001])
+        results = []
+        try:
+            for numpy in (saved_numpy, None):
+                column_store.numpy = numpy
+                gs = GraphStructure()
+                q = QueryEvaluator(gs)
+                cache = StatementCache()
+                for x in range(10):
+                    q.add_node({'Label' : 'Person', 'Age' : str(x)})
+                q.add_node({'Label' : 'Person', 'Age' : 'old'})
+                q.add_node({'Label' : 'Person'})
+                for statement in ['match n: a Age>6 ;',
+                    'match n: a Label:Person Age<2 OR Age=5 ;']:
+                    Linker(cache.compile(statement), gs).execute()
+                    results.append(gs.get_identifier('a'))
+                self.assertEqual(gs.columns.has('Age'), numpy is not None)
+                q.modify_node({'Age' : '8'}, {'Age' : '1'}, True)
+                q.delete_node({'Age' : '9'})
+                q.add_node({'Label' : 'Person', 'Age' : '20'})
+                Linker(cache.compile('match n: a Age>6 ;'), gs).execute()
+                results.append(gs.get_identifier('a'))
+                q.clear()
+                Linker(cache.compile('match n: a Age>6 ;'), gs).execute()
+                self.assertEqual(gs.get_identifier('a'), [])
+        finally:
+            column_store.numpy = saved_numpy
+        self.assertEqual(results[:3], results[3:])
+        self.assertEqual([[node[0] for node in nodes]
+            for nodes in results[:3]], [[8, 9, 10], [1, 2, 6], [8, 13]])
+
+    def test_graph_statistics(self):
+        """
+        Tests that the L{GraphStatistics} are kept up to date with every
+        change to the graph.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        node1 = q.add_node({'Label' : 'Person', 'Age' : '20'})
+        node2 = q.add_node({'Label' : 'Person', 'Age' : '30'})
+        node3 = q.add_node({'Label' : 'Bank'})
+        q.add_relationship(node1, node2, {'rel_type' : 'friend'})
+        q.add_relationship(node1, node3, {'rel_type' : 'owns'})
+        q.add_relationship(node3, node3, {})
+        q.add_nodes([{'Label' : 'Bank'}])
+        q.add_relationships([(4, 1, {'rel_type' : 'owns'}),
+            (1, 2, {'since' : '2010'})])
+        q.modify_node({'Name' : 'Nobody'}, {'Age' : '1'}, True)
+        q.modify_node({'Label' : 'Person'}, {'Age' : '25'}, True)
+        q.delete_rel({'rel_type' : 'owns'})
+        q.delete_node({'Label' : 'Bank'})
+        statistics = gs.statistics
+        self.assertEqual((statistics.nodes, statistics.edges), (2, 1))
+        self.assertEqual(statistics.node_values, {'Label' : {'Person' : 2},
+            'Age' : {'25' : 2}})
+        self.assertEqual(statistics.edge_values,
+            {'rel_type' : {'friend' : 1}, 'since' : {'2010' : 1}})
+        self.assertEqual(statistics.out_degrees, {0 : 1, 1 : 1})
+        self.assertEqual(statistics.in_degrees, {0 : 1, 1 : 1})
+        self.assertEqual(statistics.report(['n:', 'Age', {}]),
+            ['Age: 2 items, 1 distinct values', '  25 to 26: 2'])
+        Linker(StatementCache().compile('stats ;'), gs).execute()
+        q.clear()
+        self.assertEqual(statistics.report(), ['Nodes: 0, edges: 0',
+            'Out-degree: no nodes', 'In-degree: no nodes'])
+
     def test_match_node_predicate(self):
         """
         Tests applying a predicate to a simple match node query for L{QueryEvaluator}.
@@ -359,6 +901,54 @@ class TestQueryEvaluator(unittest.TestCase):
         filtered_lst2 = pred.filter(match_lst2, 'Salary', '500', '=')
         self.assertEqual(filtered_lst2, [node1])
 
+    def test_range_index(self):
+        """
+        Tests that L{Predicates.filter} gives the same nodes when the
+        attribute is indexed, and that the index follows changes.
+        """
+        gs = GraphStructure()
+        q = QueryEvaluator(gs)
+        pred = Predicates(gs)
+        salaries = ['500', '1000', '20000', '1000.0', '3e3', 'many']
+        for salary in salaries:
+            q.add_node({'Label' : 'Person', 'Salary' : salary})
+        nodes = q.match_node({'Label' : 'Person'})[:5]
+        expected = [pred.filter(nodes, 'Salary', value, op)
+            for value in ['0', '1000', '3000', '50000'] for op in '<=>']
+        gs.node_index.create('Salary')
+        self.assertEqual([pred.filter(nodes, 'Salary', value, op)
+            for value in ['0', '1000', '3000', '50000'] for op in '<=>'],
+            expected)
+        self.assertEqual(gs.node_index.non_numeric('Salary'), set([6]))
+        q.modify_node({'Salary' : '1000'}, {'Salary' : '7'}, 1)
+        q.delete_node({'Salary' : '20000'})
+        nodes = q.match_node({'Label' : 'Person'})[:4]
+        self.assertEqual([node[0] for node in
+            pred.filter(nodes, 'Salary', '900', '<')], [1, 2])
+        self.assertEqual([node[0] for node in
+            pred.filter(nodes, 'Salary', '900', '>')], [4, 5])
+
+    def test_ordered_values(self):
+        """
+        Tests that L{OrderedValues.count} counts a number once when its
+        values are removed and added again.
+        """
+        values = OrderedValues()
+        for value in [1, 2, 3, 4]:
+            values.add(value)
+        self.assertEqual(values.count('>', 0), 4)
+        for i in range(3):
+            values.remove(2)
+            values.add(2.0)
+            self.assertEqual(values.count('>', 0), 4)
+            self.assertEqual(values.count('<', 3), 2)
+        self.assertEqual(values.find('<', 3), [1, 2.0])
+        values.remove(2.0)
+        values.remove(3)
+        values.add(3)
+        self.assertEqual(sorted(values.find('>', 0)), [1, 3, 4])
+        self.assertEqual(values.count('=', 2), 0)
+
     def test_match_node_project_node(self):
         """
         Tests applying a project to a simple match node query for L{QueryEvaluator}.
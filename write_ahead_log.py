@@ -0,0 +1,304 @@
+import os
+import zlib
+from struct import unpack_from
+from cStringIO import StringIO
+from fileIO import *
+
+# Record types stored in the log. Every record stores the complete new state
+# of the node or edge it touches, so replaying a record twice is harmless.
+OP_PUT_NODE = 1
+OP_REMOVE_NODE = 2
+OP_PUT_EDGE = 3
+OP_REMOVE_EDGE = 4
+OP_CLEAR = 5
+
+# Size of a record header: type (1 byte), payload length (4 bytes) and
+# checksum of the payload (4 bytes).
+HEADER_SIZE = 9
+
+
+class WriteAheadLog:
+    """
+    Append-only log of the mutations made to a L{GraphStructure} object.
+    The log is registered as a listener of the L{GraphStructure} and
+    writes a small binary record for every node or edge that is changed,
+    so the cost of persisting a command is proportional to the size of the
+    change rather than the size of the graph. On start-up the log is
+    replayed on top of the last snapshot written by L{GraphStorage}, and
+    it is truncated once a new snapshot has been written.
+
+    While a snapshot is written in the background, the records it covers
+    are moved to a second file (the log file name followed by '.old') and
+    new records go to an empty log. The old records are discarded once
+    the snapshot is complete.
+    """
+
+    def __init__(self, wal_file, sync=False):
+        """
+        Takes the name of the file used to store the log.
+
+        @type wal_file: String
+        @param wal_file: File to append the log records to
+        @type sync: Boolean
+        @param sync: If true, every record is forced to disk with fsync
+        instead of only being handed to the operating system.
+        """
+        self.wal_file = wal_file
+        self.old_file = wal_file + '.old'
+        self.sync = sync
+        self.f = None
+
+    def open(self):
+        """
+        Opens the log file for appending records. The log should be
+        replayed before it is opened.
+        """
+        if self.f is None:
+            self.f = open(self.wal_file, 'ab')
+
+    def close(self):
+        """
+        Closes the log file.
+        """
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def size(self):
+        """
+        Returns the current size of the log in bytes.
+
+        @rtype: Integer
+        @return: Number of bytes stored in the log
+        """
+        if self.f is not None:
+            return self.f.tell()
+        if os.path.isfile(self.wal_file):
+            return os.path.getsize(self.wal_file)
+        return 0
+
+    def truncate(self):
+        """
+        Discards all records in the log. Called once a snapshot containing
+        every logged mutation has been written to disk.
+        """
+        reopen = self.f is not None
+        self.close()
+        open(self.wal_file, 'wb').close()
+        self.discard_old()
+        if reopen:
+            self.open()
+
+    def rotate(self):
+        """
+        Moves the records in the log to the old log file and starts an
+        empty log. Called right before a snapshot of the current graph is
+        written in the background. If the old log file still exists
+        because the previous snapshot failed, the records are added to it.
+        """
+        reopen = self.f is not None
+        self.close()
+        if os.path.isfile(self.wal_file):
+            if os.path.isfile(self.old_file):
+                f = open(self.wal_file, 'rb')
+                records = f.read()
+                f.close()
+                f = open(self.old_file, 'ab')
+                f.write(records)
+                f.close()
+                os.remove(self.wal_file)
+            else:
+                os.rename(self.wal_file, self.old_file)
+        if reopen:
+            self.open()
+
+    def discard_old(self):
+        """
+        Discards the records moved to the old log file by L{rotate}. Called
+        once the snapshot written in the background is complete.
+        """
+        if os.path.isfile(self.old_file):
+            os.remove(self.old_file)
+
+    def append(self, op, payload):
+        """
+        Appends a single record to the log and hands it to the operating
+        system so it survives a crash of the database process.
+
+        @type op: Integer
+        @param op: Type of the record
+        @type payload: String
+        @param payload: Encoded body of the record
+        """
+        record = StringIO()
+        write_byte(record, op)
+        write_unsigned_int(record, len(payload))
+        write_int(record, zlib.crc32(payload))
+        record.write(payload)
+        self.f.write(record.getvalue())
+        self.f.flush()
+        if self.sync:
+            os.fsync(self.f.fileno())
+
+    def replay(self, gs):
+        """
+        Applies every complete record in the old log file and then in the
+        log to the L{GraphStructure} object. Listeners of the
+        L{GraphStructure} are notified about the replayed mutations, except
+        for this log itself.
+
+        @type gs: L{GraphStructure}
+        @param gs: L{GraphStructure} object to apply the records to
+        @rtype: Integer
+        @return: Number of records applied
+        """
+        registered = self in gs.listeners
+        gs.remove_listener(self)
+        count = self.replay_file(gs, self.old_file)
+        count += self.replay_file(gs, self.wal_file)
+        if registered:
+            gs.add_listener(self)
+        return count
+
+    def replay_file(self, gs, filename):
+        """
+        Applies every complete record in the file to the L{GraphStructure}
+        object. Replay stops at the first torn or corrupted record, which
+        can only be left behind by a crash in the middle of an append, and
+        the file is cut back to the last good record.
+
+        @type gs: L{GraphStructure}
+        @param gs: L{GraphStructure} object to apply the records to
+        @type filename: String
+        @param filename: Log file to replay
+        @rtype: Integer
+        @return: Number of records applied
+        """
+        if not os.path.isfile(filename):
+            return 0
+        f = open(filename, 'rb')
+        buf = f.read()
+        f.close()
+
+        offset = 0
+        count = 0
+        while offset + HEADER_SIZE <= len(buf):
+            op = ord(buf[offset])
+            length, checksum = unpack_from('Ii', buf, offset + 1)
+            start = offset + HEADER_SIZE
+            payload = buf[start:start + length]
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                break
+            self.apply(gs, op, payload)
+            offset = start + length
+            count += 1
+
+        if offset != len(buf):
+            f = open(filename, 'r+b')
+            f.truncate(offset)
+            f.close()
+        return count
+
+    def apply(self, gs, op, payload):
+        """
+        Applies a single record directly to the graph of the
+        L{GraphStructure} object and notifies its listeners.
+
+        @type gs: L{GraphStructure}
+        @param gs: L{GraphStructure} object to apply the record to
+        @type op: Integer
+        @param op: Type of the record
+        @type payload: String
+        @param payload: Encoded body of the record
+        """
+        g = gs.get_graph()
+        if op == OP_PUT_NODE:
+            node_id = read_int(payload[:4])
+            attrs = read_attrs(payload, 4)[0]
+            if g.has_node(node_id):
+                old_attrs = g.node[node_id]
+                g.node[node_id] = attrs
+                gs.notify('node_changed', node_id, old_attrs, attrs)
+            else:
+                g.add_node(node_id, attrs)
+                gs.notify('node_added', node_id, attrs)
+            if node_id > gs.get_id():
+                gs.set_id(node_id)
+        elif op == OP_REMOVE_NODE:
+            node_id = read_int(payload[:4])
+            if g.has_node(node_id):
+                attrs = g.node[node_id]
+                edges = g.out_edges(node_id, data=True)
+                edges += [edge for edge in g.in_edges(node_id, data=True)
+                    if edge[0] != edge[1]]
+                g.remove_node(node_id)
+                gs.notify('node_removed', node_id, attrs, edges)
+        elif op == OP_PUT_EDGE:
+            node1_id, node2_id = unpack_from('ii', payload, 0)
+            attrs = read_attrs(payload, 8)[0]
+            if g.has_edge(node1_id, node2_id):
+                old_attrs = g.succ[node1_id][node2_id]
+                g.succ[node1_id][node2_id] = attrs
+                g.pred[node2_id][node1_id] = attrs
+                gs.notify('edge_changed', node1_id, node2_id, old_attrs, 
+                    attrs)
+            else:
+                g.add_edge(node1_id, node2_id, attrs)
+                gs.notify('edge_added', node1_id, node2_id, 
+                    g.succ[node1_id][node2_id])
+        elif op == OP_REMOVE_EDGE:
+            node1_id, node2_id = unpack_from('ii', payload, 0)
+            if g.has_edge(node1_id, node2_id):
+                attrs = g.succ[node1_id][node2_id]
+                g.remove_edge(node1_id, node2_id)
+                gs.notify('edge_removed', node1_id, node2_id, attrs)
+        elif op == OP_CLEAR:
+            gs.clear_all()
+            gs.notify('graph_cleared')
+
+    def log_node(self, node_id, attrs):
+        """
+        Logs the complete attributes of a node that was added or changed.
+        """
+        payload = StringIO()
+        write_int(payload, node_id)
+        write_attrs(payload, attrs)
+        self.append(OP_PUT_NODE, payload.getvalue())
+
+    def log_edge(self, node1_id, node2_id, attrs):
+        """
+        Logs the complete attributes of an edge that was added or changed.
+        """
+        payload = StringIO()
+        write_int(payload, node1_id)
+        write_int(payload, node2_id)
+        write_attrs(payload, attrs)
+        self.append(OP_PUT_EDGE, payload.getvalue())
+
+    # Listener methods called by the GraphStructure on every mutation.
+
+    def node_added(self, node_id, attrs):
+        self.log_node(node_id, attrs)
+
+    def node_changed(self, node_id, old_attrs, attrs):
+        self.log_node(node_id, attrs)
+
+    def node_removed(self, node_id, attrs, edges):
+        payload = StringIO()
+        write_int(payload, node_id)
+        self.append(OP_REMOVE_NODE, payload.getvalue())
+
+    def edge_added(self, node1_id, node2_id, attrs):
+        self.log_edge(node1_id, node2_id, attrs)
+
+    def edge_changed(self, node1_id, node2_id, old_attrs, attrs):
+        self.log_edge(node1_id, node2_id, attrs)
+
+    def edge_removed(self, node1_id, node2_id, attrs):
+        payload = StringIO()
+        write_int(payload, node1_id)
+        write_int(payload, node2_id)
+        self.append(OP_REMOVE_EDGE, payload.getvalue())
+
+    def graph_cleared(self):
+        self.append(OP_CLEAR, '')